@@ -0,0 +1,66 @@
+'''
+Durable journal appends/sec with concurrent confirmations: one fsync per block
+against ``GroupCommit`` with several intervals, plus fsyncs issued and their latency.
+
+    python benchmarks/bench_durable.py [blocks] [writers]
+'''
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import timeit
+import tempfile
+import threading
+
+from tbk.webpay.logging.durable import GroupCommit
+
+BLOCK = b"ACK; TBK_ORDEN_COMPRA=3244; TBK_CODIGO_COMERCIO=597026007976; TBK_RESPUESTA=0; TBK_MONTO=10000\n"
+
+
+def run(write, writers, quantity):
+    per_writer = quantity // writers
+
+    def work():
+        for _ in range(per_writer):
+            write()
+
+    threads = [threading.Thread(target=work) for _ in range(writers)]
+    started = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_writer * writers / (timeit.default_timer() - started)
+
+
+def main(quantity=2000, writers=32):
+    path = tempfile.mkdtemp()
+    file_path = os.path.join(path, 'tbk_bitacora_TR_NORMAL_0123.log')
+    try:
+        lock = threading.Lock()
+        fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        def fsync_each():
+            with lock:
+                os.write(fd, BLOCK)
+                os.fsync(fd)
+
+        rate = run(fsync_each, writers, quantity)
+        os.close(fd)
+        print("%-22s %10.0f blocks/s %8d fsyncs" % ('fsync per block', rate, quantity))
+
+        for interval in (0.001, 0.005, 0.02):
+            group_commit = GroupCommit(interval=interval, batch_size=writers)
+            rate = run(lambda: group_commit.wait(group_commit.submit(file_path, BLOCK)), writers, quantity)
+            group_commit.close()
+            stats = group_commit.stats()
+            print("%-22s %10.0f blocks/s %8d fsyncs  p50 %.2f ms  max %.2f ms" % (
+                'group commit %gms' % (interval * 1000), rate, stats['fsyncs'],
+                stats['fsync_p50'] * 1000, stats['fsync_max'] * 1000))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,52 @@
+'''
+Random calls per second for a payment's session key (32 bytes), IV (16 bytes)
+and transaction id, with a ``Crypto.Random`` object per call as before and with
+the buffered :mod:`tbk.webpay.entropy`, from one thread and from ``threads``.
+
+    PYTHONPATH=. python benchmarks/bench_entropy.py [calls] [threads]
+'''
+from __future__ import print_function
+
+import sys
+import timeit
+import threading
+
+from Crypto import Random
+from Crypto.Random import random
+
+from tbk.webpay import entropy
+
+CASES = (
+    ('key', lambda: Random.new().read(32), lambda: entropy.read(32)),
+    ('iv', lambda: Random.new().read(16), lambda: entropy.read(16)),
+    ('transaction id', lambda: random.randint(0, 10000000000 - 1), lambda: entropy.randint(0, 10000000000 - 1)),
+)
+
+
+def rate(func, calls, threads):
+    per_thread = calls // threads
+
+    def work():
+        for _ in range(per_thread):
+            func()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = timeit.default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (timeit.default_timer() - start)
+
+
+def main(calls=100000, threads=8):
+    for name, crypto, buffered in CASES:
+        for count in (1, threads):
+            before = rate(crypto, calls, count)
+            after = rate(buffered, calls, count)
+            print("%-15s %d threads  Crypto.Random %10.0f calls/s  entropy %10.0f calls/s" % (
+                name, count, before, after))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,44 @@
+'''
+Throughput of webpay_encrypt from concurrent threads, inline and through a CryptoExecutor.
+
+    python benchmarks/bench_executor.py [messages] [threads]
+'''
+from __future__ import print_function
+
+import sys
+import timeit
+import threading
+import multiprocessing
+
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.executor import CryptoExecutor
+
+
+def run(target, messages, threads):
+    per_thread = messages // threads
+
+    def work():
+        for _ in range(per_thread):
+            target('ACK')
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = timeit.default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (timeit.default_timer() - start)
+
+
+def main(messages=400, threads=multiprocessing.cpu_count()):
+    commerce = Commerce(testing=True)
+    commerce.webpay_encrypt('ACK')
+    print("inline   %8.1f msg/s" % run(commerce.webpay_encrypt, messages, threads))
+    with CryptoExecutor(commerce) as executor:
+        executor.webpay_encrypt('ACK')
+        print("executor %8.1f msg/s (%d processes)" % (
+            run(executor.webpay_encrypt, messages, threads), executor.processes))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,69 @@
+'''
+Import time of the modules a worker loads on startup, measured with
+``python -X importtime`` in fresh interpreters (best of ``runs``). Exits with
+status 1 when a module goes over its budget, so it can run in CI to catch
+a heavy dependency (``requests``, ``pytz``, ``Crypto``) imported eagerly again.
+
+Needs Python 3.7 or later for ``-X importtime``.
+
+    PYTHONPATH=. python benchmarks/bench_import.py [runs]
+'''
+from __future__ import print_function
+
+import re
+import sys
+import subprocess
+
+# Cumulative milliseconds, about twice what the lazy imports take.
+BUDGETS = (
+    ('tbk.webpay.confirmation', 30),
+    ('tbk.webpay.commerce', 30),
+    ('tbk.webpay.payment', 50),
+    ('tbk.webpay.logging.official', 30),
+    ('tbk.webpay.logging.queued', 30),
+    ('tbk.webpay.aio', 150),
+)
+
+# Loaded on first use only, reported when an import pulls them in.
+HEAVY_MODULES = ('requests', 'pytz', 'Crypto')
+
+LINE_RE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def import_time(module):
+    '''
+    Returns the cumulative import time of ``module`` in milliseconds and the heavy
+    modules it imported.
+    '''
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    elapsed, heavy = None, set()
+    for line in output.splitlines():
+        match = LINE_RE.match(line)
+        if match is None:
+            continue
+        name = match.group(3)
+        if name == module and not match.group(2):
+            elapsed = int(match.group(1)) / 1000.0
+        elif name.split('.')[0] in HEAVY_MODULES:
+            heavy.add(name.split('.')[0])
+    return elapsed, heavy
+
+
+def main(runs=5):
+    failed = False
+    for module, budget in BUDGETS:
+        results = [import_time(module) for _ in range(runs)]
+        elapsed = min(result[0] for result in results)
+        heavy = set().union(*[result[1] for result in results])
+        over = elapsed > budget
+        failed = failed or over
+        print("%-30s %7.1f ms  budget %3d ms  %s%s" % (
+            module, elapsed, budget, 'OVER' if over else 'ok',
+            '  imports %s' % ', '.join(sorted(heavy)) if heavy else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:2]]))
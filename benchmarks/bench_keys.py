@@ -0,0 +1,36 @@
+'''
+Cold and warm cost of Commerce key access.
+
+Cold: a fresh Commerce for every call, so PEM keys are parsed each time.
+Warm: the same Commerce, so parsed keys come from its cache.
+
+    python benchmarks/bench_keys.py [iterations]
+'''
+from __future__ import print_function
+
+import sys
+import timeit
+
+from tbk.webpay.commerce import Commerce
+
+
+def cold():
+    commerce = Commerce(testing=True)
+    commerce.get_commerce_key()
+    commerce.get_webpay_key()
+
+
+def main(iterations=200):
+    commerce = Commerce(testing=True)
+
+    def warm():
+        commerce.get_commerce_key()
+        commerce.get_webpay_key()
+
+    for name, func in (('cold', cold), ('warm', warm)):
+        elapsed = min(timeit.repeat(func, number=iterations, repeat=3))
+        print("%-5s %10.2f us/call" % (name, elapsed / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,76 @@
+'''
+Events/sec written by ``WebpayOfficialHandler`` with 1, 8 and 64 concurrent writer
+threads, compared with the former open/append/close per event.
+
+    python benchmarks/bench_official.py [events]
+'''
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import timeit
+import tempfile
+import threading
+
+from tbk.webpay.clock import clock
+from tbk.webpay.logging.official import (
+    WebpayOfficialHandler, event_payment_format, EVENTS_LOG_FILE_NAME_FORMAT, EVENTS_LOG_FILE_DATE_FORMAT)
+
+EVENT = {
+    'date': '23012015',
+    'time': '150959',
+    'pid': 12345,
+    'commerce_id': '597026007976',
+    'transaction_id': 123456789,
+    'request_ip': '123.123.123.123',
+    'token': 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228',
+    'webpay_server': 'https://certificacion.webpay.cl',
+}
+
+
+class LegacyHandler(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def event_payment(self, **kwargs):
+        file_name = EVENTS_LOG_FILE_NAME_FORMAT % clock.strftime(EVENTS_LOG_FILE_DATE_FORMAT)
+        with open(os.path.join(self.path, file_name), 'a+') as log_file:
+            log_file.write(event_payment_format(**kwargs))
+
+    def close(self):
+        pass
+
+
+def run(handler, writers, quantity):
+    per_writer = quantity // writers
+
+    def write():
+        for _ in range(per_writer):
+            handler.event_payment(**EVENT)
+
+    threads = [threading.Thread(target=write) for _ in range(writers)]
+    started = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_writer * writers / (timeit.default_timer() - started)
+
+
+def main(quantity=20000):
+    for name, handler_class in (('open-per-event', LegacyHandler), ('persistent', WebpayOfficialHandler)):
+        for writers in (1, 8, 64):
+            path = tempfile.mkdtemp()
+            handler = handler_class(path)
+            try:
+                rate = run(handler, writers, quantity)
+            finally:
+                handler.close()
+                shutil.rmtree(path)
+            print("%-15s %3d writers %10.0f events/s" % (name, writers, rate))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,71 @@
+'''
+Per-payment cost of building raw TBK_PARAM: the former two-pass builder
+(recursive ``&`` serialization, ``urlparse`` on every call), ``get_raw_params``
+and a shared ``RawParamsBuilder.build_many`` batch.
+
+    python benchmarks/bench_params.py [payments]
+'''
+from __future__ import print_function
+
+import sys
+import timeit
+import hashlib
+
+import six
+
+from tbk.webpay import TBK_VERSION_KCC
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.payment import Payment, RawParamsBuilder
+
+
+def legacy_raw_params(payment, splitter="#", include_pseudomac=True):
+    params = []
+    params += ["TBK_ORDEN_COMPRA=%s" % payment.order_id]
+    params += ["TBK_CODIGO_COMERCIO=%s" % payment.commerce.id]
+    params += ["TBK_ID_TRANSACCION=%s" % payment.transaction_id]
+    uri = six.moves.urllib.parse.urlparse(payment.confirmation_url)
+    params += ["TBK_URL_CGI_COMERCIO=%s" % uri.path]
+    params += ["TBK_SERVIDOR_COMERCIO=%s" % uri.hostname]
+    params += ["TBK_PUERTO_COMERCIO=%s" % uri.port]
+    params += ["TBK_VERSION_KCC=%s" % TBK_VERSION_KCC]
+    params += ["TBK_KEY_ID=%s" % payment.commerce.webpay_key_id]
+    params += ["PARAMVERIFCOM=1"]
+    if include_pseudomac:
+        h = hashlib.new('md5')
+        h.update(legacy_raw_params(payment, '&', False))
+        h.update(str(payment.commerce.id).encode('utf-8'))
+        h.update(b"webpay")
+        params += ["TBK_MAC=%s" % h.hexdigest()]
+    params += ["TBK_MONTO=%d" % int(payment.amount * 100)]
+    if payment.session_id:
+        params += ["TBK_ID_SESION=%s" % payment.session_id]
+    params += ["TBK_URL_EXITO=%s" % payment.success_url]
+    params += ["TBK_URL_FRACASO=%s" % payment.failure_url]
+    params += ["TBK_TIPO_TRANSACCION=TR_NORMAL"]
+    return splitter.join(params).encode('utf-8')
+
+
+def main(quantity=10000):
+    commerce = Commerce(testing=True)
+    payments = [
+        Payment(request_ip='127.0.0.1', commerce=commerce, amount=1000 + i, order_id=str(i),
+                success_url='http://localhost:8080/webpay/success/',
+                confirmation_url='http://127.0.0.1:8080/webpay/confirmation/',
+                session_id='SESSION')
+        for i in range(quantity)
+    ]
+    builder = RawParamsBuilder(commerce)
+    assert [legacy_raw_params(payment) for payment in payments[:10]] == builder.build_many(payments[:10])
+
+    cases = (
+        ('legacy', lambda: [legacy_raw_params(payment) for payment in payments]),
+        ('get_raw_params', lambda: [payment.get_raw_params() for payment in payments]),
+        ('build_many', lambda: builder.build_many(payments)),
+    )
+    for name, func in cases:
+        elapsed = min(timeit.repeat(func, number=1, repeat=3))
+        print("%-15s %8.2f us/payment" % (name, elapsed / quantity * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
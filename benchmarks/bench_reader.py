@@ -0,0 +1,81 @@
+'''
+Indexing and lookup cost of ``LogReader`` on generated official logs: first full
+index, incremental update after appending, indexed lookup and a linear scan lookup.
+
+    python benchmarks/bench_reader.py [transactions]
+'''
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import timeit
+import tempfile
+
+from tbk.webpay.clock import clock
+from tbk.webpay.confirmation import ConfirmationPayload
+from tbk.webpay.logging.official import WebpayOfficialHandler
+from tbk.webpay.logging.reader import LogReader, scan
+
+# 2015-01-23 15:09:59 at America/Santiago
+TIMESTAMP = 1422036599
+
+
+def write_transactions(handler, start, quantity):
+    for transaction_id in range(start, start + quantity):
+        handler.event_payment(
+            date='23012015', time='150959', pid=12345, commerce_id='597026007976', transaction_id=transaction_id,
+            request_ip='123.123.123.123', token='%064x' % transaction_id, webpay_server='https://certificacion.webpay.cl')
+        handler.event_confirmation(
+            date='23012015', time='151010', pid=12346, commerce_id='597026007976', transaction_id=transaction_id,
+            request_ip='200.10.14.162', order_id=str(transaction_id))
+        handler.log_confirmation(payload=ConfirmationPayload({
+            'TBK_ORDEN_COMPRA': str(transaction_id), 'TBK_TIPO_TRANSACCION': 'TR_NORMAL', 'TBK_RESPUESTA': '0',
+            'TBK_MONTO': '1000000', 'TBK_CODIGO_AUTORIZACION': '001882', 'TBK_FINAL_NUMERO_TARJETA': '9509',
+            'TBK_FECHA_CONTABLE': '0123', 'TBK_FECHA_TRANSACCION': '0123', 'TBK_HORA_TRANSACCION': '150959',
+            'TBK_ID_SESION': 'SESSION', 'TBK_ID_TRANSACCION': str(transaction_id), 'TBK_TIPO_PAGO': 'VD',
+            'TBK_NUMERO_CUOTAS': '0', 'TBK_VCI': 'TSY', 'TBK_MAC': 'signature',
+        }), commerce_id='597026007976')
+
+
+def main(quantity=20000):
+    path = tempfile.mkdtemp()
+    clock.set_backend(time_func=lambda: TIMESTAMP)
+    handler = WebpayOfficialHandler(path)
+    try:
+        write_transactions(handler, 0, quantity)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print("logs: %d transactions, %.1f MB" % (quantity, size / 1e6))
+
+        reader = LogReader(path)
+        started = timeit.default_timer()
+        indexed = reader.update()
+        print("full index      %8.2f s  (%d entries)" % (timeit.default_timer() - started, indexed))
+
+        write_transactions(handler, quantity, 100)
+        started = timeit.default_timer()
+        indexed = reader.update()
+        print("incremental     %8.2f ms (%d entries)" % ((timeit.default_timer() - started) * 1000, indexed))
+
+        target = quantity // 2
+        elapsed = min(timeit.repeat(lambda: reader.find(transaction_id=target), number=10, repeat=3)) / 10
+        print("indexed find    %8.2f ms" % (elapsed * 1000))
+
+        def linear_find():
+            return [
+                entry for name in reader.log_files()
+                for entry in scan(os.path.join(path, name))
+                if entry[3].get('transaction_id', entry[3].get('TBK_ID_TRANSACCION')) == str(target)
+            ]
+        started = timeit.default_timer()
+        linear_find()
+        print("linear scan     %8.2f ms" % ((timeit.default_timer() - started) * 1000))
+        reader.close()
+    finally:
+        handler.close()
+        clock.set_backend()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,54 @@
+'''
+Reconciliation time of a generated journal parsed in the calling process and on a
+pool of processes.
+
+    python benchmarks/bench_reconcile.py [orders] [processes]
+'''
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import timeit
+import tempfile
+import multiprocessing
+
+from tbk.webpay.logging.official import log_confirmation_format
+from tbk.webpay.logging.reconcile import Reconciliation
+
+JOURNAL_DATA = {
+    'commerce_id': '597026007976', 'TBK_CODIGO_AUTORIZACION': '001882', 'TBK_FECHA_CONTABLE': '0123',
+    'TBK_FECHA_TRANSACCION': '0123', 'TBK_FINAL_NUMERO_TARJETA': '9509', 'TBK_HORA_TRANSACCION': '150959',
+    'TBK_ID_SESION': 'SESSION', 'TBK_ID_TRANSACCION': '2164532727', 'TBK_NUMERO_CUOTAS': '0',
+    'TBK_RESPUESTA': '0', 'TBK_TIPO_PAGO': 'VD', 'TBK_TIPO_TRANSACCION': 'TR_NORMAL', 'TBK_VCI': 'TSY',
+    'TBK_MAC': 'signature',
+}
+
+
+def main(quantity=500000, processes=None):
+    processes = processes or multiprocessing.cpu_count()
+    path = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(path, 'tbk_bitacora_TR_NORMAL_0123.log')
+        with open(file_path, 'w') as journal:
+            for order_id in range(quantity):
+                journal.write(log_confirmation_format(**dict(
+                    JOURNAL_DATA, TBK_ORDEN_COMPRA=order_id, TBK_MONTO=(1000 + order_id % 1000) * 100)))
+        print("journal: %d orders, %.1f MB" % (quantity, os.path.getsize(file_path) / 1e6))
+
+        def expected():
+            return ((str(order_id), 1000 + order_id % 1000) for order_id in range(quantity))
+
+        for workers in sorted(set((1, processes))):
+            reconciliation = Reconciliation([file_path], processes=workers, chunk_size=4 * 1024 * 1024)
+            started = timeit.default_timer()
+            report = reconciliation.run(expected())
+            elapsed = timeit.default_timer() - started
+            assert report.matched == quantity
+            print("%2d processes %8.2f s %10.0f orders/s" % (workers, elapsed, quantity / elapsed))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,102 @@
+'''
+Requests per second and p99 latency of token-like POSTs against a local HTTPS
+stand-in for bp_validacion.cgi, without pooling (``requests.post``) and with
+a pooled session from :func:`tbk.webpay.session.create_session`.
+
+Needs the ``openssl`` command to create a throwaway certificate.
+
+    python benchmarks/bench_session.py [requests] [threads]
+'''
+from __future__ import print_function
+
+import os
+import ssl
+import sys
+import shutil
+import timeit
+import tempfile
+import threading
+import subprocess
+
+import requests
+import urllib3
+from six.moves import BaseHTTPServer, socketserver
+
+from tbk.webpay.session import create_session
+
+BODY = b'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def start_server(directory):
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.check_call([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', cert
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = Server(('127.0.0.1', 0), Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def run(post, url, total, threads):
+    latencies = []
+    per_thread = total // threads
+
+    def work():
+        for _ in range(per_thread):
+            start = timeit.default_timer()
+            post(url, data={'TBK_PARAM': 'x' * 1024}, verify=False).content
+            latencies.append(timeit.default_timer() - start)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = timeit.default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = timeit.default_timer() - start
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main(total=500, threads=8):
+    urllib3.disable_warnings()
+    directory = tempfile.mkdtemp()
+    server = start_server(directory)
+    url = 'https://127.0.0.1:%d/filtroUnificado/bp_validacion.cgi' % server.server_address[1]
+    try:
+        session = create_session(pool_size=threads)
+        for name, post in (('no pooling', requests.post), ('pooled', session.post)):
+            rate, p99 = run(post, url, total, threads)
+            print("%-10s %8.1f req/s  p99 %7.2f ms" % (name, rate, p99 * 1000))
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,55 @@
+'''
+Sustained inserts/sec of ``SQLiteHandler`` and indexed query latency once the events
+table holds ``rows`` rows, e.g. 10M with ``python benchmarks/bench_sqlite.py 10000000``.
+
+    python benchmarks/bench_sqlite.py [rows] [batch_size]
+'''
+from __future__ import print_function
+
+import os
+import sys
+import random
+import shutil
+import timeit
+import datetime
+import tempfile
+
+from tbk.webpay.logging.sqlite import SQLiteHandler
+
+START = datetime.date(2015, 1, 1)
+
+
+def main(rows=200000, batch_size=1000):
+    path = tempfile.mkdtemp()
+    handler = SQLiteHandler(os.path.join(path, 'webpay.sqlite3'), batch_size=batch_size)
+    try:
+        checkpoint = max(rows // 10, 1)
+        started = last = timeit.default_timer()
+        for i in range(rows):
+            handler.event_confirmation(
+                date=(START + datetime.timedelta(days=i % 365)).strftime('%d%m%Y'), time='150959', pid=12345,
+                commerce_id='597026007976', transaction_id=i, request_ip='200.10.14.162', order_id=str(i))
+            if (i + 1) % checkpoint == 0:
+                now = timeit.default_timer()
+                print("%10d rows %10.0f inserts/s" % (i + 1, checkpoint / (now - last)))
+                last = now
+        handler.flush()
+        elapsed = timeit.default_timer() - started
+        print("sustained  %10.0f inserts/s in %d transactions" % (rows / elapsed, handler.transactions))
+
+        queries = (
+            ('transaction_id', lambda: handler.find_events(transaction_id=random.randrange(rows))),
+            ('order_id', lambda: handler.find_events(order_id=random.randrange(rows))),
+            ('date+order_id', lambda: handler.find_events(
+                order_id=random.randrange(rows), date=START + datetime.timedelta(days=random.randrange(365)))),
+        )
+        for name, query in queries:
+            elapsed = min(timeit.repeat(query, number=100, repeat=3)) / 100
+            print("find by %-15s %8.3f ms" % (name, elapsed * 1000))
+    finally:
+        handler.close()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,61 @@
+'''
+Latency of the first confirmation answer (an encrypted **ACK**) in forked workers,
+forking from a cold master and from one that called
+:meth:`tbk.webpay.commerce.Commerce.warmup`, compared with the average of the
+following ``calls``.
+
+    PYTHONPATH=. python benchmarks/bench_warmup.py [workers] [calls]
+'''
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.clock import clock
+from tbk.webpay import fork
+
+
+def work(commerce, calls):
+    start = timeit.default_timer()
+    clock.strftime('%d%m%Y')
+    commerce.acknowledge
+    first = timeit.default_timer() - start
+    start = timeit.default_timer()
+    for _ in range(calls):
+        clock.strftime('%d%m%Y')
+        commerce.acknowledge
+    return first, (timeit.default_timer() - start) / calls
+
+
+def run(commerce, workers, calls):
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_fd, ('%r %r' % work(commerce, calls)).encode('ascii'))
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        output = os.read(read_fd, 128)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        results.append([float(value) for value in output.split()])
+    return (sum(first for first, _ in results) / workers, sum(later for _, later in results) / workers)
+
+
+def main(workers=4, calls=100):
+    commerce = Commerce(testing=True)
+    for name in ('cold', 'warm'):
+        if name == 'warm':
+            commerce.warmup()
+            fork.before_fork()
+        first, later = run(commerce, workers, calls)
+        print("%-5s first %8.2f ms  later %6.2f ms" % (name, first * 1000, later * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
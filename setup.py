@@ -46,6 +46,9 @@ setup(
         'PyCrypto>=2.6.1',
         'pytz',
     ],
+    extras_require={
+        'aio': ['aiohttp'],
+    },
     tests_require=[
         'mock>=1.0.1',
         'nose>=1.3.3',
@@ -0,0 +1,124 @@
+'''
+asyncio counterparts of :attr:`Payment.token <tbk.webpay.payment.Payment.token>` and
+:class:`~tbk.webpay.confirmation.Confirmation` (Python 3.5+).
+
+HTTP is made with `aiohttp <https://docs.aiohttp.org>`_ and RSA work runs in an
+executor, so the event loop is never blocked.
+'''
+import timeit
+import asyncio
+import functools
+
+from .payment import PaymentError, USER_AGENT
+from .policy import DEFAULT_FETCH_POLICY
+from .confirmation import Confirmation
+from .logging import logger
+from . import CONFIRMATION_TIMEOUT
+
+__all__ = ['fetch_token', 'token', 'create_confirmation']
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Python 3.5 and 3.6 only have get_event_loop, which returns the running loop in a coroutine.
+get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def create_client_session(**kwargs):
+    try:
+        import aiohttp
+    except ImportError:  # pragma: no cover
+        raise ImportError("tbk.webpay.aio needs aiohttp, install it with: pip install tbk[aio]")
+    return aiohttp.ClientSession(**kwargs)
+
+
+def client_errors():
+    '''
+    Connection errors of ``aiohttp``, raised as :class:`~tbk.webpay.payment.PaymentError`.
+    '''
+    try:
+        import aiohttp
+    except ImportError:  # pragma: no cover
+        return ()
+    return (aiohttp.ClientError,)
+
+
+async def fetch_token(payment, session=None, executor=None):
+    '''
+    Awaitable version of :meth:`Payment.fetch_token <tbk.webpay.payment.Payment.fetch_token>`.
+
+    Redirect hops, request timeouts and the latency budget come from ``payment.fetch_policy``,
+    failed requests are not retried. Timeouts and connection errors raise
+    :class:`~tbk.webpay.payment.PaymentError`, like the blocking version.
+
+    :param payment: :class:`~tbk.webpay.payment.Payment` instance.
+    :param session: ``aiohttp.ClientSession`` shared by the application. When not given a
+        session is created and closed on every call, so connections are never reused.
+    :param executor: ``concurrent.futures.Executor`` for RSA work, loop default when not given.
+    '''
+    policy = payment.fetch_policy or DEFAULT_FETCH_POLICY
+    loop = get_running_loop()
+    data = await loop.run_in_executor(executor, payment.get_token_data)
+    deadline = timeit.default_timer() + policy.budget
+    close_session = session is None
+    if close_session:
+        session = create_client_session()
+
+    try:
+        status, content = await _follow_redirects(session, payment.get_validation_url(), data, policy, deadline)
+    finally:
+        if close_session:
+            await session.close()
+
+    if status != 200:
+        raise PaymentError("Payment token generation failed")
+
+    return await loop.run_in_executor(executor, payment.get_token_from_content, content)
+
+
+async def _follow_redirects(session, url, data, policy, deadline):
+    for _ in range(policy.max_redirects + 1):
+        remaining = deadline - timeit.default_timer()
+        if remaining <= 0:
+            raise PaymentError("Payment token generation failed, latency budget exhausted")
+        connect_timeout, read_timeout = policy.get_timeout(remaining)
+        try:
+            status, location, content = await asyncio.wait_for(
+                _post(session, url, data), min(connect_timeout + read_timeout, remaining))
+        except asyncio.TimeoutError:
+            raise PaymentError("Payment token generation failed: timeout")
+        except client_errors() as e:
+            raise PaymentError("Payment token generation failed: %s" % e)
+        if status not in REDIRECT_STATUSES or not location:
+            return status, content
+        url = location
+
+    raise PaymentError("Payment token generation failed, too many redirects")
+
+
+async def _post(session, url, data):
+    async with session.post(url, data=data, headers={'User-Agent': USER_AGENT},
+                            allow_redirects=False) as response:
+        return response.status, response.headers.get('location'), await response.read()
+
+
+async def token(payment, session=None, executor=None):
+    '''
+    Awaitable version of :attr:`Payment.token <tbk.webpay.payment.Payment.token>`, fetch the token
+    only once and log the payment.
+    '''
+    if not payment._token:
+        payment._token = await fetch_token(payment, session=session, executor=executor)
+        logger.payment(payment)
+    return payment._token
+
+
+async def create_confirmation(commerce, request_ip, data, timeout=CONFIRMATION_TIMEOUT, executor=None, dedup=None):
+    '''
+    Create a :class:`~tbk.webpay.confirmation.Confirmation` decrypting ``TBK_PARAM`` in ``executor``.
+
+    :param executor: ``concurrent.futures.Executor``, loop default when not given.
+    :param dedup: :class:`~tbk.webpay.dedup.DedupStore` passed to the confirmation.
+    '''
+    loop = get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(Confirmation, commerce, request_ip, data, timeout=timeout, dedup=dedup))
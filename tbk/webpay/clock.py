@@ -0,0 +1,85 @@
+import time
+import datetime
+
+from .lazy import lazy_import
+
+pytz = lazy_import('pytz')
+
+__all__ = ['Clock', 'clock']
+
+
+TIMEZONE = 'America/Santiago'
+
+
+class Clock(object):
+    '''
+    America/Santiago clock shared by logging and confirmations.
+
+    The timezone is loaded once, ``strftime`` strings are cached for the current second
+    and elapsed time is measured with a monotonic clock, immune to wall-clock jumps.
+
+    :param time_func: Function returning seconds since epoch, ``time.time`` by default.
+    :param monotonic_func: Function returning monotonic seconds, ``time.monotonic`` when available.
+    :param timezone: Timezone name.
+    '''
+
+    def __init__(self, time_func=None, monotonic_func=None, timezone=TIMEZONE):
+        self.timezone = timezone
+        self._tz = None
+        self.set_backend(time_func, monotonic_func)
+
+    def set_backend(self, time_func=None, monotonic_func=None):
+        '''
+        Replace the wall clock and monotonic functions, e.g. in tests. ``None`` restores defaults.
+        '''
+        self.time = time_func or time.time
+        self.monotonic = monotonic_func or getattr(time, 'monotonic', time.time)
+        self._now = (None, None)
+        self._strings = {}
+
+    @property
+    def tz(self):
+        if self._tz is None:
+            self._tz = pytz.timezone(self.timezone)
+        return self._tz
+
+    def now(self):
+        '''
+        Current localized datetime.
+        '''
+        return datetime.datetime.fromtimestamp(self.time(), self.tz)
+
+    def strftime(self, format):
+        '''
+        Current time formatted with ``format``, computed at most once per second.
+        '''
+        return self._format(int(self.time()), format)
+
+    def strftimes(self, *formats):
+        '''
+        Tuple of the current time formatted with each of ``formats``, all from the same
+        reading of the clock so e.g. a date and a time are never from different days.
+        '''
+        second = int(self.time())
+        return tuple(self._format(second, format) for format in formats)
+
+    def _format(self, second, format):
+        cached = self._strings.get(format)
+        if cached is not None and cached[0] == second:
+            return cached[1]
+        cached_second, now = self._now
+        if cached_second != second:
+            now = datetime.datetime.fromtimestamp(second, self.tz)
+            self._now = (second, now)
+        value = now.strftime(format)
+        self._strings[format] = (second, value)
+        return value
+
+    def localize(self, *args):
+        '''
+        Localized datetime built with ``datetime.datetime(*args)``.
+        '''
+        return self.tz.localize(datetime.datetime(*args))
+
+
+clock = Clock()
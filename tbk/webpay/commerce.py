@@ -1,9 +1,16 @@
 import os
+import threading
 
 import six
-from Crypto.PublicKey import RSA
 
-from .encryption import Encryption, Decryption, DecryptionError
+from .lazy import lazy_import, load_all
+from .clock import clock
+from .session import get_default_session
+from . import fork
+from .encryption import Encryption, Decryption, DecryptionError, InvalidMessageException
+from .responses import ResponsePool
+
+RSA = lazy_import('Crypto.PublicKey.RSA')
 
 
 __all__ = ['Commerce', 'DecryptionError']
@@ -83,16 +90,37 @@ class Commerce(object):
     :param commerce_id: Commerce ID
     :param key: Commerce private RSA key
     :param testing: If ``True`` will use certification URLs and keys.
+    :param key_source: :class:`~tbk.webpay.keys.KeySource` providing ``key``. On rotation the
+        crypto engines and the crypto executor workers are rebuilt and the response pool
+        cleared, and during the grace period decryption failures are retried with the
+        previous key.
+
+    ``http_session`` may be set to a session from :func:`tbk.webpay.session.create_session`
+    to share its connection pool between payments of this commerce.
     '''
     TEST_COMMERCE_KEY = TEST_COMMERCE_KEY
     TEST_COMMERCE_ID = "597026007976"
 
     webpay_key_id = 101
 
-    def __init__(self, id=None, key=None, testing=False):
+    def __init__(self, id=None, key=None, testing=False, key_source=None):
         self.testing = testing
         self.id = self.__get_id(id)
-        self.key = self.__get_key(key)
+        self.key_source = key_source
+        self.key = self.__get_key(key_source.pem if key_source is not None else key)
+        self._keys_lock = threading.Lock()
+        self._commerce_key = None
+        self._webpay_key = None
+        self._encryption = None
+        self._decryption = None
+        self._previous_decryption = None
+        self.key_version = 0
+        self.response_pool = None
+        self.crypto_executor = None
+        self.http_session = None
+        if key_source is not None:
+            key_source.add_listener(self.__key_rotated)
+        fork.track(self)
 
     @staticmethod
     def create_commerce():
@@ -130,27 +158,148 @@ class Commerce(object):
             raise TypeError("Commerce needs an id")
         return id
 
-    def webpay_decrypt(self, encrypted):
-        commerce_key = self.get_commerce_key()
-        webpay_key = self.get_webpay_key()
-        decryption = Decryption(commerce_key, webpay_key)
+    def warmup(self):
+        '''
+        Does the one-time work of the first payment or confirmation: imports the crypto and
+        HTTP libraries, parses the keys, builds the crypto engines, loads the timezone and
+        creates the HTTP session.
+
+        Call it in the master before forking workers so they all inherit the result,
+        per-process state is re-initialized after the fork by :mod:`tbk.webpay.fork`.
+        '''
+        load_all()
+        self.get_decryption()
+        self.get_encryption().encrypt(b'ACK')
+        clock.now()
+        if self.http_session is None:
+            get_default_session()
+        return self
+
+    def after_fork(self):
+        '''
+        Re-initializes the per-process state of the commerce in a forked child.
+        '''
+        self._keys_lock = threading.Lock()
+        if self.response_pool is not None:
+            self.response_pool.after_fork()
+        after_fork = getattr(self.crypto_executor, 'after_fork', None)
+        if after_fork is not None:
+            after_fork()
+
+    def set_crypto_executor(self, executor):
+        '''
+        Dispatch :meth:`webpay_decrypt` and :meth:`webpay_encrypt` to ``executor``
+        (a :class:`~tbk.webpay.executor.CryptoExecutor`), ``None`` to run them inline.
+        '''
+        self.crypto_executor = executor
+
+    def webpay_decrypt(self, encrypted, executor=None):
+        '''
+        Decrypts a message sent by Webpay, in ``executor`` or ``crypto_executor`` when set.
+        During the grace period of a key rotation failures are retried with the previous key.
+        '''
+        executor = executor or self.crypto_executor
+        if executor is not None:
+            try:
+                return executor.webpay_decrypt(encrypted)
+            except (DecryptionError, InvalidMessageException):
+                if self.key_source is None or self.key_source.previous_key is None:
+                    raise
+                return executor.webpay_decrypt(encrypted, previous=True)
+        decryption = self.get_decryption()
         if not isinstance(encrypted, six.binary_type):
             encrypted = encrypted.encode('utf-8')
-        return decryption.decrypt(encrypted)
+        try:
+            return decryption.decrypt(encrypted)
+        except (DecryptionError, InvalidMessageException):
+            previous = self.get_previous_decryption()
+            if previous is None:
+                raise
+            return previous.decrypt(encrypted)
 
     def webpay_encrypt(self, decrypted):
-        commerce_key = self.get_commerce_key()
-        webpay_key = self.get_webpay_key()
-        encryption = Encryption(commerce_key, webpay_key)
+        if self.crypto_executor is not None:
+            return self.crypto_executor.webpay_encrypt(decrypted)
+        encryption = self.get_encryption()
         if not isinstance(decrypted, six.binary_type):
             decrypted = decrypted.encode('utf-8')
         return encryption.encrypt(decrypted)
 
+    def get_encryption(self):
+        '''
+        Returns the :class:`Encryption` engine for messages sent to Webpay, built once per key pair.
+        '''
+        return self.__get_cached_engine('_encryption', Encryption)
+
+    def get_decryption(self):
+        '''
+        Returns the :class:`Decryption` engine for messages sent by Webpay, built once per key pair.
+        '''
+        return self.__get_cached_engine('_decryption', Decryption)
+
+    def get_previous_decryption(self):
+        '''
+        Returns the :class:`Decryption` engine of the key replaced by ``key_source`` while
+        in its grace period, ``None`` otherwise.
+        '''
+        previous_key = self.key_source.previous_key if self.key_source is not None else None
+        if previous_key is None:
+            return None
+        webpay_key = self.get_webpay_key()
+        cached = self._previous_decryption
+        if cached is None or cached[0] is not previous_key or cached[1] is not webpay_key:
+            cached = (previous_key, webpay_key, Decryption(previous_key, webpay_key))
+            self._previous_decryption = cached
+        return cached[2]
+
+    def __key_rotated(self, key_source):
+        # Runs where the key was parsed, so requests find the new engines built.
+        # ``key_version`` changes once every engine uses the new key, so responses
+        # the pool encrypts with an older version are discarded.
+        self.key = key_source.pem
+        self.get_encryption()
+        self.get_decryption()
+        if self.crypto_executor is not None:
+            self.crypto_executor.set_keys(key_source.pem, key_source.previous_pem)
+        self.key_version += 1
+        if self.response_pool is not None:
+            self.response_pool.clear()
+
+    def __get_cached_engine(self, attribute, engine_class):
+        # Engines are bound to parsed keys, so a new parsed key means a new engine.
+        commerce_key = self.get_commerce_key()
+        webpay_key = self.get_webpay_key()
+        cached = getattr(self, attribute)
+        if cached is None or cached[0] is not commerce_key or cached[1] is not webpay_key:
+            cached = (commerce_key, webpay_key, engine_class(commerce_key, webpay_key))
+            setattr(self, attribute, cached)
+        return cached[2]
+
     def get_webpay_key(self):
-        return RSA.importKey(TEST_WEBPAY_KEY if self.testing else WEBPAY_KEY)
+        '''
+        Returns Webpay public key for current ``testing`` mode, parsed only once.
+        '''
+        return self.__get_cached_key('_webpay_key', TEST_WEBPAY_KEY if self.testing else WEBPAY_KEY)
 
     def get_commerce_key(self):
-        return RSA.importKey(self.key)
+        '''
+        Returns Commerce private key, parsed only once while ``key`` doesn't change.
+        '''
+        if self.key_source is not None:
+            return self.key_source.key
+        return self.__get_cached_key('_commerce_key', self.key)
+
+    def __get_cached_key(self, attribute, pem):
+        # Cache holds a (pem, parsed key) tuple, so changing ``key`` or ``testing``
+        # invalidates it and threads always see a consistent pair.
+        cached = getattr(self, attribute)
+        if cached is None or not (cached[0] is pem or cached[0] == pem):
+            with self._keys_lock:
+                cached = getattr(self, attribute)
+                if cached is None or not (cached[0] is pem or cached[0] == pem):
+                    cached = (pem, RSA.importKey(pem))
+                    setattr(self, attribute, cached)
+        return cached[1]
 
     def get_public_key(self):
         '''
@@ -193,11 +342,34 @@ class Commerce(object):
                              webpay_port=webpay_port,
                              webpay_server=webpay_server)
 
+    def enable_response_pool(self, size=10):
+        '''
+        Keeps ``size`` pre-encrypted **ACK** and **ERR** responses refilled by a background thread,
+        used by :attr:`acknowledge` and :attr:`reject`.
+
+        :param size: Responses kept for each message.
+        '''
+        if self.response_pool is None:
+            self.response_pool = ResponsePool(self, size=size)
+        self.response_pool.size = size
+        self.response_pool.start()
+        return self.response_pool
+
+    def disable_response_pool(self):
+        '''
+        Stops the response pool, :attr:`acknowledge` and :attr:`reject` encrypt on every call again.
+        '''
+        if self.response_pool is not None:
+            self.response_pool.stop()
+            self.response_pool = None
+
     @property
     def acknowledge(self):
         '''
         The **ACK** string encrypted for succes response on confirmation to Transbank.
         '''
+        if self.response_pool is not None:
+            return self.response_pool.pop('ACK')
         return self.webpay_encrypt('ACK')
 
     @property
@@ -205,4 +377,6 @@ class Commerce(object):
         '''
         The **ERR** string encrypted for reject response on confirmation to Transbank.
         '''
+        if self.response_pool is not None:
+            return self.response_pool.pop('ERR')
         return self.webpay_encrypt('ERR')
@@ -1,19 +1,66 @@
 # encoding=UTF-8
 from __future__ import unicode_literals
 
-import decimal
-import datetime
 import warnings
 
-import pytz
+import six
 
+from .lazy import lazy_import
 from .logging import logger
+from .clock import clock
 
 from . import CONFIRMATION_TIMEOUT
 
+decimal = lazy_import('decimal')
+
+
+# Dates are parsed to ``datetime`` arguments, localizing is left to the first read.
+
+def parse_paid_at(fecha, hora):
+    return (int(clock.strftime('%Y')), int(fecha[:2]), int(fecha[2:]),
+            int(hora[:2]), int(hora[2:4]), int(hora[4:]))
+
+
+def parse_accountable_date(fecha, fecha_transaccion):
+    month, day = int(fecha[:2]), int(fecha[2:])
+    year = int(clock.strftime('%Y'))
+    if int(fecha_transaccion[:2]) == 12 and month == 1:
+        year += 1
+    return (year, month, day)
+
+
+def parse_amount(monto):
+    return decimal.Decimal(monto) / 100
+
+
+class _InvalidField(object):
+    '''
+    Slot value of a field that failed to parse, reading the field raises ``error``.
+    '''
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _parse_field(data, parser, *fields):
+    try:
+        return parser(*[data[field] for field in fields])
+    except Exception as error:
+        return _InvalidField(error)
+
+
+def _valid(value):
+    if type(value) is _InvalidField:
+        raise value.error
+    return value
+
 
 class ConfirmationPayload(object):
     ''' A convenient class to handle Webpay Transaction Payload.
+
+    ``data`` is the raw ``dict``. Typed fields are parsed once at creation, a missing or
+    malformed field raises only when read.
     '''
     RESPONSE_CODES = {
         0: 'Transacción aprobada.',
@@ -36,27 +83,39 @@ class ConfirmationPayload(object):
         "VD": "Redcompra",
     }
 
+    __slots__ = (
+        'data', '_response', '_amount', '_transaction_id', '_installments', '_paid_at', '_accountable_date',
+    )
+
     def __init__(self, data):
         self.data = data
+        self._response = _parse_field(data, int, 'TBK_RESPUESTA')
+        self._amount = _parse_field(data, parse_amount, 'TBK_MONTO')
+        self._transaction_id = _parse_field(data, int, 'TBK_ID_TRANSACCION')
+        self._installments = _parse_field(data, int, 'TBK_NUMERO_CUOTAS')
+        self._paid_at = _parse_field(data, parse_paid_at, 'TBK_FECHA_TRANSACCION', 'TBK_HORA_TRANSACCION')
+        self._accountable_date = _parse_field(
+            data, parse_accountable_date, 'TBK_FECHA_CONTABLE', 'TBK_FECHA_TRANSACCION')
+
+    @classmethod
+    def from_params(cls, params, signature):
+        '''Payload from decrypted ``TBK_PARAM`` (``KEY=value`` lines joined by ``#``) in a single pass.
+        '''
+        data = {}
+        for line in params.split('#'):
+            index = line.find('=')
+            data[line[:index]] = line[index + 1:]
+        data['TBK_MAC'] = signature
+        return cls(data)
 
     @property
     def paid_at(self):
         '''Localized at America/Santiago datetime of ``TBK_FECHA_TRANSACCION``.
         '''
-        fecha_transaccion = self.data['TBK_FECHA_TRANSACCION']
-        hora_transaccion = self.data['TBK_HORA_TRANSACCION']
-        m = int(fecha_transaccion[:2])
-        d = int(fecha_transaccion[2:])
-        h = int(hora_transaccion[:2])
-        i = int(hora_transaccion[2:4])
-        s = int(hora_transaccion[4:])
-
-        santiago = pytz.timezone('America/Santiago')
-        today = santiago.localize(datetime.datetime.today())
-        santiago_dt = santiago.localize(
-            datetime.datetime(today.year, m, d, h, i, s))
-
-        return santiago_dt
+        paid_at = _valid(self._paid_at)
+        if type(paid_at) is tuple:
+            paid_at = self._paid_at = clock.localize(*paid_at)
+        return paid_at
 
     @property
     def message(self):
@@ -68,13 +127,13 @@ class ConfirmationPayload(object):
     def amount(self):
         '''Amount sent in ``TBK_MONTO`` as a Decimal.
         '''
-        return decimal.Decimal(self.data['TBK_MONTO']) / 100
+        return _valid(self._amount)
 
     @property
     def transaction_id(self):
         '''Transaction ID as int.
         '''
-        return int(self.data['TBK_ID_TRANSACCION'])
+        return _valid(self._transaction_id)
 
     @property
     def order_id(self):
@@ -86,7 +145,7 @@ class ConfirmationPayload(object):
     def response(self):
         '''Response code as int (``TBK_RESPUESTA``)
         '''
-        return int(self.data['TBK_RESPUESTA'])
+        return _valid(self._response)
 
     @property
     def credit_card_last_digits(self):
@@ -110,16 +169,10 @@ class ConfirmationPayload(object):
     def accountable_date(self):
         '''Accountable date of transaction, localized as America/Santiago
         '''
-        fecha_transaccion = self.data['TBK_FECHA_CONTABLE']
-        m = int(fecha_transaccion[:2])
-        d = int(fecha_transaccion[2:])
-        santiago = pytz.timezone('America/Santiago')
-        today = santiago.localize(datetime.datetime.today())
-        year = today.year
-        if self.paid_at.month == 12 and m == 1:
-            year += 1
-        santiago_dt = santiago.localize(datetime.datetime(year, m, d))
-        return santiago_dt
+        accountable_date = _valid(self._accountable_date)
+        if type(accountable_date) is tuple:
+            accountable_date = self._accountable_date = clock.localize(*accountable_date)
+        return accountable_date
 
     @property
     def session_id(self):
@@ -132,7 +185,7 @@ class ConfirmationPayload(object):
     def installments(self):
         '''Quantity of installments
         '''
-        return int(self.data['TBK_NUMERO_CUOTAS'])
+        return _valid(self._installments)
 
     @property
     def payment_type(self):
@@ -149,6 +202,9 @@ class ConfirmationPayload(object):
     def __getitem__(self, key):
         return self.data[key]
 
+    def __reduce__(self):
+        return self.__class__, (self.data,)
+
 
 class Confirmation(object):
     '''
@@ -161,24 +217,65 @@ class Confirmation(object):
     :param request_ip: String representing request ip.
     :param data: dict like instance with ``TBK_PARAM``.
     :param timeout: seconds between initialization and ``is_success`` to don't suceed.
+    :param executor: :class:`~tbk.webpay.executor.CryptoExecutor` used to decrypt ``TBK_PARAM``
+        instead of ``commerce``.
+    :param dedup: :class:`~tbk.webpay.dedup.DedupStore` with previous decisions. A retry of
+        an answered confirmation isn't logged again and ``previous_decision`` holds its
+        answer. When ``TBK_PARAM`` is exactly the same it isn't even decrypted, ``payload``
+        then only has the ``DEDUP_FIELDS`` stored with the decision. Answer with ``respond``
+        to store the decision.
     '''
+    DEDUP_FIELDS = ('TBK_ORDEN_COMPRA', 'TBK_MONTO', 'TBK_ID_TRANSACCION')
 
-    def __init__(self, commerce, request_ip, data, timeout=CONFIRMATION_TIMEOUT):
-        self.init_time = datetime.datetime.now()
+    previous_decision = None
+
+    def __init__(self, commerce, request_ip, data, timeout=CONFIRMATION_TIMEOUT, executor=None, dedup=None):
+        self.init_time = clock.monotonic()
         self.timeout = timeout
         self.commerce = commerce
         self.request_ip = request_ip
-        self.payload = ConfirmationPayload(self.parse(data['TBK_PARAM']))
+        self.executor = executor
+        self.dedup = dedup
+        self.digest = None
+        self.payload = None
+        if dedup is not None:
+            self.digest = dedup.digest(data['TBK_PARAM'])
+            entry = dedup.lookup(digest=self.digest)
+            if entry is not None:
+                self.previous_decision, fields = entry
+                self.payload = ConfirmationPayload(fields)
+                return
+        self.payload = self.parse(data['TBK_PARAM'])
+        if dedup is not None:
+            self.previous_decision = dedup.get(transaction_id=self.payload.transaction_id)
+            if self.previous_decision is not None:
+                dedup.set(self.previous_decision, digest=self.digest, fields=self.get_dedup_fields())
+                return
         logger.confirmation(self)
 
+    @classmethod
+    def from_executor(cls, executor, request_ip, data, timeout=CONFIRMATION_TIMEOUT, dedup=None):
+        '''
+        Create a confirmation for ``executor.commerce`` decrypting ``TBK_PARAM`` in ``executor`` workers.
+
+        :param executor: :class:`~tbk.webpay.executor.CryptoExecutor` instance.
+        '''
+        return cls(executor.commerce, request_ip, data, timeout=timeout, executor=executor, dedup=dedup)
+
+    @property
+    def is_replay(self):
+        '''
+        ``True`` when this confirmation was already answered.
+        '''
+        return self.previous_decision is not None
+
     def parse(self, tbk_param):
-        decrypted_params, signature = self.commerce.webpay_decrypt(tbk_param)
-        params = {}
-        for line in decrypted_params.split('#'):
-            index = line.find('=')
-            params[line[:index]] = line[index + 1:]
-        params['TBK_MAC'] = signature
-        return params
+        decrypted_params, signature = self.commerce.webpay_decrypt(tbk_param, executor=self.executor)
+        if isinstance(decrypted_params, six.binary_type):
+            decrypted_params = decrypted_params.decode('utf-8')
+        if isinstance(signature, six.binary_type):
+            signature = signature.decode('ascii')
+        return ConfirmationPayload.from_params(decrypted_params, signature)
 
     def is_success(self, check_timeout=True):
         '''
@@ -186,17 +283,41 @@ class Confirmation(object):
         and this call is less than ``self.timeout`` when ``check_timeout`` is ``True`` (default).
 
         :param check_timeout: When ``True``, check time between initialization and call.
+
+        A replayed confirmation is successful only when it was acknowledged before.
         '''
+        if self.previous_decision is not None:
+            return self.previous_decision == 'ACK'
         if check_timeout and self.is_timeout():
             return False
         return self.payload.response == self.payload.SUCCESS_RESPONSE_CODE
 
+    def respond(self, accept=None):
+        '''
+        Encrypted answer to Transbank, ``commerce.acknowledge`` or ``commerce.reject``.
+
+        Replays get their previous answer, otherwise the answer accepts when ``accept`` is
+        ``True`` (``is_success()`` by default) and it is stored in ``dedup``.
+        '''
+        decision = self.previous_decision
+        if decision is None:
+            decision = 'ACK' if (self.is_success() if accept is None else accept) else 'ERR'
+            if self.dedup is not None:
+                self.dedup.set(decision, digest=self.digest, transaction_id=self.payload.transaction_id,
+                               fields=self.get_dedup_fields())
+        return self.commerce.acknowledge if decision == 'ACK' else self.commerce.reject
+
+    def get_dedup_fields(self):
+        '''
+        Raw ``DEDUP_FIELDS`` of ``payload`` stored with the decision.
+        '''
+        return dict((field, self.payload[field]) for field in self.DEDUP_FIELDS)
+
     def is_timeout(self):
         '''
         Check if the lapse between initialization and now is more than ``self.timeout``.
         '''
-        lapse = datetime.datetime.now() - self.init_time
-        return lapse > datetime.timedelta(seconds=self.timeout)
+        return clock.monotonic() - self.init_time > self.timeout
 
     @property
     def amount(self):
@@ -0,0 +1,151 @@
+import os
+import threading
+import collections
+
+import six
+
+from .lazy import lazy_import
+
+__all__ = ['DedupStore']
+
+hashlib = lazy_import('hashlib')
+sqlite3 = lazy_import('sqlite3')
+json = lazy_import('json')
+
+
+ACK = 'ACK'
+ERR = 'ERR'
+
+
+class DedupStore(object):
+    '''
+    Remembers the decision (``'ACK'`` or ``'ERR'``) answered to every confirmation so
+    Transbank retries get the same answer without decrypting and logging again.
+
+    Decisions are keyed by a digest of the raw ``TBK_PARAM`` and by ``TBK_ID_TRANSACCION``
+    and kept in a LRU of ``size`` keys. With ``database`` they are also stored in a
+    SQLite database shared by every worker process. Each decision may keep a ``dict`` of
+    confirmation fields, so a retry that isn't decrypted still knows its order and amount.
+
+    :param size: Keys kept in memory.
+    :param database: SQLite database path, ``None`` keeps decisions only in memory.
+    '''
+
+    def __init__(self, size=10000, database=None):
+        self.size = size
+        self.database = database
+        self.hits = 0
+        self.misses = 0
+        self.decisions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    @staticmethod
+    def digest(tbk_param):
+        '''
+        Digest of the raw ``TBK_PARAM``.
+        '''
+        if isinstance(tbk_param, six.text_type):
+            tbk_param = tbk_param.encode('utf-8')
+        return hashlib.sha1(tbk_param).hexdigest()
+
+    def get(self, digest=None, transaction_id=None):
+        '''
+        Previous decision for ``digest`` or ``transaction_id``, ``None`` if there isn't one.
+        '''
+        entry = self.lookup(digest=digest, transaction_id=transaction_id)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, digest=None, transaction_id=None):
+        '''
+        Previous ``(decision, fields)`` for ``digest`` or ``transaction_id``, ``None`` if
+        there isn't one.
+        '''
+        for key in self._keys(digest, transaction_id):
+            entry = self._get(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, decision, digest=None, transaction_id=None, fields=None):
+        '''
+        Stores ``decision`` and the ``fields`` dict for ``digest`` and ``transaction_id``.
+        '''
+        if decision not in (ACK, ERR):
+            raise ValueError("Unknown decision: %s" % decision)
+        entry = (decision, dict(fields or {}))
+        keys = self._keys(digest, transaction_id)
+        with self._lock:
+            for key in keys:
+                self._remember(key, entry)
+            if self.database is not None:
+                encoded = json.dumps(entry[1])
+                with self.connection:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO decisions VALUES (?, ?, ?)',
+                        [(key, decision, encoded) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self.decisions.clear()
+            if self.database is not None:
+                with self.connection:
+                    self.connection.execute('DELETE FROM decisions')
+
+    def stats(self):
+        '''
+        Returns a dict with keys in memory, hits and misses.
+        '''
+        return {
+            'size': len(self.decisions),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    @property
+    def connection(self):
+        '''
+        SQLite connection of the current process, opened again after a fork.
+        '''
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.database, timeout=5, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS decisions (key TEXT PRIMARY KEY, decision TEXT, fields TEXT)')
+            self._pid = os.getpid()
+        return self._connection
+
+    def _keys(self, digest, transaction_id):
+        keys = []
+        if digest is not None:
+            keys.append('param:%s' % digest)
+        if transaction_id is not None:
+            keys.append('transaction:%s' % transaction_id)
+        return keys
+
+    def _get(self, key):
+        with self._lock:
+            entry = self.decisions.get(key)
+            if entry is not None:
+                self.decisions[key] = self.decisions.pop(key)
+                return entry
+            if self.database is None:
+                return None
+            row = self.connection.execute(
+                'SELECT decision, fields FROM decisions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            entry = (row[0], json.loads(row[1]) if row[1] else {})
+            self._remember(key, entry)
+            return entry
+
+    def _remember(self, key, entry):
+        self.decisions.pop(key, None)
+        self.decisions[key] = entry
+        while len(self.decisions) > self.size:
+            self.decisions.popitem(last=False)
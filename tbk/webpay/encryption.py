@@ -2,18 +2,29 @@ import base64
 import binascii
 
 import six
-from Crypto import Random
-from Crypto.Hash import SHA512
-from Crypto.Cipher import AES, PKCS1_OAEP
-from Crypto.Signature import PKCS1_v1_5
+
+from .lazy import lazy_import
+from . import entropy
 
 __all__ = ['Encryption', 'Decryption', 'InvalidMessageException', 'DecryptionError', 'EncryptionError']
 
+SHA512 = lazy_import('Crypto.Hash.SHA512')
+AES = lazy_import('Crypto.Cipher.AES')
+PKCS1_OAEP = lazy_import('Crypto.Cipher.PKCS1_OAEP')
+PKCS1_v1_5 = lazy_import('Crypto.Signature.PKCS1_v1_5')
+
 
 class Encryption(object):
+    '''
+    Encryption engine bound to a key pair. Key geometry, the OAEP cipher and the signer
+    are computed once, so the same instance should be reused for every message.
+    '''
+
     def __init__(self, sender_key, recipient_key):
         self.sender_key = sender_key
         self.recipient_key = recipient_key
+        self.key_cipher = PKCS1_OAEP.new(recipient_key.publickey(), randfunc=entropy.read)
+        self.signer = PKCS1_v1_5.new(sender_key)
 
     def encrypt(self, message):
         if not isinstance(message, six.binary_type):
@@ -30,8 +41,7 @@ class Encryption(object):
 
     def sign_message(self, message):
         hash = SHA512.new(message)
-        signer = PKCS1_v1_5.new(self.sender_key)
-        return signer.sign(hash)
+        return self.signer.sign(hash)
 
     def encrypt_message(self, signed_message, message, key, iv):
         raw = signed_message + message
@@ -42,21 +52,28 @@ class Encryption(object):
         return cipher.encrypt(message_to_encrypt)
 
     def encrypt_key(self, key):
-        public_key = self.recipient_key.publickey()
-        cipher = PKCS1_OAEP.new(public_key)
-        return cipher.encrypt(key)
+        return self.key_cipher.encrypt(key)
 
     def get_key(self):
-        return Random.new().read(32)
+        return entropy.read(32)
 
     def get_iv(self):
-        return Random.new().read(16)
+        return entropy.read(16)
 
 
 class Decryption(object):
+    '''
+    Decryption engine bound to a key pair. Key geometry, the OAEP cipher and the verifier
+    are computed once, so the same instance should be reused for every message.
+    '''
+
     def __init__(self, recipient_key, sender_key):
         self.sender_key = sender_key
         self.recipient_key = recipient_key
+        self.recipient_key_bytes = key_bytes(recipient_key)
+        self.sender_key_bytes = key_bytes(sender_key)
+        self.key_cipher = PKCS1_OAEP.new(recipient_key)
+        self.verifier = PKCS1_v1_5.new(sender_key)
 
     def decrypt(self, message):
         if not isinstance(message, six.binary_type):
@@ -81,33 +98,31 @@ class Decryption(object):
 
     def get_key(self, raw):
         try:
-            recipient_key_bytes = int(self.recipient_key.publickey().n.bit_length() / 8)
-            encrypted_key = raw[16:16 + recipient_key_bytes]
-            cipher = PKCS1_OAEP.new(self.recipient_key)
-            return cipher.decrypt(encrypted_key)
+            encrypted_key = raw[16:16 + self.recipient_key_bytes]
+            return self.key_cipher.decrypt(encrypted_key)
         except ValueError:
             raise DecryptionError("Incorrect message length.")
 
     def get_decrypted_message(self, iv, key, raw):
-        recipient_key_bytes = int(self.recipient_key.publickey().n.bit_length() / 8)
-        encrypted_message = raw[16 + recipient_key_bytes:]
+        encrypted_message = raw[16 + self.recipient_key_bytes:]
         unpad = lambda s: s[:-ord(s[len(s) - 1:])]
         cipher = AES.new(key, AES.MODE_CBC, iv)
         return unpad(cipher.decrypt(encrypted_message))
 
     def get_signature(self, decrypted_message):
-        sender_key_bytes = int(self.sender_key.publickey().n.bit_length() / 8)
-        return decrypted_message[:sender_key_bytes]
+        return decrypted_message[:self.sender_key_bytes]
 
     def get_message(self, decrypted_message):
-        sender_key_bytes = int(self.sender_key.publickey().n.bit_length() / 8)
-        return decrypted_message[sender_key_bytes:]
+        return decrypted_message[self.sender_key_bytes:]
 
     def verify(self, signature, message):
         hash = SHA512.new(message)
-        verifier = PKCS1_v1_5.new(self.sender_key)
+        return self.verifier.verify(hash, signature)
+
 
-        return verifier.verify(hash, signature)
+def key_bytes(key):
+    '''Modulus size in bytes of a RSA ``key``.'''
+    return int(key.publickey().n.bit_length() / 8)
 
 
 class InvalidMessageException(Exception):
@@ -0,0 +1,95 @@
+import os
+import binascii
+import threading
+
+from . import fork
+
+__all__ = ['BufferedRandom', 'read', 'randint']
+
+
+BUFFER_SIZE = 4096
+
+
+class BufferedRandom(object):
+    '''
+    Cryptographically secure random bytes read from ``os.urandom`` in blocks of
+    ``buffer_size`` bytes and handed out in slices, so session keys, IVs and transaction
+    ids don't cost a system call each. Every byte is handed out only once.
+
+    Each thread slices its own buffer, so reads take no lock. The buffers are thrown
+    away in a forked child, so processes never share random bytes.
+
+    :param buffer_size: Bytes read from the OS at once.
+    '''
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.refills = 0
+        self._reset()
+        fork.track(self)
+
+    def read(self, size):
+        '''
+        Returns ``size`` random bytes.
+        '''
+        if size > self.buffer_size:
+            return os.urandom(size)
+        # tbk.webpay.fork resets the buffers in a forked child. The pid check stays as a
+        # backstop for forks its hook doesn't see, like a fork() from C code or a
+        # Python without os.register_at_fork.
+        if self._pid != os.getpid():
+            self._reset()
+        state = self._state
+        buffer, offset = state.buffer, state.offset
+        if offset + size > len(buffer):
+            buffer = state.buffer = os.urandom(self.buffer_size)
+            offset = 0
+            self.refills += 1
+        state.offset = offset + size
+        return buffer[offset:offset + size]
+
+    def randint(self, a, b):
+        '''
+        Returns a random int ``N`` such that ``a <= N <= b``, without modulo bias.
+        '''
+        span = b - a + 1
+        if span <= 0:
+            raise ValueError("Empty range for randint(%d, %d)" % (a, b))
+        bits = (span - 1).bit_length()
+        size = (bits + 7) // 8
+        while True:
+            value = int(binascii.hexlify(self.read(size)), 16) >> (size * 8 - bits) if bits else 0
+            if value < span:
+                return a + value
+
+    def after_fork(self):
+        self._reset()
+
+    def _reset(self):
+        self._state = _ThreadBuffer()
+        self._pid = os.getpid()
+
+
+class _ThreadBuffer(threading.local):
+
+    def __init__(self):
+        self.buffer = b''
+        self.offset = 0
+
+
+default_random = BufferedRandom()
+
+
+def read(size):
+    '''
+    Returns ``size`` random bytes from the process wide :class:`BufferedRandom`.
+    '''
+    return default_random.read(size)
+
+
+def randint(a, b):
+    '''
+    Returns a random int between ``a`` and ``b`` (both included) from the process wide
+    :class:`BufferedRandom`.
+    '''
+    return default_random.randint(a, b)
@@ -0,0 +1,140 @@
+import threading
+import multiprocessing
+
+import six
+
+from .lazy import lazy_import
+from .commerce import Commerce
+from .encryption import Decryption, DecryptionError
+
+__all__ = ['CryptoExecutor']
+
+RSA = lazy_import('Crypto.PublicKey.RSA')
+
+
+_commerce = None
+_previous_decryption = None
+
+
+def _initialize(commerce_id, key, testing, previous_key=None):
+    global _commerce, _previous_decryption
+    _commerce = Commerce(id=commerce_id, key=key, testing=testing)
+    _commerce.get_encryption()
+    _commerce.get_decryption()
+    _previous_decryption = None
+    if previous_key is not None:
+        _previous_decryption = Decryption(RSA.importKey(previous_key), _commerce.get_webpay_key())
+
+
+def _webpay_decrypt(encrypted, previous=False):
+    if previous:
+        if _previous_decryption is None:
+            raise DecryptionError("No previous key loaded")
+        return _previous_decryption.decrypt(encrypted)
+    return _commerce.webpay_decrypt(encrypted)
+
+
+def _webpay_encrypt(decrypted):
+    return _commerce.webpay_encrypt(decrypted)
+
+
+class CryptoExecutor(object):
+    '''
+    Runs ``commerce`` RSA work in a pool of processes, each one with keys and crypto
+    engines already loaded, so confirmations are not serialized on a single core.
+
+    Results and exceptions (:class:`~tbk.webpay.encryption.InvalidMessageException`,
+    :class:`~tbk.webpay.encryption.DecryptionError`) are the same of the inline path.
+
+    Workers also load the previous key of ``commerce.key_source`` while in its grace
+    period. When the commerce key rotates, :meth:`set_keys` replaces the workers.
+
+    Workers of the parent process can't be used from a forked child, so after a fork
+    the child starts its own on the first call.
+
+    :param commerce: Commerce whose keys are loaded in every worker.
+    :param processes: Worker processes, defaults to CPU count.
+    '''
+
+    def __init__(self, commerce, processes=None):
+        self.commerce = commerce
+        self.processes = processes or multiprocessing.cpu_count()
+        self.closed = False
+        self._lock = threading.Lock()
+        self.pool = self._create_pool(*self._commerce_keys())
+
+    def set_keys(self, key, previous_key=None):
+        '''
+        Replaces the workers with new ones loaded with the PEM ``key`` and, when given,
+        the PEM ``previous_key``. Work already sent to the old workers finishes with the
+        old keys.
+        '''
+        pool, self.pool = self.pool, self._create_pool(key, previous_key)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def after_fork(self):
+        '''
+        Forgets the workers of the parent process, new ones are started on the first call.
+        '''
+        self._lock = threading.Lock()
+        self.pool = None
+
+    def webpay_decrypt(self, encrypted, previous=False):
+        '''
+        Decrypts ``encrypted`` with the commerce key, or with the previous key when
+        ``previous`` is ``True``.
+        '''
+        if not isinstance(encrypted, six.binary_type):
+            encrypted = encrypted.encode('utf-8')
+        return self._apply(_webpay_decrypt, (encrypted, previous))
+
+    def webpay_encrypt(self, decrypted):
+        if not isinstance(decrypted, six.binary_type):
+            decrypted = decrypted.encode('utf-8')
+        return self._apply(_webpay_encrypt, (decrypted,))
+
+    def _create_pool(self, key, previous_key):
+        return multiprocessing.Pool(
+            self.processes,
+            initializer=_initialize,
+            initargs=(self.commerce.id, key, self.commerce.testing, previous_key)
+        )
+
+    def _commerce_keys(self):
+        key_source = self.commerce.key_source
+        return self.commerce.key, key_source.previous_pem if key_source is not None else None
+
+    def _apply(self, func, args):
+        # A pool replaced by set_keys between reading it and applying refuses new work.
+        while True:
+            pool = self.pool
+            if pool is None:
+                if self.closed:
+                    raise ValueError("CryptoExecutor is closed")
+                with self._lock:
+                    if self.pool is None:
+                        self.pool = self._create_pool(*self._commerce_keys())
+                continue
+            try:
+                return pool.apply(func, args)
+            except ValueError:
+                if pool is self.pool:
+                    raise
+
+    def close(self):
+        '''
+        Waits for pending work and stops worker processes.
+        '''
+        self.closed = True
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,77 @@
+'''
+Support for servers that fork workers from a warmed up master (e.g. gunicorn ``--preload``).
+
+Parsed keys, crypto engines and imported modules are inherited by every worker. State
+that must not be shared between processes, like pooled HTTP connections, pre-encrypted
+responses, random buffers and locks, is reset in the child by :func:`after_fork`.
+Background threads and database connections aren't restarted by the reset, each one
+starts again on its first use in the child, so short-lived children such as
+``multiprocessing`` pool workers don't pay for them.
+
+:func:`after_fork` runs automatically where ``os.register_at_fork`` is available,
+otherwise call it from the server post-fork hook::
+
+    # gunicorn.conf.py
+    def post_fork(server, worker):
+        tbk.webpay.fork.after_fork()
+'''
+import gc
+import os
+import random
+import weakref
+
+__all__ = ['register', 'track', 'after_fork', 'before_fork']
+
+
+_callbacks = []
+_objects = weakref.WeakSet()
+_pid = os.getpid()
+
+
+def register(callback):
+    '''
+    Calls ``callback()`` in every forked child.
+    '''
+    _callbacks.append(callback)
+    return callback
+
+
+def track(obj):
+    '''
+    Calls ``obj.after_fork()`` in every forked child while ``obj`` is alive.
+    '''
+    _objects.add(obj)
+    return obj
+
+
+def after_fork():
+    '''
+    Resets per-process state, once per process. Returns ``False`` when it already ran
+    in the current process. Callbacks must be cheap and must not start threads.
+    '''
+    global _pid
+    pid = os.getpid()
+    if pid == _pid:
+        return False
+    _pid = pid
+    random.seed()
+    for callback in list(_callbacks):
+        callback()
+    for obj in list(_objects):
+        obj.after_fork()
+    return True
+
+
+def before_fork():
+    '''
+    Collects garbage and, where supported, moves every object to the permanent
+    generation so the garbage collector doesn't write to pages shared with workers.
+    Call it in the master right before forking.
+    '''
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork)
@@ -0,0 +1,197 @@
+import os
+import threading
+
+from .lazy import lazy_import
+from .clock import clock
+from . import fork
+
+__all__ = ['KeySource', 'StaticKeySource', 'FileKeySource']
+
+RSA = lazy_import('Crypto.PublicKey.RSA')
+
+
+KEY_FILE_EXTENSION = '.pem'
+
+
+class KeySource(object):
+    '''
+    Provides a commerce private key that may be rotated while running.
+
+    A new key is parsed before it replaces the current one, so ``key`` and ``pem``
+    always return a consistent, parsed key. The replaced key is still available as
+    ``previous_key`` for ``grace_period`` seconds to decrypt messages encrypted for it.
+
+    :param grace_period: Seconds the replaced key stays available.
+    '''
+
+    def __init__(self, grace_period=300):
+        self.grace_period = grace_period
+        self.version = 0
+        self._current = None
+        self._previous = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        fork.track(self)
+
+    @property
+    def pem(self):
+        return self._current[0]
+
+    @property
+    def key(self):
+        '''
+        Current parsed key.
+        '''
+        return self._current[1]
+
+    @property
+    def previous_key(self):
+        '''
+        Replaced parsed key while in its grace period, ``None`` otherwise.
+        '''
+        previous = self._previous
+        if previous is None or clock.monotonic() > previous[2]:
+            return None
+        return previous[1]
+
+    @property
+    def previous_pem(self):
+        '''
+        PEM of ``previous_key`` while in its grace period, ``None`` otherwise.
+        '''
+        previous = self._previous
+        if previous is None or clock.monotonic() > previous[2]:
+            return None
+        return previous[0]
+
+    def add_listener(self, callback):
+        '''
+        Calls ``callback(key_source)`` after every rotation.
+        '''
+        self._listeners.append(callback)
+
+    def set_pem(self, pem):
+        '''
+        Parses ``pem`` and makes it the current key.
+        '''
+        parsed = RSA.importKey(pem)
+        with self._lock:
+            if self._current is not None:
+                self._previous = self._current + (clock.monotonic() + self.grace_period,)
+            self._current = (pem, parsed)
+            self.version += 1
+        for callback in self._listeners:
+            callback(self)
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+
+class StaticKeySource(KeySource):
+    '''
+    Key source of a fixed ``pem``, rotated only by calling ``set_pem``.
+    '''
+
+    def __init__(self, pem, grace_period=300):
+        super(StaticKeySource, self).__init__(grace_period)
+        self.set_pem(pem)
+
+
+class FileKeySource(KeySource):
+    '''
+    Key source watching ``path``, a PEM file or a directory where the most recently
+    modified ``*.pem`` file is the key.
+
+    ``start`` polls ``path`` every ``interval`` seconds from a background thread, which
+    reads and parses a changed key before swapping it. A key that fails to load is
+    ignored and kept in ``error``, the current key stays in use.
+
+    :param path: PEM file or directory.
+    :param interval: Seconds between checks.
+    :param grace_period: Seconds the replaced key stays available.
+    '''
+
+    def __init__(self, path, interval=1.0, grace_period=300):
+        super(FileKeySource, self).__init__(grace_period)
+        self.path = path
+        self.interval = interval
+        self.error = None
+        self._signature = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._resume = False
+        if not self.check():
+            raise self.error or ValueError("No key found at %s" % path)
+
+    @property
+    def key(self):
+        if self._resume:
+            with self._lock:
+                resume, self._resume = self._resume, False
+            if resume:
+                self.start()
+        return super(FileKeySource, self).key
+
+    def key_file(self):
+        if not os.path.isdir(self.path):
+            return self.path
+        candidates = [
+            os.path.join(self.path, file_name) for file_name in os.listdir(self.path)
+            if file_name.endswith(KEY_FILE_EXTENSION)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda file_path: (os.stat(file_path).st_mtime, file_path))
+
+    def check(self):
+        '''
+        Loads the key when it changed, returns ``True`` when a new key was loaded.
+        '''
+        try:
+            file_path = self.key_file()
+            if file_path is None:
+                return False
+            stat = os.stat(file_path)
+            signature = (file_path, stat.st_ino, stat.st_size, stat.st_mtime)
+            if signature == self._signature:
+                return False
+            with open(file_path) as key_file:
+                pem = key_file.read()
+            self.set_pem(pem)
+        except (IOError, OSError, ValueError, IndexError, TypeError) as e:
+            self.error = e
+            return False
+        self._signature = signature
+        self.error = None
+        return True
+
+    def start(self):
+        '''
+        Starts watching ``path``.
+        '''
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='tbk-key-source')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def after_fork(self):
+        '''
+        Forgets the watcher thread of the parent process. If ``path`` was watched there,
+        the forked child starts watching it again on its first ``key`` read.
+        '''
+        super(FileKeySource, self).after_fork()
+        self._resume = self._thread is not None and not self._stopped.is_set()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
@@ -0,0 +1,84 @@
+import sys
+import types
+import importlib
+import threading
+
+from . import fork
+
+__all__ = ['LazyModule', 'lazy_import', 'load_all']
+
+
+_import_lock = threading.Lock()
+_modules = []
+
+
+class LazyModule(types.ModuleType):
+    '''
+    Stand-in for the module ``name``, imported on first attribute access.
+
+    Heavy dependencies such as ``requests``, ``pytz`` and ``Crypto`` are bound to
+    these at module level, so processes that only confirm payments or write logs
+    don't pay their import time. An attribute set on the stand-in (e.g. by
+    ``mock.patch``) shadows the attribute of the real module.
+
+    :param name: Absolute module name.
+    '''
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__['_module'] = None
+
+    def load(self):
+        '''
+        Imports the module if needed and returns it.
+        '''
+        module = self.__dict__['_module']
+        if module is None:
+            with _import_lock:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_module'] = module
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__['_module'] is not None or self.__name__ in sys.modules
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('__') and attribute.endswith('__'):
+            raise AttributeError(attribute)
+        return getattr(self.load(), attribute)
+
+    def __dir__(self):
+        return dir(self.load())
+
+    def __repr__(self):
+        return "<lazy module %r%s>" % (self.__name__, ' (loaded)' if self.loaded else '')
+
+
+def lazy_import(name):
+    '''
+    Returns ``name`` if it is already imported, a :class:`LazyModule` otherwise.
+    '''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    module = LazyModule(name)
+    _modules.append(module)
+    return module
+
+
+@fork.register
+def _reset_import_lock():
+    # Another thread of the parent may have held the lock while forking.
+    global _import_lock
+    _import_lock = threading.Lock()
+
+
+def load_all():
+    '''
+    Imports every module returned by :func:`lazy_import`, e.g. before forking workers.
+    '''
+    for module in _modules:
+        module.load()
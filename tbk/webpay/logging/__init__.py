@@ -1,7 +1,7 @@
 import os
-import datetime
 
-import pytz
+from ..clock import clock
+from .. import fork
 
 __all__ = ['logger', 'BaseHandler', 'NullHandler']
 
@@ -33,6 +33,22 @@ class BaseHandler(object):
         '''
         raise NotImplementedError("Logging Handler must implement log_confirmation")
 
+    def format(self, event, **kwargs):
+        '''Build the record of ``event`` in the caller thread.
+
+        Records are handed to ``write_records``, handlers that can format ahead of the
+        write (like the official handler) override both.
+        '''
+        return (event, kwargs)
+
+    def write_records(self, records):
+        '''Write records built by ``format``.'''
+        for event, kwargs in records:
+            getattr(self, event)(**kwargs)
+
+    def after_fork(self):
+        '''Re-initialize per-process state (open files, threads) in a forked child.'''
+
 
 class NullHandler(BaseHandler):
 
@@ -50,16 +66,16 @@ class Logger(object):
 
     def __init__(self, handler):
         self.set_handler(handler)
+        fork.track(self)
 
     def set_handler(self, handler):
         self.handler = handler
 
     def payment(self, payment):
-        santiago = pytz.timezone('America/Santiago')
-        now = santiago.localize(datetime.datetime.now())
+        date, time = clock.strftimes(LOG_DATE_FORMAT, LOG_TIME_FORMAT)
         self.handler.event_payment(
-            date=now.strftime(LOG_DATE_FORMAT),
-            time=now.strftime(LOG_TIME_FORMAT),
+            date=date,
+            time=time,
             pid=os.getpid(),
             commerce_id=payment.commerce.id,
             transaction_id=payment.transaction_id,
@@ -69,11 +85,10 @@ class Logger(object):
         )
 
     def confirmation(self, confirmation):
-        santiago = pytz.timezone('America/Santiago')
-        now = santiago.localize(datetime.datetime.now())
+        date, time = clock.strftimes(LOG_DATE_FORMAT, LOG_TIME_FORMAT)
         self.handler.event_confirmation(
-            date=now.strftime(LOG_DATE_FORMAT),
-            time=now.strftime(LOG_TIME_FORMAT),
+            date=date,
+            time=time,
             pid=os.getpid(),
             commerce_id=confirmation.commerce.id,
             transaction_id=confirmation.payload.transaction_id,
@@ -85,6 +100,11 @@ class Logger(object):
             commerce_id=confirmation.commerce.id
         )
 
+    def after_fork(self):
+        after_fork = getattr(self.handler, 'after_fork', None)
+        if after_fork is not None:
+            after_fork()
+
     def get_webpay_server(self, commerce):
         return 'https://certificacion.webpay.cl' if commerce.testing else 'https://webpay.transbank.cl'
 
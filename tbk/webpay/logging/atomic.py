@@ -0,0 +1,181 @@
+'''
+Multi-process safe appends for the official logs.
+
+Every block is appended with a single ``write`` on an ``O_APPEND`` descriptor, so blocks
+written by several processes to the same file never interleave. ``AppendFile`` can
+also hold an advisory ``flock`` on the file during that write, and per process shard
+files written by ``WebpayOfficialHandler(write_mode='sharded')`` are merged with::
+
+    python -m tbk.webpay.logging.atomic LOG_BASE_PATH [--all]
+'''
+from __future__ import print_function
+
+import os
+import re
+import sys
+import heapq
+
+import six
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from ..clock import clock
+from .durable import write, fsync_directory
+from .reader import JOURNAL_FILE_NAME_RE, event_fields, parse_journal_line
+
+__all__ = ['AppendFile', 'shard_file_name', 'merge_shards']
+
+
+SHARD_FILE_NAME_FORMAT = "%s.%d"
+SHARD_FILE_NAME_RE = re.compile(r'^(?P<file_name>.+\.log)\.(?P<pid>\d+)$')
+MERGE_FILE_NAME_FORMAT = "%s.merge"
+
+
+class AppendFile(object):
+    '''
+    Log file appending every block with one ``O_APPEND`` write.
+
+    :param file_path: File to append to, created when missing.
+    :param lock: Hold an exclusive ``flock`` on the file while writing.
+    '''
+
+    def __init__(self, file_path, lock=False):
+        if lock and fcntl is None:
+            raise ValueError("Advisory locking is not available on this platform")
+        self.name = file_path
+        self.lock = lock
+        self.fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    @property
+    def closed(self):
+        return self.fd is None
+
+    def write(self, block):
+        if isinstance(block, six.text_type):
+            block = block.encode('utf-8')
+        if not self.lock:
+            write(self.fd, block)
+            return
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            write(self.fd, block)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def shard_file_name(file_name, pid=None):
+    '''
+    Name of the shard of ``file_name`` written by process ``pid``, current one by default.
+    '''
+    return SHARD_FILE_NAME_FORMAT % (file_name, os.getpid() if pid is None else pid)
+
+
+def merge_shards(path, current=False):
+    '''
+    Merges every shard file in ``path`` into its log file and removes it.
+
+    Blocks of the log file and of its shards are merged by their logged date and time,
+    blocks of the same second keep the log file first and then pid order. The merge is
+    written to a temporary file, fsynced and renamed over the log file before the shards
+    are removed, so a merge interrupted before the rename leaves the log file untouched
+    and is done again on next run.
+    Shards of today's logs may still be written, so they are skipped unless ``current``.
+
+    Returns the merged log file names.
+    '''
+    from .official import (
+        EVENTS_LOG_FILE_NAME_FORMAT, EVENTS_LOG_FILE_DATE_FORMAT, JOURNAL_LOG_FILE_NAME_FORMAT,
+        JOURNAL_LOG_FILE_DATE_FORMAT)
+
+    today = (
+        EVENTS_LOG_FILE_NAME_FORMAT % clock.strftime(EVENTS_LOG_FILE_DATE_FORMAT),
+        JOURNAL_LOG_FILE_NAME_FORMAT % clock.strftime(JOURNAL_LOG_FILE_DATE_FORMAT),
+    )
+    shards = {}
+    for shard_name in os.listdir(path):
+        match = SHARD_FILE_NAME_RE.match(shard_name)
+        if match is None or (not current and match.group('file_name') in today):
+            continue
+        shards.setdefault(match.group('file_name'), []).append((int(match.group('pid')), shard_name))
+
+    for file_name, file_shards in shards.items():
+        file_path = os.path.join(path, file_name)
+        shard_paths = [os.path.join(path, shard_name) for _, shard_name in sorted(file_shards)]
+        merge_path = os.path.join(path, MERGE_FILE_NAME_FORMAT % file_name)
+        block_key = journal_block_key if JOURNAL_FILE_NAME_RE.match(file_name) else event_block_key
+        sources = [file_path] + shard_paths if os.path.exists(file_path) else shard_paths
+        inputs = [open(source, 'rb') for source in sources]
+        try:
+            with open(merge_path, 'wb') as merged:
+                blocks = heapq.merge(*[
+                    iter_blocks(source, block_key, index) for index, source in enumerate(inputs)])
+                for _, _, _, block in blocks:
+                    merged.write(block)
+                merged.flush()
+                os.fsync(merged.fileno())
+        finally:
+            for source in inputs:
+                source.close()
+        os.rename(merge_path, file_path)
+        fsync_directory(path)
+        for shard_path in shard_paths:
+            os.remove(shard_path)
+    return sorted(shards)
+
+
+def event_block_key(line):
+    fields = event_fields(line)
+    if len(fields) != 11:
+        return None
+    date, time = fields[5], fields[6]
+    return date[4:] + date[2:4] + date[:2] + time
+
+
+def journal_block_key(line):
+    data = parse_journal_line(line)
+    if data is None or 'TBK_FECHA_TRANSACCION' not in data or 'TBK_HORA_TRANSACCION' not in data:
+        return None
+    return data['TBK_FECHA_TRANSACCION'] + data['TBK_HORA_TRANSACCION']
+
+
+def iter_blocks(log_file, block_key, index):
+    '''
+    Yields ``(key, index, position, block)`` for the runs of lines of ``log_file`` with the
+    same date and time key, lines without one stay with the run before them.
+    '''
+    key, lines = '', []
+    for position, line in enumerate(log_file):
+        line_key = block_key(line.decode('utf-8', 'replace'))
+        if line_key is not None and line_key != key and lines:
+            yield key, index, position, b''.join(lines)
+            lines = []
+        if line_key is not None:
+            key = line_key
+        lines.append(line)
+    if lines:
+        yield key, index, position, b''.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0].startswith('-'):
+        print("usage: python -m tbk.webpay.logging.atomic LOG_BASE_PATH [--all]", file=sys.stderr)
+        return 2
+    for file_name in merge_shards(argv[0], current='--all' in argv[1:]):
+        print(file_name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import os
+import errno
+import atexit
+import timeit
+import threading
+import collections
+
+import six
+
+__all__ = ['GroupCommit']
+
+
+class GroupCommit(object):
+    '''
+    Makes appended blocks durable with one ``write`` and one ``fsync`` per group.
+
+    Blocks submitted by concurrent callers are collected for up to ``interval`` seconds
+    or until ``batch_size`` are pending, then a background thread appends them to their
+    files and fsyncs every file once.
+
+    ``submit`` returns a sequence number, ``wait`` blocks until that block (or every block
+    submitted so far) is on disk. Blocks of a file whose write or fsync fails are not
+    retried, since part of them may already be in the file. They are counted in ``lost``
+    and ``wait`` raises the error for them, other blocks and later commits are unaffected.
+
+    Pending blocks are committed by ``close``, which is also registered ``atexit``. A file
+    created by a commit has its directory fsynced too, so the new entry survives a crash.
+
+    :param interval: Maximum seconds a block waits for the group to fill.
+    :param batch_size: Pending blocks forcing an early commit.
+    :param samples: Fsync latencies and lost block sequences kept for ``stats`` and ``wait``.
+    '''
+
+    def __init__(self, interval=0.01, batch_size=64, samples=1000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.submitted = 0
+        self.durable = 0
+        self.commits = 0
+        self.fsyncs = 0
+        self.fsync_time = 0.0
+        self.latencies = collections.deque(maxlen=samples)
+        self.lost = 0
+        self.error = None
+        self._failures = collections.deque(maxlen=samples)
+        self._pending = []
+        self._files = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._start()
+        atexit.register(self.close)
+
+    def submit(self, file_path, block):
+        '''
+        Queues ``block`` to be appended to ``file_path``, returns its sequence number.
+        '''
+        if isinstance(block, six.text_type):
+            block = block.encode('utf-8')
+        with self._condition:
+            if self._stopped:
+                raise ValueError("Group commit is closed")
+            if self._thread is None:
+                self._start()
+            self.submitted += 1
+            self._pending.append((self.submitted, file_path, block))
+            if len(self._pending) in (1, self.batch_size):
+                self._condition.notify_all()
+            return self.submitted
+
+    def wait(self, sequence=None, timeout=None):
+        '''
+        Waits until block ``sequence``, or every block submitted and not yet durable, is
+        committed. Raises the error of the commit when one of those blocks was lost.
+
+        Returns ``False`` when ``timeout`` seconds passed first.
+        '''
+        deadline = None if timeout is None else timeit.default_timer() + timeout
+        with self._condition:
+            if sequence is None:
+                first, sequence = self.durable + 1, self.submitted
+            else:
+                first = sequence
+            while self.durable < sequence:
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - timeit.default_timer()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            for sequences, error in self._failures:
+                if any(first <= lost <= sequence for lost in sequences):
+                    raise error
+            return True
+
+    def close(self):
+        '''
+        Commits pending blocks and stops the background thread.
+        '''
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        for fd in self._files.values():
+            os.close(fd)
+        self._files.clear()
+
+    def after_fork(self):
+        '''
+        Forgets the blocks inherited from the parent process, which commits them. The
+        background thread is started again on the first ``submit``.
+        '''
+        self._condition = threading.Condition()
+        self._pending = []
+        self.durable = self.submitted
+        self._thread = None
+
+    def stats(self):
+        '''
+        Returns a dict with submitted and durable blocks, commits, fsyncs and fsync latencies.
+        '''
+        latencies = sorted(self.latencies)
+        return {
+            'submitted': self.submitted,
+            'durable': self.durable,
+            'commits': self.commits,
+            'fsyncs': self.fsyncs,
+            'lost': self.lost,
+            'fsync_time': self.fsync_time,
+            'fsync_p50': latencies[len(latencies) // 2] if latencies else None,
+            'fsync_max': latencies[-1] if latencies else None,
+        }
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='tbk-group-commit')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending and not self._stopped:
+                    self._condition.wait()
+                deadline = timeit.default_timer() + self.interval
+                while len(self._pending) < self.batch_size and not self._stopped:
+                    remaining = deadline - timeit.default_timer()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, []
+                sequence = self.submitted
+                stopped = self._stopped
+            if pending:
+                failures = self._commit(pending)
+                with self._condition:
+                    for sequences, error in failures:
+                        self.lost += len(sequences)
+                        self.error = error
+                        self._failures.append((sequences, error))
+                    self.durable = sequence
+                    self._condition.notify_all()
+            if stopped:
+                return
+
+    def _commit(self, pending):
+        '''
+        Appends and fsyncs ``pending`` blocks, returns ``(sequences, error)`` for every
+        file that failed.
+        '''
+        blocks = collections.OrderedDict()
+        for sequence, file_path, block in pending:
+            blocks.setdefault(file_path, []).append((sequence, block))
+        failures = []
+        for file_path, file_blocks in blocks.items():
+            try:
+                fd = self._open(file_path)
+                write(fd, b''.join(block for _, block in file_blocks))
+                start = timeit.default_timer()
+                os.fsync(fd)
+            except (IOError, OSError) as e:
+                failures.append((tuple(sequence for sequence, _ in file_blocks), e))
+                fd = self._files.pop(file_path, None)
+                if fd is not None:
+                    os.close(fd)
+                continue
+            elapsed = timeit.default_timer() - start
+            self.fsyncs += 1
+            self.fsync_time += elapsed
+            self.latencies.append(elapsed)
+        for file_path in [file_path for file_path in self._files if file_path not in blocks]:
+            os.close(self._files.pop(file_path))
+        self.commits += 1
+        return failures
+
+    def _open(self, file_path):
+        fd = self._files.get(file_path)
+        if fd is None:
+            try:
+                fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o644)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            else:
+                try:
+                    fsync_directory(os.path.dirname(file_path))
+                except (IOError, OSError):
+                    os.close(fd)
+                    raise
+            self._files[file_path] = fd
+        return fd
+
+
+def write(fd, data):
+    '''
+    Writes all of ``data`` to ``fd``, retrying short writes.
+    '''
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def fsync_directory(path):
+    '''
+    Fsyncs directory ``path`` so entries created or renamed in it are durable.
+    '''
+    fd = os.open(path or os.curdir, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -2,10 +2,11 @@
 from __future__ import unicode_literals
 
 import os
-import datetime
-from contextlib import closing
+import threading
 
-import pytz
+from ..clock import clock
+from .durable import GroupCommit
+from .atomic import AppendFile, shard_file_name
 
 
 def event_payment_format(**kwargs):
@@ -25,25 +26,100 @@ EVENTS_LOG_FILE_DATE_FORMAT = "%Y%m%d"
 JOURNAL_LOG_FILE_NAME_FORMAT = "tbk_bitacora_TR_NORMAL_%s.log"
 JOURNAL_LOG_FILE_DATE_FORMAT = "%m%d"
 
+BUFFERED = 'buffered'
+ATOMIC = 'atomic'
+LOCKED = 'locked'
+SHARDED = 'sharded'
+
 
 class WebpayOfficialHandler(object):
+    '''
+    Writes the official Webpay KCC logs to ``path``.
+
+    Log files are kept open and rotated when the America/Santiago date changes, every
+    event is written as a single block.
+
+    With ``group_commit`` the journal is appended and fsynced by a
+    :class:`~tbk.webpay.logging.durable.GroupCommit`, ``True`` uses its defaults. Journal
+    writes return a sequence number to pass to ``wait_durable``.
+
+    ``write_mode`` matters when several processes share ``path``:
+
+    * ``'buffered'`` writes through a buffered text file, for a single process.
+    * ``'atomic'`` appends every block with one ``O_APPEND`` write so blocks never interleave.
+    * ``'locked'`` is ``'atomic'`` holding an advisory ``flock`` on the file during the write.
+    * ``'sharded'`` writes to per process files, merged by :func:`~tbk.webpay.logging.atomic.merge_shards`.
+    '''
 
-    def __init__(self, path=None):
+    def __init__(self, path=None, group_commit=None, write_mode=BUFFERED):
+        if write_mode not in (BUFFERED, ATOMIC, LOCKED, SHARDED):
+            raise ValueError("Unknown write mode: %s" % write_mode)
         self.path = path
+        self.write_mode = write_mode
+        self.files = {}
+        self.lock = threading.Lock()
+        if group_commit is True:
+            group_commit = GroupCommit()
+        self.group_commit = group_commit
 
     def event_payment(self, **kwargs):
-        with closing(self.events_log_file) as events_log_file:
-            events_log_file.write(event_payment_format(**kwargs))
+        self.write_records([self.format('event_payment', **kwargs)])
 
     def event_confirmation(self, **kwargs):
-        with closing(self.events_log_file) as events_log_file:
-            events_log_file.write(event_confirmation_format(**kwargs))
+        self.write_records([self.format('event_confirmation', **kwargs)])
 
     def log_confirmation(self, payload, commerce_id):
-        format_params = {'commerce_id': commerce_id}
-        format_params.update(**payload.data)
-        with closing(self.journal_log_file) as journal_log_file:
-            journal_log_file.write(log_confirmation_format(**format_params))
+        return self.write_records([self.format('log_confirmation', payload=payload, commerce_id=commerce_id)])
+
+    def format(self, event, **kwargs):
+        '''
+        Returns ``(log_file_name_format, file_name, block)`` for ``event``, the file name is
+        resolved with the date of the event.
+        '''
+        if event == 'log_confirmation':
+            format_params = {'commerce_id': kwargs['commerce_id']}
+            format_params.update(**kwargs['payload'].data)
+            return self.record(
+                JOURNAL_LOG_FILE_NAME_FORMAT, JOURNAL_LOG_FILE_DATE_FORMAT, log_confirmation_format(**format_params))
+        format_func = event_payment_format if event == 'event_payment' else event_confirmation_format
+        date = kwargs.get('date')
+        # The file of an event is the one of its logged date (DDMMYYYY as YYYYMMDD), not
+        # of a later clock reading that may already be the next day.
+        file_date = date[4:] + date[2:4] + date[:2] if date else None
+        return self.record(EVENTS_LOG_FILE_NAME_FORMAT, EVENTS_LOG_FILE_DATE_FORMAT, format_func(**kwargs), file_date)
+
+    def record(self, log_file_name_format, log_file_date_format, block, file_date=None):
+        if file_date is None:
+            file_date = clock.strftime(log_file_date_format)
+        return (log_file_name_format, log_file_name_format % file_date, block)
+
+    def write_records(self, records):
+        '''
+        Appends every record block to its log file and flushes once per batch.
+
+        Returns the group commit sequence of the last journal block, if any.
+        '''
+        sequence = None
+        with self.lock:
+            written = set()
+            for log_file_name_format, file_name, block in records:
+                if self.group_commit is not None and log_file_name_format == JOURNAL_LOG_FILE_NAME_FORMAT:
+                    sequence = self.group_commit.submit(self.file_path(file_name), block)
+                    continue
+                self.open_log_file(log_file_name_format, file_name).write(block)
+                written.add(log_file_name_format)
+            for log_file_name_format in written:
+                self.files[log_file_name_format][1].flush()
+        return sequence
+
+    def wait_durable(self, sequence=None, timeout=None):
+        '''
+        Waits until journal block ``sequence``, or every journal block written so far, is
+        fsynced. Without group commit the journal is only flushed and this returns at once.
+        '''
+        if self.group_commit is None:
+            return True
+        return self.group_commit.wait(sequence, timeout)
 
     @property
     def events_log_file(self):
@@ -54,10 +130,51 @@ class WebpayOfficialHandler(object):
         return self.log_file(JOURNAL_LOG_FILE_NAME_FORMAT, JOURNAL_LOG_FILE_DATE_FORMAT)
 
     def log_file(self, log_file_name_format, log_file_date_format):
-        santiago = pytz.timezone('America/Santiago')
-        now = santiago.localize(datetime.datetime.now())
-        file_name = log_file_name_format % now.strftime(log_file_date_format)
-        return open(os.path.join(self.path, file_name), 'a+')
+        return self.open_log_file(log_file_name_format, log_file_name_format % clock.strftime(log_file_date_format))
+
+    def open_log_file(self, log_file_name_format, file_name):
+        file_path = self.file_path(file_name)
+        current = self.files.get(log_file_name_format)
+        if current is None or current[0] != file_path:
+            if current is not None:
+                current[1].close()
+            if self.write_mode == BUFFERED:
+                log_file = open(file_path, 'a+')
+            else:
+                log_file = AppendFile(file_path, lock=self.write_mode == LOCKED)
+            current = (file_path, log_file)
+            self.files[log_file_name_format] = current
+        return current[1]
+
+    def after_fork(self):
+        '''
+        Forgets the log files inherited from the parent process, they are opened again
+        (as the shards of the child in ``'sharded'`` mode) on next event.
+        '''
+        self.lock = threading.Lock()
+        self.files = {}
+        if self.group_commit is not None:
+            self.group_commit.after_fork()
+
+    def file_path(self, file_name):
+        '''
+        Path of ``file_name``, the shard of the current process in ``'sharded'`` mode.
+        '''
+        if self.write_mode == SHARDED:
+            file_name = shard_file_name(file_name)
+        return os.path.join(self.path, file_name)
+
+    def close(self):
+        '''
+        Close every open log file, they are opened again on next event. A group commit
+        writes its pending blocks and is stopped.
+        '''
+        with self.lock:
+            for _, log_file in self.files.values():
+                log_file.close()
+            self.files.clear()
+        if self.group_commit is not None:
+            self.group_commit.close()
 
 
 PAYMENT_FORMAT = (
@@ -0,0 +1,217 @@
+import atexit
+import pickle
+import threading
+
+from six.moves import queue
+
+from . import BaseHandler
+
+__all__ = ['QueuedHandler']
+
+
+BLOCK = 'block'
+DROP = 'drop'
+SPILL = 'spill'
+
+_STOP = object()
+
+
+def _event_record(event, **kwargs):
+    return (event, kwargs)
+
+
+class QueuedHandler(BaseHandler):
+    '''
+    Wraps ``handler`` so logging doesn't add disk latency to payments and confirmations.
+
+    Records are formatted in the caller thread with ``handler.format`` and put on a
+    bounded queue. A background thread writes them in batches of up to ``batch_size``
+    with ``handler.write_records`` and everything queued is written on ``close``, which
+    is also registered ``atexit``. Handlers without ``format`` and ``write_records``
+    get ``(event, kwargs)`` records, written by calling their event methods.
+
+    When the queue is full ``overflow`` decides what happens with the record:
+
+    * ``'block'`` waits for room in the queue.
+    * ``'drop'`` discards the record, counted in ``dropped``.
+    * ``'spill'`` appends the record to ``spill_path``, the writer thread replays
+      spilled records once the queue is drained.
+
+    Records failing to be written are counted in ``errors``.
+
+    :param handler: Handler that actually writes the records.
+    :param maxsize: Maximum queued records.
+    :param batch_size: Maximum records written at once.
+    :param overflow: One of ``'block'``, ``'drop'`` or ``'spill'``.
+    :param spill_path: File receiving records on ``'spill'`` overflow.
+    '''
+
+    def __init__(self, handler, maxsize=10000, batch_size=256, overflow=BLOCK, spill_path=None):
+        if overflow not in (BLOCK, DROP, SPILL):
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+        if overflow == SPILL and not spill_path:
+            raise ValueError("Spill overflow policy requires spill_path")
+        self.handler = handler
+        if hasattr(handler, 'format') and hasattr(handler, 'write_records'):
+            self._format = handler.format
+            self._write_records = handler.write_records
+        else:
+            self._format = _event_record
+            self._write_records = self._call_handler
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.queue = queue.Queue(maxsize)
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.errors = 0
+        self._pending_spill = 0
+        self._spill_lock = threading.Lock()
+        self._resume = False
+        self._start()
+        atexit.register(self.close)
+
+    def event_payment(self, **kwargs):
+        self.put(self._format('event_payment', **kwargs))
+
+    def event_confirmation(self, **kwargs):
+        self.put(self._format('event_confirmation', **kwargs))
+
+    def log_confirmation(self, payload, commerce_id):
+        self.put(self._format('log_confirmation', payload=payload, commerce_id=commerce_id))
+
+    def put(self, record):
+        '''
+        Queues ``record`` applying the overflow policy when the queue is full.
+        '''
+        if self._thread is None:
+            self._write_records([record])
+            return
+        if self._resume:
+            with self._spill_lock:
+                if self._resume:
+                    self._resume = False
+                    self._start()
+        if self.overflow == BLOCK:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == DROP:
+                self.dropped += 1
+            else:
+                self.spill(record)
+
+    def spill(self, record):
+        with self._spill_lock:
+            with open(self.spill_path, 'ab') as spill_file:
+                pickle.dump(record, spill_file, pickle.HIGHEST_PROTOCOL)
+            self.spilled += 1
+            self._pending_spill += 1
+
+    def flush(self):
+        '''
+        Waits until every queued record has been written.
+        '''
+        if self._thread is not None:
+            self.queue.join()
+
+    def close(self, timeout=None):
+        '''
+        Writes the queued and spilled records and stops the writer thread.
+        '''
+        thread = self._thread
+        if thread is None:
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+        records = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not _STOP:
+                records.append(record)
+        self._write(records)
+        self._replay_spill()
+        close = getattr(self.handler, 'close', None)
+        if close is not None:
+            close()
+
+    def after_fork(self):
+        '''
+        Forgets the records queued in the parent process, which writes them. Unless
+        closed, the writer thread is started again on the first record.
+        '''
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._spill_lock = threading.Lock()
+        self._pending_spill = 0
+        self._resume = self._thread is not None
+        after_fork = getattr(self.handler, 'after_fork', None)
+        if after_fork is not None:
+            after_fork()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='tbk-queued-handler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            records, stop = self._next_batch()
+            try:
+                self._write(records)
+            finally:
+                for _ in range(len(records) + stop):
+                    self.queue.task_done()
+            if stop:
+                return
+            if self._pending_spill and self.queue.empty():
+                self._replay_spill()
+
+    def _next_batch(self):
+        records = []
+        record = self.queue.get()
+        while record is not _STOP:
+            records.append(record)
+            if len(records) >= self.batch_size:
+                break
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        return records, record is _STOP
+
+    def _write(self, records):
+        if not records:
+            return
+        try:
+            self._write_records(records)
+        except Exception:
+            self.errors += len(records)
+        else:
+            self.written += len(records)
+
+    def _call_handler(self, records):
+        for event, kwargs in records:
+            getattr(self.handler, event)(**kwargs)
+
+    def _replay_spill(self):
+        with self._spill_lock:
+            if not self._pending_spill:
+                return
+            records = []
+            with open(self.spill_path, 'r+b') as spill_file:
+                while True:
+                    try:
+                        records.append(pickle.load(spill_file))
+                    except EOFError:
+                        break
+                spill_file.seek(0)
+                spill_file.truncate()
+            self._pending_spill = 0
+        self._write(records)
@@ -0,0 +1,277 @@
+'''
+Reads the official Webpay logs written by :class:`~tbk.webpay.logging.official.WebpayOfficialHandler`.
+
+``scan`` parses ``TBK_EVN%Y%m%d.log`` event blocks and ``tbk_bitacora_TR_NORMAL_%m%d.log``
+journal lines from a memory map, ``LogReader`` keeps a SQLite sidecar index by
+transaction id, order id and date so lookups don't scan the logs and later updates only
+parse the bytes appended since the previous one.
+'''
+import os
+import re
+import mmap
+import sqlite3
+import threading
+import collections
+
+__all__ = ['Record', 'scan', 'parse_journal_line', 'LogReader']
+
+
+PAYMENT = 'payment'
+CONFIRMATION = 'confirmation'
+JOURNAL = 'journal'
+
+INDEX_FILE_NAME = 'tbk_index.sqlite3'
+EVENTS_FILE_NAME_RE = re.compile(r'^TBK_EVN\d{8}\.log$')
+JOURNAL_FILE_NAME_RE = re.compile(r'^tbk_bitacora_TR_NORMAL_\d{4}\.log$')
+
+# First and last message of every block, and its number of lines.
+PAYMENT_BLOCK = ('Inicio de filtrado', 'Todo OK', 14)
+CONFIRMATION_BLOCK = ('TBK_PARAM desencriptado', 'Todo OK', 13)
+
+Record = collections.namedtuple('Record', ['kind', 'file_name', 'offset', 'length', 'data'])
+Record.__doc__ = '''
+Parsed log entry, ``kind`` is ``'payment'``, ``'confirmation'`` or ``'journal'``.
+``offset`` and ``length`` locate its bytes in ``file_name``.
+'''
+
+
+def event_fields(line):
+    return [field.strip() for field in line.split(';', 10)]
+
+
+def parse_payment_block(lines):
+    '''
+    Inverse of ``PAYMENT_FORMAT``.
+    '''
+    first, start, server, token = [event_fields(lines[index]) for index in (0, 3, 4, 11)]
+    return {
+        'pid': first[1],
+        'date': first[5],
+        'time': first[6],
+        'request_ip': first[7],
+        'transaction_id': start[0],
+        'commerce_id': start[9],
+        'webpay_server': server[4],
+        'token': token[10][len('Token='):],
+    }
+
+
+def parse_confirmation_block(lines):
+    '''
+    Inverse of ``CONFIRMATION_FORMAT``.
+    '''
+    first, parsed, transaction = event_fields(lines[0]), event_fields(lines[2]), event_fields(lines[4])
+    return {
+        'pid': first[1],
+        'date': first[5],
+        'time': first[6],
+        'request_ip': first[7],
+        'order_id': parsed[4],
+        'transaction_id': transaction[0],
+        'commerce_id': transaction[9],
+    }
+
+
+def parse_journal_line(line):
+    '''
+    Inverse of ``JOURNAL_FORMAT``, returns ``None`` for other lines.
+    '''
+    parts = line.rstrip('\r\n').split('; ')
+    if not parts[0] or '=' in parts[0]:
+        return None
+    data = {'status': parts[0]}
+    for part in parts[1:]:
+        key, sep, value = part.partition('=')
+        if not sep:
+            return None
+        data[key] = value
+    return data
+
+
+BLOCKS = {
+    PAYMENT_BLOCK[0]: (PAYMENT, PAYMENT_BLOCK, parse_payment_block),
+    CONFIRMATION_BLOCK[0]: (CONFIRMATION, CONFIRMATION_BLOCK, parse_confirmation_block),
+}
+
+
+def iter_lines(buffer, start, end):
+    position = start
+    while position < end:
+        newline = buffer.find(b'\n', position, end)
+        if newline == -1:
+            return
+        yield position, buffer[position:newline + 1].decode('utf-8')
+        position = newline + 1
+
+
+def scan_events(buffer, start, end):
+    lines = iter_lines(buffer, start, end)
+    pending = collections.deque()
+    while True:
+        if not pending:
+            try:
+                pending.append(next(lines))
+            except StopIteration:
+                return
+        offset, line = pending[0]
+        fields = event_fields(line)
+        block = BLOCKS.get(fields[-1]) if len(fields) == 11 else None
+        if block is None:
+            pending.popleft()
+            continue
+        kind, (_, last_message, size), parse = block
+        for line in lines:
+            pending.append(line)
+            if len(pending) == size:
+                break
+        if len(pending) < size:
+            return
+        block_lines = [line for _, line in pending]
+        if event_fields(block_lines[-1])[-1] != last_message:
+            pending.popleft()
+            continue
+        end_offset = pending[-1][0] + len(pending[-1][1].encode('utf-8'))
+        pending.clear()
+        yield kind, offset, end_offset - offset, parse(block_lines)
+
+
+def scan_journal(buffer, start, end):
+    for offset, line in iter_lines(buffer, start, end):
+        data = parse_journal_line(line)
+        if data is not None:
+            yield JOURNAL, offset, len(line.encode('utf-8')), data
+
+
+def scan(file_path, start=0, end=None):
+    '''
+    Yields ``(kind, offset, length, data)`` for every complete entry of ``file_path``
+    between bytes ``start`` and ``end``, the file is read through a memory map.
+    '''
+    journal = JOURNAL_FILE_NAME_RE.match(os.path.basename(file_path)) is not None
+    with open(file_path, 'rb') as log_file:
+        size = os.fstat(log_file.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if end <= start:
+            return
+        buffer = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for entry in (scan_journal if journal else scan_events)(buffer, start, end):
+                yield entry
+        finally:
+            buffer.close()
+
+
+def index_date(kind, file_name, data):
+    if kind == JOURNAL:
+        return data.get('TBK_FECHA_TRANSACCION') or file_name[-8:-4]
+    date = data['date']
+    return date[4:] + date[2:4] + date[:2]
+
+
+class LogReader(object):
+    '''
+    Indexed reader of the official logs in ``path``.
+
+    ``update`` indexes the bytes appended to every log since the previous update, a log
+    that was truncated or replaced is indexed again. Event dates are indexed as
+    ``YYYYMMDD`` and journal dates, which have no year, as ``MMDD``.
+
+    :param path: Directory with the official logs.
+    :param index_path: SQLite sidecar index, ``tbk_index.sqlite3`` inside ``path`` by default.
+    '''
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or os.path.join(path, INDEX_FILE_NAME)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_name TEXT PRIMARY KEY, inode INTEGER, scanned INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                file_name TEXT, kind TEXT, position INTEGER, length INTEGER,
+                transaction_id TEXT, order_id TEXT, date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS entries_transaction_id ON entries (transaction_id);
+            CREATE INDEX IF NOT EXISTS entries_order_id ON entries (order_id);
+            CREATE INDEX IF NOT EXISTS entries_date ON entries (date);
+            CREATE INDEX IF NOT EXISTS entries_file_name ON entries (file_name);
+        ''')
+
+    def log_files(self):
+        return sorted(
+            file_name for file_name in os.listdir(self.path)
+            if EVENTS_FILE_NAME_RE.match(file_name) or JOURNAL_FILE_NAME_RE.match(file_name)
+        )
+
+    def update(self):
+        '''
+        Indexes new entries of every log, returns how many were indexed.
+        '''
+        indexed = 0
+        with self.lock:
+            for file_name in self.log_files():
+                indexed += self._update_file(file_name)
+        return indexed
+
+    def _update_file(self, file_name):
+        file_path = os.path.join(self.path, file_name)
+        stat = os.stat(file_path)
+        row = self.connection.execute(
+            'SELECT inode, scanned FROM files WHERE file_name = ?', (file_name,)).fetchone()
+        reset = row is not None and (row[0] != stat.st_ino or row[1] > stat.st_size)
+        scanned = 0 if row is None or reset else row[1]
+        if scanned == stat.st_size:
+            return 0
+        entries = []
+        for kind, offset, length, data in scan(file_path, scanned):
+            entries.append((
+                file_name, kind, offset, length, data.get('transaction_id', data.get('TBK_ID_TRANSACCION')),
+                data.get('order_id', data.get('TBK_ORDEN_COMPRA')), index_date(kind, file_name, data)
+            ))
+            scanned = offset + length
+        with self.connection:
+            if reset:
+                self.connection.execute('DELETE FROM entries WHERE file_name = ?', (file_name,))
+            self.connection.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)', entries)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (file_name, stat.st_ino, scanned))
+        return len(entries)
+
+    def find(self, transaction_id=None, order_id=None, date=None, kind=None):
+        '''
+        Returns the records matching every given criteria, ``date`` is a ``datetime.date``.
+        '''
+        conditions, params = [], []
+        for column, value in (('transaction_id', transaction_id), ('order_id', order_id), ('kind', kind)):
+            if value is not None:
+                conditions.append('%s = ?' % column)
+                params.append(str(value))
+        if date is not None:
+            conditions.append('date IN (?, ?)')
+            params += [date.strftime('%Y%m%d'), date.strftime('%m%d')]
+        query = 'SELECT file_name, position, length FROM entries'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY file_name, position', params).fetchall()
+        return [self.read(*row) for row in rows]
+
+    def read(self, file_name, offset, length):
+        '''
+        Parses the entry at ``offset`` of ``file_name``.
+        '''
+        file_path = os.path.join(self.path, file_name)
+        for kind, entry_offset, entry_length, data in scan(file_path, offset, offset + length):
+            return Record(kind, file_name, entry_offset, entry_length, data)
+
+    def records(self, file_name):
+        '''
+        Yields every record of ``file_name``, without using the index.
+        '''
+        for kind, offset, length, data in scan(os.path.join(self.path, file_name)):
+            yield Record(kind, file_name, offset, length, data)
+
+    def close(self):
+        self.connection.close()
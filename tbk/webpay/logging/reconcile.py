@@ -0,0 +1,193 @@
+'''
+Reconciles expected orders against the ``tbk_bitacora`` journal.
+
+Journal files are split in byte ranges at line boundaries and parsed by a pool of
+processes, each one returning the journal lines of its range grouped by order. Expected
+orders are then streamed once against the merged result.
+'''
+import os
+import mmap
+import decimal
+import collections
+import multiprocessing
+
+import six
+
+from .reader import JOURNAL_FILE_NAME_RE, iter_lines, parse_journal_line
+
+__all__ = ['JournalEntry', 'Report', 'Reconciliation', 'reconcile']
+
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+JournalEntry = collections.namedtuple('JournalEntry', [
+    'order_id', 'transaction_id', 'amount', 'response', 'file_name', 'offset'])
+JournalEntry.__doc__ = '''
+Journal line of an order, ``amount`` is ``TBK_MONTO`` as a Decimal and ``response`` is ``TBK_RESPUESTA``.
+'''
+
+
+class Report(object):
+    '''
+    Reconciliation results.
+
+    * ``matched``: orders with one accepted journal line for the expected amount.
+    * ``missing``: ``(order_id, amount)`` expected orders without journal lines.
+    * ``duplicates``: ``(order_id, entries)`` orders with more than one accepted line.
+    * ``amount_mismatches``: ``(order_id, expected, entry)`` accepted lines for another amount.
+    * ``rejected``: ``(order_id, entries)`` orders whose lines all have ``TBK_RESPUESTA != 0``.
+    * ``unexpected``: ``(order_id, entries)`` journal orders not in the expected orders.
+    '''
+
+    def __init__(self):
+        self.matched = 0
+        self.missing = []
+        self.duplicates = []
+        self.amount_mismatches = []
+        self.rejected = []
+        self.unexpected = []
+
+    @property
+    def is_clean(self):
+        return not (self.missing or self.duplicates or self.amount_mismatches or self.rejected or self.unexpected)
+
+    def summary(self):
+        '''
+        Returns a dict with the number of orders on every result.
+        '''
+        return {
+            'matched': self.matched,
+            'missing': len(self.missing),
+            'duplicates': len(self.duplicates),
+            'amount_mismatches': len(self.amount_mismatches),
+            'rejected': len(self.rejected),
+            'unexpected': len(self.unexpected),
+        }
+
+
+def split_ranges(file_path, chunk_size=CHUNK_SIZE):
+    '''
+    Splits ``file_path`` in ``(file_path, start, end)`` ranges of about ``chunk_size``
+    bytes, every range ends at a line boundary.
+    '''
+    size = os.path.getsize(file_path)
+    if size <= chunk_size:
+        return [(file_path, 0, size)] if size else []
+    ranges = []
+    with open(file_path, 'rb') as journal:
+        buffer = mmap.mmap(journal.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                newline = buffer.find(b'\n', min(start + chunk_size, size) - 1)
+                end = size if newline == -1 else newline + 1
+                ranges.append((file_path, start, end))
+                start = end
+        finally:
+            buffer.close()
+    return ranges
+
+
+def scan_range(file_range):
+    '''
+    Returns ``{order_id: [JournalEntry, ...]}`` for the journal lines in ``file_range``.
+    '''
+    file_path, start, end = file_range
+    file_name = os.path.basename(file_path)
+    orders = {}
+    with open(file_path, 'rb') as journal:
+        buffer = mmap.mmap(journal.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for offset, line in iter_lines(buffer, start, end):
+                data = parse_journal_line(line)
+                if data is None or 'TBK_ORDEN_COMPRA' not in data:
+                    continue
+                order_id = data['TBK_ORDEN_COMPRA']
+                orders.setdefault(order_id, []).append(JournalEntry(
+                    order_id, data.get('TBK_ID_TRANSACCION'), decimal.Decimal(data.get('TBK_MONTO') or 0) / 100,
+                    data.get('TBK_RESPUESTA'), file_name, offset))
+        finally:
+            buffer.close()
+    return orders
+
+
+class Reconciliation(object):
+    '''
+    Parallel reconciliation of expected orders against ``journal_files``.
+
+    :param journal_files: Journal file paths, or a directory with ``tbk_bitacora_TR_NORMAL_*.log`` files.
+    :param processes: Worker processes, defaults to CPU count. ``1`` parses in the calling process.
+    :param chunk_size: Bytes parsed by every task.
+    '''
+
+    def __init__(self, journal_files, processes=None, chunk_size=CHUNK_SIZE):
+        if isinstance(journal_files, six.string_types) and os.path.isdir(journal_files):
+            journal_files = [
+                os.path.join(journal_files, file_name) for file_name in sorted(os.listdir(journal_files))
+                if JOURNAL_FILE_NAME_RE.match(file_name)
+            ]
+        self.journal_files = list(journal_files)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+
+    def ranges(self):
+        return [
+            file_range for file_path in self.journal_files
+            for file_range in split_ranges(file_path, self.chunk_size)
+        ]
+
+    def load(self):
+        '''
+        Parses every journal line, returns ``{order_id: [JournalEntry, ...]}`` in file order.
+        '''
+        ranges = self.ranges()
+        orders = {}
+        if self.processes == 1 or len(ranges) <= 1:
+            self._merge(orders, (scan_range(file_range) for file_range in ranges))
+            return orders
+        pool = multiprocessing.Pool(min(self.processes, len(ranges)))
+        try:
+            self._merge(orders, pool.imap(scan_range, ranges))
+        finally:
+            pool.close()
+            pool.join()
+        return orders
+
+    def _merge(self, orders, results):
+        for result in results:
+            for order_id, entries in result.items():
+                orders.setdefault(order_id, []).extend(entries)
+
+    def run(self, expected_orders):
+        '''
+        Reconciles ``expected_orders``, an iterable of ``(order_id, amount)`` consumed once.
+
+        :rtype: :class:`Report`
+        '''
+        orders = self.load()
+        report = Report()
+        for order_id, amount in expected_orders:
+            order_id = str(order_id)
+            entries = orders.pop(order_id, None)
+            if not entries:
+                report.missing.append((order_id, amount))
+                continue
+            accepted = [entry for entry in entries if entry.response == '0']
+            if not accepted:
+                report.rejected.append((order_id, entries))
+                continue
+            if len(accepted) > 1:
+                report.duplicates.append((order_id, accepted))
+            if accepted[0].amount != decimal.Decimal(str(amount)):
+                report.amount_mismatches.append((order_id, amount, accepted[0]))
+            elif len(accepted) == 1:
+                report.matched += 1
+        report.unexpected = sorted(orders.items())
+        return report
+
+
+def reconcile(expected_orders, journal_files, processes=None, chunk_size=CHUNK_SIZE):
+    '''
+    Shortcut for ``Reconciliation(journal_files, processes, chunk_size).run(expected_orders)``.
+    '''
+    return Reconciliation(journal_files, processes, chunk_size).run(expected_orders)
@@ -0,0 +1,247 @@
+import atexit
+import sqlite3
+import threading
+
+from ..clock import clock
+from . import BaseHandler
+
+__all__ = ['SQLiteHandler']
+
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS events (
+        kind TEXT, date TEXT, time TEXT, pid INTEGER, commerce_id TEXT, transaction_id TEXT,
+        order_id TEXT, request_ip TEXT, token TEXT, webpay_server TEXT
+    );
+    CREATE INDEX IF NOT EXISTS events_transaction_id ON events (transaction_id);
+    CREATE INDEX IF NOT EXISTS events_order_id ON events (order_id);
+    CREATE INDEX IF NOT EXISTS events_date ON events (date);
+    CREATE TABLE IF NOT EXISTS journal (
+        date TEXT, commerce_id TEXT, order_id TEXT, transaction_id TEXT, transaction_type TEXT,
+        response TEXT, amount TEXT, authorization_code TEXT, card_number TEXT, accounting_date TEXT,
+        transaction_date TEXT, transaction_time TEXT, session_id TEXT, payment_type TEXT,
+        installments TEXT, vci TEXT, mac TEXT
+    );
+    CREATE INDEX IF NOT EXISTS journal_transaction_id ON journal (transaction_id);
+    CREATE INDEX IF NOT EXISTS journal_order_id ON journal (order_id);
+    CREATE INDEX IF NOT EXISTS journal_date ON journal (date);
+'''
+
+EVENT_COLUMNS = (
+    'kind', 'date', 'time', 'pid', 'commerce_id', 'transaction_id', 'order_id', 'request_ip', 'token',
+    'webpay_server')
+
+JOURNAL_FIELDS = (
+    ('order_id', 'TBK_ORDEN_COMPRA'),
+    ('transaction_id', 'TBK_ID_TRANSACCION'),
+    ('transaction_type', 'TBK_TIPO_TRANSACCION'),
+    ('response', 'TBK_RESPUESTA'),
+    ('amount', 'TBK_MONTO'),
+    ('authorization_code', 'TBK_CODIGO_AUTORIZACION'),
+    ('card_number', 'TBK_FINAL_NUMERO_TARJETA'),
+    ('accounting_date', 'TBK_FECHA_CONTABLE'),
+    ('transaction_date', 'TBK_FECHA_TRANSACCION'),
+    ('transaction_time', 'TBK_HORA_TRANSACCION'),
+    ('session_id', 'TBK_ID_SESION'),
+    ('payment_type', 'TBK_TIPO_PAGO'),
+    ('installments', 'TBK_NUMERO_CUOTAS'),
+    ('vci', 'TBK_VCI'),
+    ('mac', 'TBK_MAC'),
+)
+JOURNAL_COLUMNS = ('date', 'commerce_id') + tuple(column for column, _ in JOURNAL_FIELDS)
+
+INSERTS = {
+    'events': 'INSERT INTO events VALUES (%s)' % ', '.join('?' * len(EVENT_COLUMNS)),
+    'journal': 'INSERT INTO journal VALUES (%s)' % ', '.join('?' * len(JOURNAL_COLUMNS)),
+}
+COLUMNS = {
+    'events': EVENT_COLUMNS,
+    'journal': JOURNAL_COLUMNS,
+}
+
+JOURNAL_DATE_FORMAT = '%Y%m%d'
+
+# Connections inherited through fork are never closed by the child, closing them could
+# checkpoint or remove the WAL still in use by the parent.
+_inherited_connections = []
+
+
+class SQLiteHandler(BaseHandler):
+    '''
+    Stores the Webpay logs in a SQLite ``database`` to query them.
+
+    The database uses WAL mode, events are kept in memory and inserted by a background
+    thread in a single transaction once ``batch_size`` are pending or after ``interval``
+    seconds, so a busy database never blocks or fails the caller. Events failing to be
+    inserted are counted in ``errors``. Pending events are inserted on ``close``, which is
+    also registered ``atexit``. Dates are stored as ``YYYYMMDD``, the journal date is the
+    date it was logged.
+
+    :param database: SQLite database path.
+    :param batch_size: Pending events forcing an insert.
+    :param interval: Maximum seconds an event waits to be inserted.
+    '''
+
+    def __init__(self, database, batch_size=100, interval=0.05):
+        self.database = database
+        self.batch_size = batch_size
+        self.interval = interval
+        self.inserted = 0
+        self.transactions = 0
+        self.errors = 0
+        self.connection = self.connect()
+        self.pending = []
+        self.lock = threading.Lock()
+        self._connection_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._full = threading.Event()
+        self._start()
+        atexit.register(self.close)
+
+    def connect(self):
+        connection = sqlite3.connect(self.database, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        return connection
+
+    def event_payment(self, **kwargs):
+        self.put(self.format('event_payment', **kwargs))
+
+    def event_confirmation(self, **kwargs):
+        self.put(self.format('event_confirmation', **kwargs))
+
+    def log_confirmation(self, payload, commerce_id):
+        self.put(self.format('log_confirmation', payload=payload, commerce_id=commerce_id))
+
+    def format(self, event, **kwargs):
+        '''
+        Returns ``(table, row)`` for ``event``.
+        '''
+        if event == 'log_confirmation':
+            data = kwargs['payload'].data
+            return ('journal', (clock.strftime(JOURNAL_DATE_FORMAT), kwargs['commerce_id']) + tuple(
+                data.get(field) for _, field in JOURNAL_FIELDS))
+        date = kwargs['date']
+        return ('events', (
+            event[len('event_'):], date[4:] + date[2:4] + date[:2], kwargs['time'], kwargs['pid'],
+            kwargs['commerce_id'], str(kwargs['transaction_id']), kwargs.get('order_id'), kwargs['request_ip'],
+            kwargs.get('token'), kwargs.get('webpay_server')))
+
+    def put(self, record):
+        if self.connection is None:
+            self._resume()
+        with self.lock:
+            self.pending.append(record)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self._full.set()
+
+    def flush(self):
+        '''
+        Inserts every pending event in one transaction.
+        '''
+        if self.connection is None:
+            self._resume()
+        with self._connection_lock:
+            with self.lock:
+                records, self.pending = self.pending, []
+            try:
+                self._insert(records)
+            except Exception:
+                self.errors += len(records)
+
+    def write_records(self, records):
+        if self.connection is None:
+            self._resume()
+        with self._connection_lock:
+            self._insert(records)
+
+    def _insert(self, records):
+        if not records:
+            return
+        rows = {}
+        for table, row in records:
+            rows.setdefault(table, []).append(row)
+        with self.connection:
+            for table, table_rows in rows.items():
+                self.connection.executemany(INSERTS[table], table_rows)
+        self.inserted += len(records)
+        self.transactions += 1
+
+    def find_events(self, transaction_id=None, order_id=None, date=None):
+        '''
+        Returns the events matching every given criteria as dicts, ``date`` is a ``datetime.date``.
+        '''
+        return self.find('events', transaction_id, order_id, date)
+
+    def find_journal(self, transaction_id=None, order_id=None, date=None):
+        '''
+        Returns the journal entries matching every given criteria as dicts.
+        '''
+        return self.find('journal', transaction_id, order_id, date)
+
+    def find(self, table, transaction_id=None, order_id=None, date=None):
+        conditions, params = [], []
+        for column, value in (('transaction_id', transaction_id), ('order_id', order_id)):
+            if value is not None:
+                conditions.append('%s = ?' % column)
+                params.append(str(value))
+        if date is not None:
+            conditions.append('date = ?')
+            params.append(date.strftime('%Y%m%d'))
+        query = 'SELECT * FROM %s' % table
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        columns = COLUMNS[table]
+        if self.connection is None:
+            self._resume()
+        with self._connection_lock:
+            rows = self.connection.execute(query + ' ORDER BY rowid', params).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        '''
+        Inserts pending events, stops the background thread and closes the database.
+        '''
+        self._stopped.set()
+        self._full.set()
+        if self.connection is None:
+            return
+        self._thread.join()
+        self.flush()
+        self.connection.close()
+
+    def after_fork(self):
+        '''
+        Forgets the connection and the events pending in the parent process, which inserts
+        them. Unless closed, the forked child opens a new connection and starts the
+        background thread on first use.
+        '''
+        if self._stopped.is_set():
+            return
+        _inherited_connections.append(self.connection)
+        self.connection = None
+        self._thread = None
+        self.pending = []
+        self.lock = threading.Lock()
+        self._connection_lock = threading.Lock()
+        self._full = threading.Event()
+
+    def _resume(self):
+        with self._connection_lock:
+            if self.connection is None:
+                self.connection = self.connect()
+                self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='tbk-sqlite-handler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._full.wait(self.interval)
+            self._full.clear()
+            if not self._stopped.is_set():
+                self.flush()
@@ -1,17 +1,25 @@
 import sys
-import hashlib
 import re
-import decimal
+import time
+import timeit
+import threading
 
 import six
-import requests
-from Crypto.Random import random
+from six.moves import queue
 
+from .lazy import lazy_import
+from . import entropy
 from .commerce import Commerce, DecryptionError
 from .logging import logger
+from .session import get_default_session, default_redirect_cache
+from .policy import DEFAULT_FETCH_POLICY, Attempt, hedge
 from . import TBK_VERSION_KCC
 
-__all__ = ['Payment', 'PaymentError']
+__all__ = ['Payment', 'PaymentError', 'RawParamsBuilder', 'fetch_tokens']
+
+hashlib = lazy_import('hashlib')
+decimal = lazy_import('decimal')
+requests = lazy_import('requests')
 
 REDIRECT_URL = "%(process_url)s?TBK_VERSION_KCC=%(tbk_version)s&TBK_TOKEN=%(token)s"
 PYTHON_VERSION = "%d.%d" % (sys.version_info.major, sys.version_info.minor)
@@ -42,15 +50,28 @@ def clean_amount(amount):
 class Payment(object):
     """
     Initialize a Payment object with params required to create the redirection url.
+
+    ``http_session`` is the HTTP session used to fetch the token, by default the one
+    of ``commerce`` or the process wide session from :mod:`tbk.webpay.session`.
+
+    ``fetch_policy`` is a :class:`~tbk.webpay.policy.FetchPolicy` with the token latency
+    budget, by default ``DEFAULT_FETCH_POLICY``.
+
+    ``redirect_cache`` keeps the final validation URL for each commerce, ``None`` to always
+    follow the whole redirect chain.
     """
     _token = None
     _params = None
     _transaction_id = None
+    attempts = ()
+    redirect_cache = default_redirect_cache
 
     def __init__(self, request_ip, amount,
                  order_id, success_url, confirmation_url,
-                 session_id=None, failure_url=None, commerce=None,):
+                 session_id=None, failure_url=None, commerce=None, http_session=None, fetch_policy=None):
         self.commerce = commerce or Commerce.create_commerce()
+        self.http_session = http_session
+        self.fetch_policy = fetch_policy
         self.request_ip = request_ip
         self.amount = clean_amount(amount)
         self.order_id = order_id
@@ -59,6 +80,15 @@ class Payment(object):
         self.session_id = session_id
         self.failure_url = failure_url or success_url
 
+    @property
+    def confirmation_url(self):
+        return self._confirmation_url
+
+    @confirmation_url.setter
+    def confirmation_url(self, confirmation_url):
+        self._confirmation_url = confirmation_url
+        self.confirmation_uri = six.moves.urllib.parse.urlparse(confirmation_url) if confirmation_url else None
+
     @property
     def redirect_url(self):
         """
@@ -84,38 +114,116 @@ class Payment(object):
             logger.payment(self)
         return self._token
 
+    def get_http_session(self):
+        return self.http_session or self.commerce.http_session or get_default_session()
+
     def fetch_token(self):
+        """
+        Request the token to Transbank within ``fetch_policy`` latency budget, following
+        redirects and retrying connection errors and timeouts with jittered backoff.
+
+        Timings of every request are kept in ``attempts``.
+        """
+        policy = self.fetch_policy or DEFAULT_FETCH_POLICY
+        session = self.get_http_session()
+        data = self.get_token_data()
+        started = timeit.default_timer()
+        deadline = started + policy.budget
+        self.attempts = []
+        retry = 0
+
+        while True:
+            try:
+                response = self.post_validation(session, data, policy, started, deadline)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = policy.get_backoff(retry)
+                retry += 1
+                if retry > policy.retries or timeit.default_timer() + delay >= deadline:
+                    raise PaymentError("Payment token generation failed: %s" % e)
+                time.sleep(delay)
+
+        if response.status_code != 200:
+            raise PaymentError("Payment token generation failed")
+
+        return self.get_token_from_content(response.content)
+
+    def post_validation(self, session, data, policy, started, deadline):
+        cache_key = (self.commerce.id, self.commerce.testing)
+        cached_url = self.redirect_cache.get(cache_key) if self.redirect_cache is not None else None
+        if cached_url is not None:
+            try:
+                response, _ = self.follow_redirects(cached_url, session, data, policy, started, deadline)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                response = None
+            if response is not None and response.status_code == 200:
+                return response
+            self.redirect_cache.drop(cache_key)
+
         validation_url = self.get_validation_url()
-        is_redirect = True
-
-        while is_redirect:
-            response = requests.post(
-                validation_url,
-                data={
-                    'TBK_VERSION_KCC': TBK_VERSION_KCC,
-                    'TBK_CODIGO_COMERCIO': self.commerce.id,
-                    'TBK_KEY_ID': self.commerce.webpay_key_id,
-                    'TBK_PARAM': self.params
-                },
+        response, final_url = self.follow_redirects(validation_url, session, data, policy, started, deadline)
+        if self.redirect_cache is not None and response.status_code == 200 and final_url != validation_url:
+            self.redirect_cache.set(cache_key, final_url)
+        return response
+
+    def follow_redirects(self, url, session, data, policy, started, deadline):
+        for _ in range(policy.max_redirects + 1):
+            remaining = deadline - timeit.default_timer()
+            if remaining <= 0:
+                raise PaymentError("Payment token generation failed, latency budget exhausted")
+
+            def post(hedged=False):
+                return self.post(session, url, data, policy.get_timeout(remaining), started, hedged)
+
+            hedge_delay = policy.get_hedge_delay()
+            if hedge_delay is not None and hedge_delay < remaining:
+                response = hedge(post, hedge_delay)
+            else:
+                response = post()
+            policy.observe(self.attempts[-1].elapsed)
+
+            if not response.is_redirect:
+                return response, url
+            url = response.headers.get('location')
+
+        raise PaymentError("Payment token generation failed, too many redirects")
+
+    def post(self, session, url, data, timeout, started, hedged=False):
+        start = timeit.default_timer()
+        try:
+            response = session.post(
+                url,
+                data=data,
                 headers={
                     'User-Agent': USER_AGENT
                 },
-                allow_redirects=False
+                allow_redirects=False,
+                timeout=timeout
             )
-            is_redirect = response.is_redirect
-            validation_url = response.headers.get('location')
-
-        if response.status_code != 200:
-            raise PaymentError("Payment token generation failed")
+        except Exception as e:
+            self.attempts.append(Attempt(url, start - started, timeit.default_timer() - start, None, e, hedged))
+            raise
+        self.attempts.append(
+            Attempt(url, start - started, timeit.default_timer() - start, response.status_code, None, hedged))
+        return response
 
+    def get_token_from_content(self, content):
         try:
-            body, _ = self.commerce.webpay_decrypt(response.content)
+            body, _ = self.commerce.webpay_decrypt(content)
         except DecryptionError:
-            if get_token_from_body(response.content):
-                raise PaymentError("Suspicious message from server: %s" % response.content)
+            if get_token_from_body(content):
+                raise PaymentError("Suspicious message from server: %s" % content)
 
         return get_token_from_body(body)
 
+    def get_token_data(self):
+        return {
+            'TBK_VERSION_KCC': TBK_VERSION_KCC,
+            'TBK_CODIGO_COMERCIO': self.commerce.id,
+            'TBK_KEY_ID': self.commerce.webpay_key_id,
+            'TBK_PARAM': self.params
+        }
+
     def get_process_url(self):
         if self.commerce.testing:
             return "https://certificacion.webpay.cl:6443/filtroUnificado/bp_revision.cgi"
@@ -144,8 +252,7 @@ class Payment(object):
             raise PaymentError("Success URL required")
         if self.confirmation_url is None:
             raise PaymentError("Confirmation URL required")
-        confirmation_uri = six.moves.urllib.parse.urlparse(self.confirmation_url)
-        if re.match('\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', confirmation_uri.hostname) is None:
+        if re.match(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', self.confirmation_uri.hostname) is None:
             raise PaymentError("Confirmation URL host MUST be an IP address")
 
     @property
@@ -154,39 +261,130 @@ class Payment(object):
         Transaction ID for Transbank, a secure random int between 0 and 999999999.
         """
         if not self._transaction_id:
-            self._transaction_id = random.randint(0, 10000000000 - 1)
+            self._transaction_id = entropy.randint(0, 10000000000 - 1)
         return self._transaction_id
 
     def get_raw_params(self, splitter="#", include_pseudomac=True):
-        params = []
-        params += ["TBK_ORDEN_COMPRA=%s" % self.order_id]
-        params += ["TBK_CODIGO_COMERCIO=%s" % self.commerce.id]
-        params += ["TBK_ID_TRANSACCION=%s" % self.transaction_id]
-        uri = six.moves.urllib.parse.urlparse(self.confirmation_url)
-        params += ["TBK_URL_CGI_COMERCIO=%s" % uri.path]
-        params += ["TBK_SERVIDOR_COMERCIO=%s" % uri.hostname]
-        params += ["TBK_PUERTO_COMERCIO=%s" % uri.port]
-        params += ["TBK_VERSION_KCC=%s" % TBK_VERSION_KCC]
-        params += ["TBK_KEY_ID=%s" % self.commerce.webpay_key_id]
-        params += ["PARAMVERIFCOM=1"]
+        """
+        Raw ``TBK_PARAM`` as bytes ready for ``commerce.webpay_encrypt``.
+        """
+        return RawParamsBuilder(self.commerce).build(self, splitter, include_pseudomac)
+
+
+class RawParamsBuilder(object):
+    """
+    Builds raw ``TBK_PARAM`` for payments of ``commerce``. Commerce fields and the pseudo-MAC
+    suffix are computed once, so reuse the builder (see :meth:`build_many`) for batches.
+    """
+
+    def __init__(self, commerce):
+        self.commerce_field = "TBK_CODIGO_COMERCIO=%s" % commerce.id
+        self.commerce_fields = [
+            "TBK_VERSION_KCC=%s" % TBK_VERSION_KCC,
+            "TBK_KEY_ID=%s" % commerce.webpay_key_id,
+            "PARAMVERIFCOM=1",
+        ]
+        self.pseudomac_suffix = ("%swebpay" % commerce.id).encode('utf-8')
+
+    def build(self, payment, splitter="#", include_pseudomac=True):
+        """
+        Raw ``TBK_PARAM`` of ``payment`` as bytes. The ``&`` serialization for the pseudo-MAC
+        and the ``splitter`` one come from the same fields list.
+        """
+        uri = payment.confirmation_uri
+        params = [
+            "TBK_ORDEN_COMPRA=%s" % payment.order_id,
+            self.commerce_field,
+            "TBK_ID_TRANSACCION=%s" % payment.transaction_id,
+            "TBK_URL_CGI_COMERCIO=%s" % uri.path,
+            "TBK_SERVIDOR_COMERCIO=%s" % uri.hostname,
+            "TBK_PUERTO_COMERCIO=%s" % uri.port,
+        ]
+        params += self.commerce_fields
+        mac_index = len(params)
+        params.append("TBK_MONTO=%d" % int(payment.amount * 100))
+        if payment.session_id:
+            params.append("TBK_ID_SESION=%s" % payment.session_id)
+        params.append("TBK_URL_EXITO=%s" % payment.success_url)
+        params.append("TBK_URL_FRACASO=%s" % payment.failure_url)
+        params.append("TBK_TIPO_TRANSACCION=TR_NORMAL")
 
         if include_pseudomac:
-            h = hashlib.new('md5')
-            h.update(self.get_raw_params('&', False))
-            h.update(str(self.commerce.id))
-            h.update("webpay")
-            mac = str(h.hexdigest())
+            mac = hashlib.md5("&".join(params).encode('utf-8') + self.pseudomac_suffix).hexdigest()
+            params.insert(mac_index, "TBK_MAC=%s" % mac)
 
-            params += ["TBK_MAC=%s" % mac]
+        return splitter.join(params).encode('utf-8')
 
-        params += ["TBK_MONTO=%d" % int(self.amount * 100)]
-        if self.session_id:
-            params += ["TBK_ID_SESION=%s" % self.session_id]
-        params += ["TBK_URL_EXITO=%s" % self.success_url]
-        params += ["TBK_URL_FRACASO=%s" % self.failure_url]
-        params += ["TBK_TIPO_TRANSACCION=TR_NORMAL"]
-        return splitter.join(params)
+    def build_many(self, payments):
+        """
+        Raw ``TBK_PARAM`` for every payment of ``payments``, all of them of this commerce.
+        """
+        return [self.build(payment) for payment in payments]
 
 
 class PaymentError(Exception):
     pass
+
+
+_FETCH_DONE = object()
+
+
+def fetch_tokens(payments, concurrency=8):
+    """
+    Fetch tokens of many ``payments`` concurrently, at most ``concurrency`` at a time.
+
+    Yields ``(payment, token)`` as each one completes, or ``(payment, error)`` when
+    the token fetch raised :class:`PaymentError`. Every payment is logged like
+    :attr:`Payment.token`. Other exceptions, including the ones raised by ``payments``,
+    are raised by the generator.
+
+    When the generator is closed or raises, no more payments are taken from ``payments``,
+    requests already running finish in the background.
+
+    :param payments: Iterable of :class:`Payment`.
+    :param concurrency: Maximum simultaneous token requests.
+    """
+    payments = iter(payments)
+    payments_lock = threading.Lock()
+    results = queue.Queue()
+    stopped = threading.Event()
+
+    def fetch():
+        try:
+            while not stopped.is_set():
+                try:
+                    with payments_lock:
+                        payment = next(payments, _FETCH_DONE)
+                except Exception:
+                    stopped.set()
+                    results.put((None, None, sys.exc_info()))
+                    break
+                if payment is _FETCH_DONE:
+                    break
+                try:
+                    results.put((payment, payment.token, None))
+                except PaymentError as e:
+                    results.put((payment, e, None))
+                except Exception:
+                    results.put((payment, None, sys.exc_info()))
+        finally:
+            results.put(_FETCH_DONE)
+
+    for _ in range(concurrency):
+        worker = threading.Thread(target=fetch, name='tbk-fetch-tokens')
+        worker.daemon = True
+        worker.start()
+
+    running = concurrency
+    try:
+        while running:
+            result = results.get()
+            if result is _FETCH_DONE:
+                running -= 1
+                continue
+            payment, token, exc_info = result
+            if exc_info is not None:
+                six.reraise(*exc_info)
+            yield payment, token
+    finally:
+        stopped.set()
@@ -0,0 +1,115 @@
+import sys
+import random
+import threading
+import collections
+
+import six
+from six.moves import queue
+
+__all__ = ['FetchPolicy', 'Attempt', 'DEFAULT_FETCH_POLICY']
+
+
+Attempt = collections.namedtuple('Attempt', ['url', 'started', 'elapsed', 'status_code', 'error', 'hedged'])
+Attempt.__doc__ = '''
+Timing of one HTTP request made while fetching a payment token. ``started`` is
+seconds since the fetch began, ``error`` is the exception raised (if any) and
+``hedged`` tells if the request was a hedge of a slower one.
+'''
+
+
+class FetchPolicy(object):
+    '''
+    Latency budget for fetching a payment token.
+
+    :param budget: Seconds for the whole fetch, including redirects, retries and backoff.
+    :param connect_timeout: Seconds to establish a connection, capped by the remaining budget.
+    :param read_timeout: Seconds to wait for the response, capped by the remaining budget.
+    :param max_redirects: Redirect hops followed before failing.
+    :param retries: Retries after connection errors or timeouts.
+    :param backoff: Base seconds of the exponential backoff between retries, with full jitter.
+    :param hedge_percentile: When a request is slower than this percentile of observed latencies
+        a second one is sent and the first response wins, ``None`` disables hedging.
+    :param hedge_delay: Seconds before hedging while less than ``hedge_min_samples`` were observed.
+    :param hedge_min_samples: Latencies observed before using ``hedge_percentile``.
+    :param samples: Latencies kept to compute ``hedge_percentile``.
+    '''
+
+    def __init__(self, budget=20.0, connect_timeout=3.05, read_timeout=10.0, max_redirects=5,
+                 retries=2, backoff=0.2, hedge_percentile=None, hedge_delay=1.0, hedge_min_samples=20,
+                 samples=1000):
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_redirects = max_redirects
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = collections.deque(maxlen=samples)
+
+    def get_timeout(self, remaining):
+        '''
+        ``(connect, read)`` timeouts that fit in ``remaining`` seconds.
+        '''
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def get_backoff(self, retry):
+        '''
+        Jittered seconds to wait before ``retry`` (starting at 0).
+        '''
+        return random.uniform(0, self.backoff * 2 ** retry)
+
+    def observe(self, elapsed):
+        '''
+        Record the latency of a successful request.
+        '''
+        self.latencies.append(elapsed)
+
+    def get_hedge_delay(self):
+        '''
+        Seconds to wait before hedging a request, ``None`` when hedging is disabled.
+        '''
+        if self.hedge_percentile is None:
+            return None
+        latencies = sorted(self.latencies)
+        if len(latencies) < self.hedge_min_samples:
+            return self.hedge_delay
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100.0))
+        return latencies[index]
+
+
+DEFAULT_FETCH_POLICY = FetchPolicy()
+
+
+def hedge(call, delay):
+    '''
+    Runs ``call(hedged=False)`` and if it didn't finish after ``delay`` seconds runs
+    ``call(hedged=True)`` too, returning the first result. When both fail the last
+    error is raised.
+    '''
+    results = queue.Queue()
+
+    def run(hedged):
+        try:
+            results.put((True, call(hedged=hedged)))
+        except Exception:
+            results.put((False, sys.exc_info()))
+
+    def start(hedged):
+        thread = threading.Thread(target=run, args=(hedged,), name='tbk-hedge')
+        thread.daemon = True
+        thread.start()
+
+    start(False)
+    try:
+        ok, result = results.get(timeout=delay)
+    except queue.Empty:
+        start(True)
+        ok, result = results.get()
+        if not ok:
+            ok, result = results.get()
+
+    if ok:
+        return result
+    six.reraise(*result)
@@ -0,0 +1,114 @@
+import os
+import threading
+import collections
+
+from .commerce import Commerce
+
+__all__ = ['CommerceRegistry']
+
+
+KEY_FILE_EXTENSION = '.pem'
+
+
+class CommerceRegistry(object):
+    '''
+    Resolves many commerce ids to :class:`~tbk.webpay.commerce.Commerce` instances.
+
+    Definitions are kept in a dict, a commerce key is either its PEM or the path of a PEM
+    file read on first use. Up to ``size`` commerces are kept in a LRU, each one with
+    its parsed keys and crypto engines, so lookups of recently used commerces don't parse
+    anything. Lookups are thread safe.
+
+    :param definitions: Mapping of commerce id to PEM key or PEM file path.
+    :param size: Commerces kept in memory.
+    :param testing: Testing flag of every commerce.
+    :param factory: Callable building a commerce from ``id``, ``key`` and ``testing``.
+    '''
+
+    def __init__(self, definitions=None, size=128, testing=False, factory=Commerce):
+        self.size = size
+        self.testing = testing
+        self.factory = factory
+        self.definitions = {}
+        self.commerces = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        for commerce_id, key in (definitions or {}).items():
+            self.register(commerce_id, key)
+
+    @classmethod
+    def from_directory(cls, path, **kwargs):
+        '''
+        Registry of every ``<commerce id>.pem`` key file in ``path``, files are read on first use.
+        '''
+        return cls(dict(
+            (file_name[:-len(KEY_FILE_EXTENSION)], os.path.join(path, file_name))
+            for file_name in os.listdir(path) if file_name.endswith(KEY_FILE_EXTENSION)
+        ), **kwargs)
+
+    def register(self, commerce_id, key):
+        '''
+        Adds or replaces the definition of ``commerce_id``, dropping its cached commerce.
+        '''
+        commerce_id = str(commerce_id)
+        with self._lock:
+            self.definitions[commerce_id] = key
+            self.commerces.pop(commerce_id, None)
+
+    def get(self, commerce_id):
+        '''
+        Returns the commerce of ``commerce_id``, raises ``KeyError`` when it isn't registered.
+        '''
+        commerce_id = str(commerce_id)
+        with self._lock:
+            commerce = self.commerces.pop(commerce_id, None)
+            if commerce is not None:
+                self.commerces[commerce_id] = commerce
+                self.hits += 1
+                return commerce
+            key = self.definitions[commerce_id]
+            self.misses += 1
+        commerce = self.factory(id=commerce_id, key=self.read_key(key), testing=self.testing)
+        with self._lock:
+            if self.definitions.get(commerce_id) is not key:
+                return commerce
+            commerce = self.commerces.setdefault(commerce_id, commerce)
+            while len(self.commerces) > self.size:
+                self.commerces.popitem(last=False)
+                self.evictions += 1
+        return commerce
+
+    __getitem__ = get
+
+    def read_key(self, key):
+        if key.lstrip().startswith('-----BEGIN'):
+            return key
+        with open(key) as key_file:
+            return key_file.read()
+
+    def clear(self):
+        '''
+        Drops every cached commerce, definitions are kept.
+        '''
+        with self._lock:
+            self.commerces.clear()
+
+    def stats(self):
+        '''
+        Returns a dict with registered and cached commerces, hits, misses and evictions.
+        '''
+        return {
+            'registered': len(self.definitions),
+            'cached': len(self.commerces),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __contains__(self, commerce_id):
+        return str(commerce_id) in self.definitions
+
+    def __len__(self):
+        return len(self.definitions)
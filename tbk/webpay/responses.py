@@ -0,0 +1,158 @@
+import timeit
+import threading
+import collections
+
+__all__ = ['ResponsePool']
+
+
+class ResponsePool(object):
+    '''
+    Keeps up to ``size`` fresh encrypted responses for every message of ``messages``
+    so confirmation answers don't pay RSA and AES inside the confirmation timeout.
+
+    Every response is used only once. A background thread refills the pool, and when
+    the pool is empty the response is encrypted synchronously. Responses are tagged
+    with ``commerce.key_version`` and the ones encrypted before a key rotation are
+    discarded.
+
+    :param commerce: Commerce used to encrypt responses.
+    :param size: Responses kept for each message.
+    :param messages: Messages to keep encrypted.
+    '''
+    MESSAGES = ('ACK', 'ERR')
+
+    def __init__(self, commerce, size=10, messages=MESSAGES):
+        self.commerce = commerce
+        self.size = size
+        self.responses = dict((message, collections.deque()) for message in messages)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.generated = 0
+        self.refill_time = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._resume = False
+
+    def start(self):
+        '''
+        Starts the background refill thread.
+        '''
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='tbk-response-pool')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        '''
+        Stops the background refill thread. Pooled responses are kept.
+        '''
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def pop(self, message):
+        '''
+        Returns an encrypted ``message``, from the pool when available.
+        '''
+        if self._resume:
+            with self._lock:
+                resume, self._resume = self._resume, False
+            if resume:
+                self.start()
+        version = self.commerce.key_version
+        responses = self.responses.get(message)
+        while responses:
+            try:
+                response_version, response = responses.popleft()
+            except IndexError:
+                break
+            if response_version == version:
+                with self._lock:
+                    self.hits += 1
+                self._wakeup.set()
+                return response
+            with self._lock:
+                self.stale += 1
+        with self._lock:
+            self.misses += 1
+        self._wakeup.set()
+        return self.commerce.webpay_encrypt(message)
+
+    def fill(self):
+        '''
+        Encrypts responses until every message has ``size`` of them.
+        '''
+        for message, responses in self.responses.items():
+            while len(responses) < self.size and not self._stopped.is_set():
+                start = timeit.default_timer()
+                version = self.commerce.key_version
+                response = self.commerce.webpay_encrypt(message)
+                elapsed = timeit.default_timer() - start
+                responses.append((version, response))
+                with self._lock:
+                    self.generated += 1
+                    self.refill_time += elapsed
+
+    def clear(self):
+        '''
+        Drops every pooled response, e.g. after a key change.
+        '''
+        for responses in self.responses.values():
+            responses.clear()
+        self._wakeup.set()
+
+    def after_fork(self):
+        '''
+        Drops the responses inherited from the parent process, which may use them too.
+        A refill thread running in the parent is started again on the first ``pop``.
+        '''
+        self._resume = self._thread is not None and not self._stopped.is_set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        for responses in self.responses.values():
+            responses.clear()
+
+    def depth(self, message):
+        '''
+        Responses currently pooled for ``message``.
+        '''
+        return len(self.responses[message])
+
+    @property
+    def refill_rate(self):
+        '''
+        Responses encrypted per second by the refill thread.
+        '''
+        if not self.refill_time:
+            return 0.0
+        return self.generated / self.refill_time
+
+    def stats(self):
+        '''
+        Returns a dict with pool depth per message, hits, misses, discarded stale responses,
+        generated responses and refill rate.
+        '''
+        return {
+            'size': self.size,
+            'depth': dict((message, len(responses)) for message, responses in self.responses.items()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'generated': self.generated,
+            'refill_rate': self.refill_rate,
+        }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.fill()
+            self._wakeup.wait()
+            self._wakeup.clear()
@@ -0,0 +1,107 @@
+import timeit
+import weakref
+import threading
+
+from .lazy import lazy_import
+from . import fork
+
+requests = lazy_import('requests')
+adapters = lazy_import('requests.adapters')
+
+__all__ = ['create_session', 'get_default_session', 'set_default_session', 'reset_connections',
+           'RedirectCache']
+
+
+DEFAULT_POOL_SIZE = 10
+
+_default_session = None
+_default_session_lock = threading.Lock()
+_sessions = weakref.WeakSet()
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    '''
+    Creates a keep-alive HTTP session that reuses up to ``pool_size`` connections per host.
+
+    :param pool_size: Connections kept open for each host.
+    '''
+    session = requests.Session()
+    adapter = adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    _sessions.add(session)
+    return session
+
+
+def get_default_session():
+    '''
+    Returns the process wide HTTP session, created on first use.
+    '''
+    global _default_session
+    if _default_session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = create_session()
+    return _default_session
+
+
+def set_default_session(session):
+    '''
+    Replaces the process wide HTTP session, ``None`` to create a new one on next use.
+    '''
+    global _default_session
+    with _default_session_lock:
+        if isinstance(session, requests.Session):
+            _sessions.add(session)
+        _default_session = session
+
+
+@fork.register
+def reset_connections():
+    '''
+    Drops the pooled connections of every session, they are opened again on next request.
+    Runs after a fork so workers don't share sockets with the master.
+    '''
+    global _default_session_lock
+    _default_session_lock = threading.Lock()
+    for session in list(_sessions):
+        for adapter in session.adapters.values():
+            adapter.close()
+
+
+class RedirectCache(object):
+    '''
+    Remembers the final URL of a redirect chain for ``ttl`` seconds, so later requests
+    go straight to it.
+
+    :param ttl: Seconds an entry is valid.
+    '''
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = {}
+
+    def get(self, key):
+        '''
+        Returns the cached URL for ``key`` or ``None`` when missing or expired.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        url, expires = entry
+        if expires < timeit.default_timer():
+            self.drop(key)
+            return None
+        return url
+
+    def set(self, key, url):
+        self.entries[key] = (url, timeit.default_timer() + self.ttl)
+
+    def drop(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+default_redirect_cache = RedirectCache()
@@ -0,0 +1,38 @@
+'''
+aiohttp stand-ins for test_aio, kept apart because ``async def`` is a syntax error
+before Python 3.5.
+'''
+import asyncio
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, content=b'', location=None, delay=0, error=None):
+        self.status = status
+        self.content = content
+        self.headers = {'location': location} if location else {}
+        self.delay = delay
+        self.error = error
+
+    async def read(self):
+        await asyncio.sleep(self.delay)
+        return self.content
+
+    async def __aenter__(self):
+        if self.error is not None:
+            raise self.error
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class FakeSession(object):
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        return self.responses.pop(0)
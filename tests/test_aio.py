@@ -0,0 +1,103 @@
+import sys
+from unittest import TestCase, skipIf
+
+import six
+import mock
+
+from tbk.webpay.payment import Payment, PaymentError, USER_AGENT
+from tbk.webpay.policy import FetchPolicy
+
+# tbk.webpay.aio and the fakes use async def, a syntax error before Python 3.5.
+if sys.version_info >= (3, 5):
+    import asyncio
+    from tbk.webpay import aio
+    from aio_fakes import FakeResponse, FakeSession
+
+DECRYPTED = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
+
+
+@skipIf(sys.version_info < (3, 5), "tbk.webpay.aio needs Python 3.5+")
+class AioTest(TestCase):
+
+    def setUp(self):
+        self.commerce = mock.Mock()
+        self.commerce.testing = True
+        self.commerce.webpay_decrypt.return_value = DECRYPTED, 'signature'
+        self.payment = Payment(
+            request_ip='123.123.123.123', commerce=self.commerce, success_url='http://localhost/',
+            confirmation_url='http://127.0.0.1:8080/', amount=1000, order_id='1')
+        self.payment._params = 'params'
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_fetch_token(self):
+        session = FakeSession(FakeResponse(200, b'encrypted'))
+
+        token = self.run_async(aio.fetch_token(self.payment, session=session))
+
+        self.assertEqual('e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228', token)
+        self.commerce.webpay_decrypt.assert_called_once_with(b'encrypted')
+        url, kwargs = session.posts[0]
+        self.assertEqual(self.payment.get_validation_url(), url)
+        self.assertEqual(self.payment.get_token_data(), kwargs['data'])
+        self.assertEqual({'User-Agent': USER_AGENT}, kwargs['headers'])
+        self.assertFalse(kwargs['allow_redirects'])
+
+    def test_fetch_token_with_redirect(self):
+        session = FakeSession(FakeResponse(302, location='https://other/bp_validacion.cgi'),
+                              FakeResponse(200, b'encrypted'))
+
+        self.run_async(aio.fetch_token(self.payment, session=session))
+
+        self.assertEqual('https://other/bp_validacion.cgi', session.posts[1][0])
+
+    def test_fetch_token_too_many_redirects(self):
+        self.payment.fetch_policy = FetchPolicy(max_redirects=1)
+        session = FakeSession(*[FakeResponse(302, location='https://other/bp_validacion.cgi')] * 3)
+
+        six.assertRaisesRegex(self, PaymentError, "too many redirects",
+                              self.run_async, aio.fetch_token(self.payment, session=session))
+        self.assertEqual(2, len(session.posts))
+
+    def test_fetch_token_timeout(self):
+        self.payment.fetch_policy = FetchPolicy(connect_timeout=0.01, read_timeout=0.01)
+        session = FakeSession(FakeResponse(200, b'encrypted', delay=5))
+
+        six.assertRaisesRegex(self, PaymentError, "timeout",
+                              self.run_async, aio.fetch_token(self.payment, session=session))
+
+    @mock.patch('tbk.webpay.aio.client_errors', return_value=(IOError,))
+    def test_fetch_token_connection_error(self, client_errors):
+        session = FakeSession(FakeResponse(200, error=IOError("Connection refused")))
+
+        six.assertRaisesRegex(self, PaymentError, "Payment token generation failed: Connection refused",
+                              self.run_async, aio.fetch_token(self.payment, session=session))
+
+    def test_fetch_token_not_ok(self):
+        session = FakeSession(FakeResponse(500))
+
+        six.assertRaisesRegex(self, PaymentError, "Payment token generation failed",
+                              self.run_async, aio.fetch_token(self.payment, session=session))
+
+    @mock.patch('tbk.webpay.aio.logger')
+    def test_token(self, logger):
+        session = FakeSession(FakeResponse(200, b'encrypted'))
+
+        token = self.run_async(aio.token(self.payment, session=session))
+
+        self.assertEqual(token, self.payment.token)
+        logger.payment.assert_called_once_with(self.payment)
+
+    @mock.patch('tbk.webpay.aio.Confirmation')
+    def test_create_confirmation(self, Confirmation):
+        data = {'TBK_PARAM': 'encrypted'}
+
+        confirmation = self.run_async(aio.create_confirmation(self.commerce, '123.123.123.123', data))
+
+        self.assertEqual(Confirmation.return_value, confirmation)
+        Confirmation.assert_called_once_with(self.commerce, '123.123.123.123', data, timeout=25, dedup=None)
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.clock import clock
+from tbk.webpay.logging.atomic import AppendFile, shard_file_name, merge_shards, main
+from tbk.webpay.logging.official import WebpayOfficialHandler, event_payment_format
+
+# 2015-01-23 15:09:59 at America/Santiago
+TIMESTAMP = 1422036599
+
+
+def write_events(path, write_mode, quantity):
+    handler = WebpayOfficialHandler(path, write_mode=write_mode)
+    for i in range(quantity):
+        handler.event_payment(
+            date='23012015', time='150959', pid=os.getpid(), commerce_id='597026007976', transaction_id=i,
+            request_ip='123.123.123.123', token='TOKEN', webpay_server='https://certificacion.webpay.cl')
+    handler.close()
+
+
+class AppendFileTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, 'TBK_EVN20150123.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self, file_name='TBK_EVN20150123.log'):
+        with open(os.path.join(self.path, file_name), 'rb') as log_file:
+            return log_file.read()
+
+    def test_write(self):
+        log_file = AppendFile(self.file_path)
+        log_file.write('one\n')
+        log_file.write(b'two\n')
+        log_file.close()
+
+        self.assertEqual(b'one\ntwo\n', self.read())
+        self.assertTrue(log_file.closed)
+
+    @mock.patch('tbk.webpay.logging.atomic.os.write')
+    def test_single_write_per_block(self, write):
+        write.side_effect = lambda fd, data: len(data)
+        log_file = AppendFile(self.file_path)
+
+        log_file.write('line\n' * 14)
+
+        self.assertEqual(1, write.call_count)
+        log_file.close()
+
+    @mock.patch('tbk.webpay.logging.atomic.fcntl')
+    def test_lock(self, fcntl):
+        log_file = AppendFile(self.file_path, lock=True)
+
+        log_file.write('one\n')
+
+        self.assertEqual([
+            mock.call(log_file.fd, fcntl.LOCK_EX),
+            mock.call(log_file.fd, fcntl.LOCK_UN),
+        ], fcntl.flock.call_args_list)
+        log_file.close()
+
+    def test_shard_file_name(self):
+        self.assertEqual('TBK_EVN20150123.log.123', shard_file_name('TBK_EVN20150123.log', 123))
+        self.assertEqual('TBK_EVN20150123.log.%d' % os.getpid(), shard_file_name('TBK_EVN20150123.log'))
+
+    def test_merge_shards(self):
+        for pid, content in ((20, b'second\n'), (3, b'first\n')):
+            with open(os.path.join(self.path, shard_file_name('TBK_EVN20150122.log', pid)), 'wb') as shard:
+                shard.write(content)
+        with open(os.path.join(self.path, 'TBK_EVN20150122.log'), 'wb') as log_file:
+            log_file.write(b'existing\n')
+
+        self.assertEqual(['TBK_EVN20150122.log'], merge_shards(self.path))
+
+        self.assertEqual(b'existing\nfirst\nsecond\n', self.read('TBK_EVN20150122.log'))
+        self.assertEqual(['TBK_EVN20150122.log'], os.listdir(self.path))
+
+    def test_merge_shards_by_time(self):
+        blocks = {}
+        for pid, times in ((3, ('150959', '151003')), (20, ('151001',)), (7, ('151001',))):
+            with open(os.path.join(self.path, shard_file_name('TBK_EVN20150122.log', pid)), 'w') as shard:
+                for time in times:
+                    block = event_payment_format(
+                        date='22012015', time=time, pid=pid, commerce_id='597026007976', transaction_id=1,
+                        request_ip='123.123.123.123', token='TOKEN', webpay_server='https://certificacion.webpay.cl')
+                    blocks[pid, time] = block
+                    shard.write(block)
+
+        merge_shards(self.path)
+
+        self.assertEqual(''.join(blocks[key] for key in ((3, '150959'), (7, '151001'), (20, '151001'), (3, '151003'))),
+                         self.read('TBK_EVN20150122.log').decode('utf-8'))
+
+    def test_merge_shards_journal_by_time(self):
+        line = ("ACK; TBK_ORDEN_COMPRA=%s; TBK_FECHA_TRANSACCION=0122; TBK_HORA_TRANSACCION=%s; "
+                "TBK_ID_TRANSACCION=1\n")
+        file_name = 'tbk_bitacora_TR_NORMAL_0122.log'
+        with open(os.path.join(self.path, file_name), 'w') as log_file:
+            log_file.write(line % ('1', '100000') + line % ('3', '120000'))
+        with open(os.path.join(self.path, shard_file_name(file_name, 3)), 'w') as shard:
+            shard.write(line % ('2', '110000') + line % ('4', '130000'))
+
+        merge_shards(self.path)
+
+        self.assertEqual(''.join(line % args for args in (('1', '100000'), ('2', '110000'), ('3', '120000'),
+                                                          ('4', '130000'))),
+                         self.read(file_name).decode('utf-8'))
+
+    def test_merge_shards_interrupted(self):
+        shard_name = shard_file_name('TBK_EVN20150122.log', 3)
+        with open(os.path.join(self.path, shard_name), 'wb') as shard:
+            shard.write(b'first\n')
+        with open(os.path.join(self.path, 'TBK_EVN20150122.log'), 'wb') as log_file:
+            log_file.write(b'existing\n')
+
+        with mock.patch('tbk.webpay.logging.atomic.os.rename', side_effect=OSError(5, 'Input/output error')):
+            self.assertRaises(OSError, merge_shards, self.path)
+        self.assertEqual(b'existing\n', self.read('TBK_EVN20150122.log'))
+        self.assertIn(shard_name, os.listdir(self.path))
+
+        merge_shards(self.path)
+
+        self.assertEqual(b'existing\nfirst\n', self.read('TBK_EVN20150122.log'))
+        self.assertEqual(['TBK_EVN20150122.log'], os.listdir(self.path))
+
+    def test_merge_shards_skips_current(self):
+        clock.set_backend(time_func=lambda: TIMESTAMP)
+        self.addCleanup(clock.set_backend)
+        shard_name = shard_file_name('TBK_EVN20150123.log', 3)
+        open(os.path.join(self.path, shard_name), 'wb').close()
+
+        self.assertEqual([], merge_shards(self.path))
+        self.assertEqual([shard_name], os.listdir(self.path))
+        self.assertEqual(['TBK_EVN20150123.log'], merge_shards(self.path, current=True))
+
+    @mock.patch('tbk.webpay.logging.atomic.merge_shards')
+    def test_main(self, merge_shards):
+        merge_shards.return_value = []
+
+        self.assertEqual(0, main([self.path, '--all']))
+        merge_shards.assert_called_once_with(self.path, current=True)
+        self.assertEqual(2, main([]))
+
+    def test_multiprocess_atomic(self):
+        processes = [
+            multiprocessing.Process(target=write_events, args=(self.path, 'atomic', 50))
+            for _ in range(4)
+        ]
+        clock.set_backend(time_func=lambda: TIMESTAMP)
+        self.addCleanup(clock.set_backend)
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        lines = self.read().decode('utf-8').splitlines()
+        self.assertEqual(4 * 50 * 14, len(lines))
+        for start in range(0, len(lines), 14):
+            block = lines[start:start + 14]
+            self.assertEqual(1, len(set(line.split(';')[1] for line in block)))
+            self.assertIn('Inicio de filtrado', block[0])
+            self.assertIn('Todo OK', block[-1])
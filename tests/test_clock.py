@@ -0,0 +1,75 @@
+import datetime
+from unittest import TestCase
+
+import mock
+import pytz
+
+from tbk.webpay.clock import Clock
+
+# 2015-01-23 15:09:59 at America/Santiago
+TIMESTAMP = 1422036599.5
+
+
+class ClockTest(TestCase):
+
+    def setUp(self):
+        self.time = mock.Mock(return_value=TIMESTAMP)
+        self.monotonic = mock.Mock(return_value=10.0)
+        self.clock = Clock(time_func=self.time, monotonic_func=self.monotonic)
+
+    def test_tz(self):
+        self.assertEqual(pytz.timezone('America/Santiago'), self.clock.tz)
+
+    @mock.patch('tbk.webpay.clock.pytz.timezone')
+    def test_tz_cached(self, timezone):
+        self.clock.tz
+        self.clock.tz
+
+        timezone.assert_called_once_with('America/Santiago')
+
+    def test_now(self):
+        now = self.clock.now()
+
+        self.assertEqual(datetime.datetime(2015, 1, 23, 15, 9, 59, 500000), now.replace(tzinfo=None))
+        self.assertEqual('America/Santiago', now.tzinfo.zone)
+
+    def test_strftime(self):
+        self.assertEqual('23012015', self.clock.strftime('%d%m%Y'))
+        self.assertEqual('150959', self.clock.strftime('%H%M%S'))
+
+    def test_strftimes_single_reading(self):
+        # 2015-01-23 23:59:59 and the next second at America/Santiago
+        self.time.side_effect = [1422068399, 1422068400]
+
+        self.assertEqual(('23012015', '235959'), self.clock.strftimes('%d%m%Y', '%H%M%S'))
+        self.assertEqual(('24012015', '000000'), self.clock.strftimes('%d%m%Y', '%H%M%S'))
+
+    @mock.patch('tbk.webpay.clock.datetime')
+    def test_strftime_cached(self, datetime_module):
+        now = datetime_module.datetime.fromtimestamp.return_value
+
+        self.clock.strftime('%H%M%S')
+        self.time.return_value = TIMESTAMP + 0.4
+        self.clock.strftime('%H%M%S')
+        self.clock.strftime('%d%m%Y')
+
+        datetime_module.datetime.fromtimestamp.assert_called_once_with(int(TIMESTAMP), self.clock.tz)
+        self.assertEqual(2, now.strftime.call_count)
+
+    def test_strftime_next_second(self):
+        self.clock.strftime('%H%M%S')
+        self.time.return_value = TIMESTAMP + 1
+
+        self.assertEqual('151000', self.clock.strftime('%H%M%S'))
+
+    def test_localize(self):
+        self.assertEqual(
+            pytz.timezone('America/Santiago').localize(datetime.datetime(2015, 1, 2)),
+            self.clock.localize(2015, 1, 2)
+        )
+
+    def test_set_backend(self):
+        self.clock.set_backend()
+
+        self.assertNotEqual(self.time, self.clock.time)
+        self.assertNotEqual(self.monotonic, self.clock.monotonic)
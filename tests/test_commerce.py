@@ -200,6 +200,74 @@ class CommerceTest(TestCase):
 
             self.assertEqual(expected_key, key)
 
+    @mock.patch('tbk.webpay.commerce.RSA.importKey')
+    def test_get_commerce_key_cached(self, importKey):
+        """
+        get_commerce_key parses the PEM key only once
+        """
+        commerce = Commerce(id=12345, testing=True)
+
+        self.assertEqual(importKey.return_value, commerce.get_commerce_key())
+        self.assertEqual(importKey.return_value, commerce.get_commerce_key())
+        importKey.assert_called_once_with(Commerce.TEST_COMMERCE_KEY)
+
+    def test_get_commerce_key_key_changed(self):
+        """
+        get_commerce_key parses again when key changes
+        """
+        private_key = RSA.generate(2048)
+        commerce = Commerce(id=12345, testing=True)
+        commerce.get_commerce_key()
+
+        commerce.key = private_key.exportKey()
+
+        self.assertEqual(private_key, commerce.get_commerce_key())
+
+    @mock.patch('tbk.webpay.commerce.RSA.importKey')
+    def test_get_webpay_key_cached(self, importKey):
+        """
+        get_webpay_key parses the PEM key only once and again when testing changes
+        """
+        commerce = Commerce(id=12345, testing=True)
+
+        commerce.get_webpay_key()
+        commerce.get_webpay_key()
+        commerce.testing = False
+        commerce.get_webpay_key()
+
+        self.assertEqual(2, importKey.call_count)
+
+    @mock.patch('tbk.webpay.commerce.Commerce.get_commerce_key')
+    @mock.patch('tbk.webpay.commerce.Commerce.get_webpay_key')
+    @mock.patch('tbk.webpay.commerce.Encryption')
+    def test_get_encryption_cached(self, Encryption, get_webpay_key, get_commerce_key):
+        """
+        get_encryption builds the engine once per parsed key pair
+        """
+        commerce = Commerce(id=12345, testing=True)
+
+        self.assertEqual(Encryption.return_value, commerce.get_encryption())
+        self.assertEqual(Encryption.return_value, commerce.get_encryption())
+        Encryption.assert_called_once_with(get_commerce_key.return_value, get_webpay_key.return_value)
+
+        get_commerce_key.return_value = mock.Mock()
+        commerce.get_encryption()
+
+        self.assertEqual(2, Encryption.call_count)
+
+    @mock.patch('tbk.webpay.commerce.Commerce.get_commerce_key')
+    @mock.patch('tbk.webpay.commerce.Commerce.get_webpay_key')
+    @mock.patch('tbk.webpay.commerce.Decryption')
+    def test_get_decryption_cached(self, Decryption, get_webpay_key, get_commerce_key):
+        """
+        get_decryption builds the engine once per parsed key pair
+        """
+        commerce = Commerce(id=12345, testing=True)
+
+        self.assertEqual(Decryption.return_value, commerce.get_decryption())
+        self.assertEqual(Decryption.return_value, commerce.get_decryption())
+        Decryption.assert_called_once_with(get_commerce_key.return_value, get_webpay_key.return_value)
+
     def test_get_public_key(self):
         private_key = RSA.generate(2048)
         commerce_key = private_key.exportKey()
@@ -240,3 +308,31 @@ class CommerceTest(TestCase):
 
         self.assertEqual(webpay_encrypt.return_value, commerce.reject)
         webpay_encrypt.assert_called_once_with('ERR')
+
+    @mock.patch('tbk.webpay.commerce.ResponsePool')
+    @mock.patch('tbk.webpay.commerce.Commerce.webpay_encrypt')
+    def test_acknowledge_response_pool(self, webpay_encrypt, ResponsePool):
+        commerce = Commerce(id="597026007977", key=Commerce.TEST_COMMERCE_KEY, testing=False)
+
+        pool = commerce.enable_response_pool(size=5)
+
+        ResponsePool.assert_called_once_with(commerce, size=5)
+        pool.start.assert_called_once_with()
+        self.assertEqual(pool.pop.return_value, commerce.acknowledge)
+        pool.pop.assert_called_once_with('ACK')
+        self.assertFalse(webpay_encrypt.called)
+
+    @mock.patch('tbk.webpay.commerce.ResponsePool')
+    @mock.patch('tbk.webpay.commerce.Commerce.webpay_encrypt')
+    def test_reject_response_pool(self, webpay_encrypt, ResponsePool):
+        commerce = Commerce(id="597026007977", key=Commerce.TEST_COMMERCE_KEY, testing=False)
+
+        pool = commerce.enable_response_pool()
+
+        self.assertEqual(pool.pop.return_value, commerce.reject)
+        pool.pop.assert_called_once_with('ERR')
+
+        commerce.disable_response_pool()
+
+        pool.stop.assert_called_once_with()
+        self.assertEqual(webpay_encrypt.return_value, commerce.reject)
@@ -2,14 +2,17 @@
 from __future__ import unicode_literals
 
 import os
+import pickle
 from unittest import TestCase
 import datetime
+import decimal
 from decimal import Decimal
 
 import mock
 import pytz
 
 from tbk.webpay.confirmation import Confirmation, ConfirmationPayload
+from tbk.webpay.dedup import DedupStore
 from tbk.webpay import CONFIRMATION_TIMEOUT
 from tbk.webpay.logging import Logger
 
@@ -51,9 +54,7 @@ class ConfirmationTest(TestCase):
         self.assertEqual(self.request_ip, confirmation.request_ip)
         self.assertEqual(CONFIRMATION_TIMEOUT, confirmation.timeout)
         parse.assert_called_once_with(data['TBK_PARAM'])
-        ConfirmationPayload.assert_called_once_with(parse.return_value)
-        self.assertEqual(
-            ConfirmationPayload.return_value, confirmation.payload)
+        self.assertEqual(parse.return_value, confirmation.payload)
 
     def test_init_wo_tbk_param(self, logger, ConfirmationPayload):
         data = {}
@@ -72,23 +73,30 @@ class ConfirmationTest(TestCase):
 
         confirmation = Confirmation(self.commerce, self.request_ip, data)
 
-        params = CONFIRMATION_DATA.copy()
-        params['TBK_MAC'] = "signature"
-
-        self.commerce.webpay_decrypt.assert_called_once_with(data['TBK_PARAM'])
-        ConfirmationPayload.assert_called_once_with(params)
+        self.commerce.webpay_decrypt.assert_called_once_with(data['TBK_PARAM'], executor=None)
+        ConfirmationPayload.from_params.assert_called_once_with(confirmation_data, "signature")
         self.assertEqual(
-            ConfirmationPayload.return_value, confirmation.payload)
+            ConfirmationPayload.from_params.return_value, confirmation.payload)
+
+    def test_parse_binary(self, logger, ConfirmationPayload):
+        with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'confirmation.txt')) as f:
+            confirmation_data = f.read()
+        data = {
+            'TBK_PARAM': mock.Mock()
+        }
+        self.commerce.webpay_decrypt.return_value = (
+            confirmation_data.encode('utf-8'), b"signature")
+
+        Confirmation(self.commerce, self.request_ip, data)
+
+        ConfirmationPayload.from_params.assert_called_once_with(confirmation_data, "signature")
 
     @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
     def test_is_success(self, parse, logger, ConfirmationPayload):
-        parse.return_value = {
-            'TBK_RESPUESTA': '0',
-        }
         data = {
             'TBK_PARAM': mock.Mock()
         }
-        payload = ConfirmationPayload.return_value
+        payload = parse.return_value
         payload.response = payload.SUCCESS_RESPONSE_CODE
 
         confirmation = Confirmation(self.commerce, self.request_ip, data)
@@ -97,13 +105,10 @@ class ConfirmationTest(TestCase):
 
     @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
     def test_is_success_respuesta_not_0(self, parse, logger, ConfirmationPayload):
-        parse.return_value = {
-            'TBK_RESPUESTA': '0',
-        }
         data = {
             'TBK_PARAM': mock.Mock()
         }
-        payload = ConfirmationPayload.return_value
+        payload = parse.return_value
 
         for i in range(1, 10):
             payload.response = -i
@@ -113,13 +118,10 @@ class ConfirmationTest(TestCase):
     @mock.patch('tbk.webpay.confirmation.Confirmation.is_timeout')
     @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
     def test_is_success_timeout(self, parse, is_timeout, logger, ConfirmationPayload):
-        parse.return_value = {
-            'TBK_RESPUESTA': '0',
-        }
         data = {
             'TBK_PARAM': mock.Mock()
         }
-        payload = ConfirmationPayload.return_value
+        payload = parse.return_value
         payload.response = payload.SUCCESS_RESPONSE_CODE
         is_timeout.return_value = True
         confirmation = Confirmation(self.commerce, self.request_ip, data)
@@ -129,13 +131,10 @@ class ConfirmationTest(TestCase):
     @mock.patch('tbk.webpay.confirmation.Confirmation.is_timeout')
     @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
     def test_is_success_timeout_dont_check(self, parse, is_timeout, logger, ConfirmationPayload):
-        parse.return_value = {
-            'TBK_RESPUESTA': '0',
-        }
         data = {
             'TBK_PARAM': mock.Mock()
         }
-        payload = ConfirmationPayload.return_value
+        payload = parse.return_value
         payload.response = payload.SUCCESS_RESPONSE_CODE
         is_timeout.return_value = True
         confirmation = Confirmation(self.commerce, self.request_ip, data)
@@ -147,7 +146,7 @@ class ConfirmationTest(TestCase):
         data = {
             'TBK_PARAM': mock.Mock()
         }
-        payload = ConfirmationPayload.return_value
+        payload = parse.return_value
 
         confirmation = Confirmation(self.commerce, self.request_ip, data)
 
@@ -158,7 +157,7 @@ class ConfirmationTest(TestCase):
         data = {
             'TBK_PARAM': mock.Mock()
         }
-        payload = ConfirmationPayload.return_value
+        payload = parse.return_value
 
         confirmation = Confirmation(self.commerce, self.request_ip, data)
 
@@ -172,7 +171,7 @@ class ConfirmationTest(TestCase):
         timeout = 25
 
         confirmation = Confirmation(self.commerce, self.request_ip, data, timeout)
-        confirmation.init_time = confirmation.init_time - datetime.timedelta(seconds=timeout)
+        confirmation.init_time = confirmation.init_time - timeout
 
         self.assertTrue(confirmation.is_timeout())
 
@@ -184,11 +183,90 @@ class ConfirmationTest(TestCase):
         timeout = 20
 
         confirmation = Confirmation(self.commerce, self.request_ip, data, timeout)
-        confirmation.init_time = confirmation.init_time + datetime.timedelta(seconds=timeout)
+        confirmation.init_time = confirmation.init_time + timeout
 
         self.assertFalse(confirmation.is_timeout())
 
 
+    @mock.patch('tbk.webpay.confirmation.clock')
+    @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
+    def test_timeout_monotonic(self, parse, clock, logger, ConfirmationPayload):
+        """
+        is_timeout uses the monotonic clock, not the wall clock
+        """
+        data = {
+            'TBK_PARAM': mock.Mock()
+        }
+        clock.monotonic.return_value = 100.0
+        confirmation = Confirmation(self.commerce, self.request_ip, data, 25)
+
+        clock.monotonic.return_value = 124.0
+        self.assertFalse(confirmation.is_timeout())
+        clock.monotonic.return_value = 126.0
+        self.assertTrue(confirmation.is_timeout())
+        self.assertFalse(clock.now.called)
+
+    @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
+    def test_dedup_replayed_param(self, parse, logger, MockConfirmationPayload):
+        """
+        a replay that isn't decrypted still has order id and amount for the documented view
+        """
+        MockConfirmationPayload.side_effect = ConfirmationPayload
+        dedup = DedupStore()
+        dedup.set('ACK', digest=DedupStore.digest('TBK_PARAM'),
+                  fields={'TBK_ORDEN_COMPRA': '3244', 'TBK_MONTO': '10000', 'TBK_ID_TRANSACCION': '2164532727'})
+
+        confirmation = Confirmation(self.commerce, self.request_ip, {'TBK_PARAM': 'TBK_PARAM'}, dedup=dedup)
+
+        self.assertFalse(parse.called)
+        self.assertFalse(logger.confirmation.called)
+        self.assertTrue(confirmation.is_replay)
+        self.assertTrue(confirmation.is_success())
+        self.assertEqual('3244', confirmation.order_id)
+        self.assertEqual(Decimal('100'), confirmation.amount)
+        self.assertEqual(self.commerce.acknowledge, confirmation.respond())
+
+    @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
+    def test_dedup_replayed_transaction(self, parse, logger, MockConfirmationPayload):
+        parse.return_value = ConfirmationPayload(dict(CONFIRMATION_DATA, TBK_MAC='signature'))
+        dedup = DedupStore()
+        dedup.set('ERR', transaction_id=2164532727)
+
+        confirmation = Confirmation(self.commerce, self.request_ip, {'TBK_PARAM': 'TBK_PARAM'}, dedup=dedup)
+
+        parse.assert_called_once_with('TBK_PARAM')
+        self.assertFalse(logger.confirmation.called)
+        self.assertEqual('ERR', confirmation.previous_decision)
+        self.assertFalse(confirmation.is_success())
+        self.assertEqual(self.commerce.reject, confirmation.respond())
+        self.assertEqual('ERR', dedup.get(digest=DedupStore.digest('TBK_PARAM')))
+
+    @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
+    def test_dedup_respond(self, parse, logger, MockConfirmationPayload):
+        parse.return_value = ConfirmationPayload(dict(CONFIRMATION_DATA, TBK_MAC='signature'))
+        dedup = DedupStore()
+
+        confirmation = Confirmation(self.commerce, self.request_ip, {'TBK_PARAM': 'TBK_PARAM'}, dedup=dedup)
+
+        self.assertFalse(confirmation.is_replay)
+        logger.confirmation.assert_called_once_with(confirmation)
+        self.assertEqual(self.commerce.acknowledge, confirmation.respond(accept=True))
+        self.assertEqual('ACK', dedup.get(digest=DedupStore.digest('TBK_PARAM')))
+        self.assertEqual('ACK', dedup.get(transaction_id=2164532727))
+        self.assertEqual(
+            ('ACK', {'TBK_ORDEN_COMPRA': '3244', 'TBK_MONTO': '10000', 'TBK_ID_TRANSACCION': '2164532727'}),
+            dedup.lookup(digest=DedupStore.digest('TBK_PARAM')))
+
+    @mock.patch('tbk.webpay.confirmation.Confirmation.is_success')
+    @mock.patch('tbk.webpay.confirmation.Confirmation.parse')
+    def test_respond_is_success(self, parse, is_success, logger, ConfirmationPayload):
+        is_success.return_value = False
+        confirmation = Confirmation(self.commerce, self.request_ip, {'TBK_PARAM': 'TBK_PARAM'})
+
+        self.assertEqual(self.commerce.reject, confirmation.respond())
+        is_success.assert_called_once_with()
+
+
 class ConfirmationPayloadTest(TestCase):
 
     def test_payload(self):
@@ -196,6 +274,63 @@ class ConfirmationPayloadTest(TestCase):
 
         self.assertEqual(payload.data, CONFIRMATION_DATA)
 
+    def test_from_params(self):
+        with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'confirmation.txt')) as f:
+            confirmation_data = f.read()
+        expected = CONFIRMATION_DATA.copy()
+        expected['TBK_MAC'] = 'signature'
+
+        payload = ConfirmationPayload.from_params(confirmation_data, 'signature')
+
+        self.assertEqual(expected, payload.data)
+        self.assertEqual(Decimal('100'), payload.amount)
+        self.assertEqual(2164532727, payload.transaction_id)
+        self.assertEqual('signature', payload['TBK_MAC'])
+
+    def test_slots(self):
+        payload = ConfirmationPayload(CONFIRMATION_DATA)
+
+        self.assertFalse(hasattr(payload, '__dict__'))
+
+    def test_extra_fields(self):
+        payload = ConfirmationPayload({'TBK_RESPUESTA': '0', 'TBK_OTHER': 'value'})
+
+        self.assertEqual('value', payload['TBK_OTHER'])
+        self.assertEqual({'TBK_RESPUESTA': '0', 'TBK_OTHER': 'value'}, payload.data)
+        self.assertRaises(KeyError, payload.__getitem__, 'TBK_MISSING')
+
+    def test_missing_field(self):
+        payload = ConfirmationPayload({'TBK_RESPUESTA': '0'})
+
+        self.assertRaises(KeyError, getattr, payload, 'amount')
+        self.assertRaises(KeyError, getattr, payload, 'order_id')
+
+    def test_malformed_field_raises_on_read(self):
+        data = dict(CONFIRMATION_DATA, TBK_NUMERO_CUOTAS='', TBK_MONTO='abc')
+
+        payload = ConfirmationPayload(data)
+
+        self.assertEqual(2164532727, payload.transaction_id)
+        self.assertRaises(ValueError, getattr, payload, 'installments')
+        self.assertRaises(decimal.InvalidOperation, getattr, payload, 'amount')
+
+    def test_missing_field_raises_on_read(self):
+        payload = ConfirmationPayload({'TBK_ORDEN_COMPRA': '3244', 'TBK_MONTO': '10000'})
+
+        self.assertEqual(Decimal('100'), payload.amount)
+        self.assertRaises(KeyError, getattr, payload, 'transaction_id')
+        self.assertRaises(KeyError, getattr, payload, 'paid_at')
+
+    def test_data_is_raw_dict(self):
+        data = dict(CONFIRMATION_DATA)
+
+        self.assertIs(data, ConfirmationPayload(data).data)
+
+    def test_pickle(self):
+        payload = ConfirmationPayload(CONFIRMATION_DATA)
+
+        self.assertEqual(CONFIRMATION_DATA, pickle.loads(pickle.dumps(payload)).data)
+
     def test_messages(self):
         RESPONSE_CODES = {
             '0': 'Transacción aprobada.',
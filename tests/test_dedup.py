@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from tbk.webpay.dedup import DedupStore
+
+
+class DedupStoreTest(TestCase):
+
+    def setUp(self):
+        self.store = DedupStore(size=3)
+
+    def test_digest(self):
+        self.assertEqual(DedupStore.digest(b'TBK_PARAM'), DedupStore.digest('TBK_PARAM'))
+        self.assertNotEqual(DedupStore.digest(b'TBK_PARAM'), DedupStore.digest(b'TBK_PARAM2'))
+
+    def test_get_missing(self):
+        self.assertIsNone(self.store.get(digest='digest', transaction_id='2164532727'))
+        self.assertEqual(1, self.store.misses)
+
+    def test_set_get(self):
+        self.store.set('ACK', digest='digest', transaction_id='2164532727')
+
+        self.assertEqual('ACK', self.store.get(digest='digest'))
+        self.assertEqual('ACK', self.store.get(transaction_id='2164532727'))
+        self.assertEqual('ACK', self.store.get(digest='other', transaction_id='2164532727'))
+        self.assertEqual(3, self.store.hits)
+
+    def test_lookup(self):
+        self.store.set('ERR', digest='digest', fields={'TBK_MONTO': '10000'})
+
+        self.assertEqual(('ERR', {'TBK_MONTO': '10000'}), self.store.lookup(digest='digest'))
+        self.assertIsNone(self.store.lookup(digest='other'))
+
+    def test_set_invalid(self):
+        self.assertRaises(ValueError, self.store.set, 'OK', digest='digest')
+
+    def test_lru(self):
+        self.store.set('ACK', digest='1')
+        self.store.set('ACK', digest='2')
+        self.store.set('ERR', digest='3')
+        self.store.get(digest='1')
+
+        self.store.set('ACK', digest='4')
+
+        self.assertEqual('ACK', self.store.get(digest='1'))
+        self.assertIsNone(self.store.get(digest='2'))
+        self.assertEqual(3, self.store.stats()['size'])
+
+    def test_clear(self):
+        self.store.set('ACK', digest='1')
+        self.store.clear()
+
+        self.assertIsNone(self.store.get(digest='1'))
+
+
+class SQLiteDedupStoreTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.database = os.path.join(self.path, 'dedup.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_shared(self):
+        DedupStore(database=self.database).set('ERR', digest='digest', transaction_id='2164532727',
+                                               fields={'TBK_ORDEN_COMPRA': '3244'})
+
+        store = DedupStore(database=self.database)
+
+        self.assertEqual(('ERR', {'TBK_ORDEN_COMPRA': '3244'}), store.lookup(transaction_id='2164532727'))
+        self.assertEqual('ERR', store.get(digest='digest'))
+        self.assertEqual(2, store.stats()['size'])
+
+    def test_evicted_from_memory(self):
+        store = DedupStore(size=1, database=self.database)
+        store.set('ACK', digest='1')
+        store.set('ACK', digest='2')
+
+        self.assertEqual('ACK', store.get(digest='1'))
+
+    def test_reconnect_after_fork(self):
+        store = DedupStore(database=self.database)
+        connection = store.connection
+        store._pid = -1
+
+        self.assertIsNot(connection, store.connection)
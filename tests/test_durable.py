@@ -0,0 +1,153 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import subprocess
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.logging.durable import GroupCommit
+
+
+class GroupCommitTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, 'journal.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self):
+        with open(self.file_path, 'rb') as journal:
+            return journal.read()
+
+    def test_submit_and_wait(self):
+        group_commit = GroupCommit(interval=0.001)
+
+        sequence = group_commit.submit(self.file_path, 'ACK; one\n')
+
+        self.assertEqual(1, sequence)
+        self.assertTrue(group_commit.wait(sequence, timeout=5))
+        self.assertEqual(b'ACK; one\n', self.read())
+        group_commit.close()
+
+    def test_group(self):
+        group_commit = GroupCommit(interval=5, batch_size=10)
+
+        threads = [
+            threading.Thread(target=group_commit.submit, args=(self.file_path, b'ACK; %d\n' % i))
+            for i in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(group_commit.wait(timeout=5))
+        self.assertEqual(1, group_commit.commits)
+        self.assertEqual(1, group_commit.fsyncs)
+        self.assertEqual(10, len(self.read().splitlines()))
+        group_commit.close()
+
+    def test_wait_timeout(self):
+        group_commit = GroupCommit(interval=5, batch_size=10)
+
+        sequence = group_commit.submit(self.file_path, b'ACK; one\n')
+
+        self.assertFalse(group_commit.wait(sequence, timeout=0.01))
+        group_commit.close()
+        self.assertTrue(group_commit.wait(sequence, timeout=0))
+
+    def test_close_commits_pending(self):
+        group_commit = GroupCommit(interval=5, batch_size=10)
+        group_commit.submit(self.file_path, b'ACK; one\n')
+
+        group_commit.close()
+
+        self.assertEqual(b'ACK; one\n', self.read())
+        self.assertRaises(ValueError, group_commit.submit, self.file_path, b'ACK; two\n')
+
+    def test_exit_commits_pending(self):
+        """
+        blocks still pending when the interpreter exits are committed by the atexit hook
+        """
+        subprocess.check_call([sys.executable, '-c', (
+            "import sys\n"
+            "from tbk.webpay.logging.durable import GroupCommit\n"
+            "GroupCommit(interval=60, batch_size=10).submit(sys.argv[1], b'ACK; one\\n')\n"
+        ), self.file_path], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+        self.assertEqual(b'ACK; one\n', self.read())
+
+    @mock.patch('tbk.webpay.logging.durable.fsync_directory')
+    def test_new_file_fsyncs_directory(self, fsync_directory):
+        group_commit = GroupCommit(interval=0.001)
+
+        group_commit.wait(group_commit.submit(self.file_path, b'ACK; one\n'), timeout=5)
+        group_commit.close()
+        group_commit = GroupCommit(interval=0.001)
+        group_commit.wait(group_commit.submit(self.file_path, b'ACK; two\n'), timeout=5)
+        group_commit.close()
+
+        fsync_directory.assert_called_once_with(self.path)
+
+    @mock.patch('tbk.webpay.logging.durable.os.fsync')
+    def test_error(self, fsync):
+        fsync.side_effect = OSError(5, 'Input/output error')
+        group_commit = GroupCommit(interval=0.001)
+
+        sequence = group_commit.submit(self.file_path, b'ACK; one\n')
+
+        self.assertRaises(OSError, group_commit.wait, sequence, 5)
+        group_commit.close()
+
+    def test_error_does_not_stick(self):
+        group_commit = GroupCommit(interval=0.001)
+
+        failed = group_commit.submit(os.path.join(self.path, 'missing', 'journal.log'), b'ACK; one\n')
+        self.assertRaises(OSError, group_commit.wait, failed, 5)
+        sequence = group_commit.submit(self.file_path, b'ACK; two\n')
+
+        self.assertTrue(group_commit.wait(sequence, timeout=5))
+        self.assertTrue(group_commit.wait(timeout=5))
+        self.assertEqual(2, group_commit.durable)
+        self.assertEqual(1, group_commit.lost)
+        self.assertEqual(b'ACK; two\n', self.read())
+        group_commit.close()
+
+    def test_error_only_fails_its_file(self):
+        group_commit = GroupCommit(interval=5, batch_size=2)
+
+        failed = group_commit.submit(os.path.join(self.path, 'missing', 'journal.log'), b'ACK; one\n')
+        sequence = group_commit.submit(self.file_path, b'ACK; two\n')
+
+        self.assertTrue(group_commit.wait(sequence, timeout=5))
+        self.assertRaises(OSError, group_commit.wait, failed, 5)
+        self.assertEqual(b'ACK; two\n', self.read())
+        group_commit.close()
+
+    def test_stats(self):
+        group_commit = GroupCommit(interval=0.001)
+        group_commit.wait(group_commit.submit(self.file_path, b'ACK; one\n'), timeout=5)
+        group_commit.close()
+
+        stats = group_commit.stats()
+
+        self.assertEqual(1, stats['submitted'])
+        self.assertEqual(1, stats['durable'])
+        self.assertEqual(1, stats['fsyncs'])
+        self.assertEqual(stats['fsync_time'], stats['fsync_max'])
+        self.assertIsNotNone(stats['fsync_p50'])
+
+    def test_after_fork(self):
+        group_commit = GroupCommit(interval=0.001)
+        group_commit.wait(group_commit.submit(self.file_path, 'ACK; one\n'), timeout=5)
+
+        group_commit.after_fork()
+
+        self.assertTrue(group_commit.wait(group_commit.submit(self.file_path, 'ACK; two\n'), timeout=5))
+        self.assertEqual(b'ACK; one\nACK; two\n', self.read())
+        group_commit.close()
@@ -77,21 +77,21 @@ class EncryptionTest(TestCase):
         )
         sign_message.assert_called_once_with(message)
 
-    @mock.patch('tbk.webpay.encryption.Random')
-    def test_get_iv(self, Random):
-        expected = Random.new.return_value.read.return_value
+    @mock.patch('tbk.webpay.encryption.entropy')
+    def test_get_iv(self, entropy):
+        expected = entropy.read.return_value
         encryption = Encryption(self.sender_key, self.recipient_key)
 
         self.assertEqual(encryption.get_iv(), expected)
-        Random.new.return_value.read.assert_called_once_with(16)
+        entropy.read.assert_called_once_with(16)
 
-    @mock.patch('tbk.webpay.encryption.Random')
-    def test_get_key(self, Random):
-        expected = Random.new.return_value.read.return_value
+    @mock.patch('tbk.webpay.encryption.entropy')
+    def test_get_key(self, entropy):
+        expected = entropy.read.return_value
         encryption = Encryption(self.sender_key, self.recipient_key)
 
         self.assertEqual(encryption.get_key(), expected)
-        Random.new.return_value.read.assert_called_once_with(32)
+        entropy.read.assert_called_once_with(32)
 
     def test_encrypt_key(self):
         key = Random.new().read(32)
@@ -131,6 +131,14 @@ class EncryptionTest(TestCase):
 
         self.assertEqual(decrypted, signed_message + message)
 
+    def test_reused_engine(self):
+        encryption = Encryption(self.sender_key, self.recipient_key)
+        decryption = Decryption(self.recipient_key_private, self.sender_key.publickey())
+
+        for message in (b"ACK", b"ERR"):
+            decrypted, _ = decryption.decrypt(encryption.encrypt(message))
+            self.assertEqual(message, decrypted)
+
 
 class DecryptionTest(TestCase):
 
@@ -214,6 +222,12 @@ class DecryptionTest(TestCase):
         six.assertRaisesRegex(self, DecryptionError, "Incorrect message length.",
                                 decryption.decrypt, encrypted)
 
+    def test_init_key_geometry(self):
+        decryption = Decryption(self.recipient_key, self.sender_key)
+
+        self.assertEqual(256, decryption.recipient_key_bytes)
+        self.assertEqual(512, decryption.sender_key_bytes)
+
     def test_get_iv(self):
         decryption = Decryption(self.recipient_key, self.sender_key)
         raw = Random.new().read(2000)
@@ -0,0 +1,107 @@
+import os
+import threading
+from unittest import TestCase, skipUnless
+
+import mock
+
+from tbk.webpay import entropy
+from tbk.webpay.entropy import BufferedRandom
+
+
+class BufferedRandomTest(TestCase):
+
+    def test_read(self):
+        source = BufferedRandom(buffer_size=64)
+
+        first = source.read(32)
+        second = source.read(32)
+
+        self.assertEqual(32, len(first))
+        self.assertNotEqual(first, second)
+        self.assertEqual(1, source.refills)
+
+    @mock.patch('tbk.webpay.entropy.os.urandom', side_effect=lambda size: b'\x01' * size)
+    def test_refill(self, urandom):
+        source = BufferedRandom(buffer_size=64)
+
+        source.read(48)
+        source.read(32)
+
+        self.assertEqual([mock.call(64), mock.call(64)], urandom.call_args_list)
+        self.assertEqual(2, source.refills)
+
+    @mock.patch('tbk.webpay.entropy.os.urandom', side_effect=lambda size: b'\x01' * size)
+    def test_read_larger_than_buffer(self, urandom):
+        source = BufferedRandom(buffer_size=16)
+
+        self.assertEqual(b'\x01' * 32, source.read(32))
+
+        urandom.assert_called_once_with(32)
+        self.assertEqual(0, source.refills)
+
+    def test_reseed_in_other_process(self):
+        source = BufferedRandom()
+        source.read(16)
+
+        with mock.patch('tbk.webpay.entropy.os.getpid', return_value=-1):
+            source.read(16)
+
+        self.assertEqual(2, source.refills)
+
+    def test_after_fork(self):
+        source = BufferedRandom()
+        source.read(16)
+
+        source.after_fork()
+        source.read(16)
+
+        self.assertEqual(2, source.refills)
+
+    def test_randint(self):
+        source = BufferedRandom()
+
+        values = [source.randint(0, 9) for _ in range(1000)]
+
+        self.assertEqual(set(range(10)), set(values))
+        self.assertEqual(5, source.randint(5, 5))
+        self.assertRaises(ValueError, source.randint, 1, 0)
+
+    def test_randint_transaction_id(self):
+        value = entropy.randint(0, 10000000000 - 1)
+
+        self.assertTrue(0 <= value < 10000000000)
+
+    def test_threads(self):
+        source = BufferedRandom(buffer_size=256)
+        chunks = []
+
+        def work():
+            chunks.extend(source.read(16) for _ in range(100))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(400, len(set(chunks)))
+
+    @skipUnless(hasattr(os, 'fork'), "needs os.fork")
+    def test_fork(self):
+        source = BufferedRandom()
+        source.read(16)
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_fd, source.read(32))
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        child = os.read(read_fd, 32)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(32, len(child))
+        self.assertNotEqual(source.read(32), child)
@@ -0,0 +1,134 @@
+import base64
+from unittest import TestCase
+
+import six
+import mock
+from Crypto.PublicKey import RSA
+
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.encryption import Encryption, InvalidMessageException, DecryptionError
+from tbk.webpay.executor import CryptoExecutor
+from tbk.webpay.confirmation import Confirmation
+from tbk.webpay.keys import StaticKeySource
+
+FORGED_SENDER_KEY = RSA.generate(4096)
+NEW_KEY = RSA.generate(2048)
+
+
+class CryptoExecutorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.commerce = Commerce(testing=True)
+        cls.executor = CryptoExecutor(cls.commerce, processes=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.close()
+
+    def test_init(self):
+        self.assertEqual(self.commerce, self.executor.commerce)
+        self.assertEqual(1, self.executor.processes)
+
+    def test_webpay_encrypt(self):
+        encrypted = self.executor.webpay_encrypt('ACK')
+
+        self.assertIsInstance(encrypted, six.binary_type)
+        self.assertNotEqual(self.commerce.webpay_encrypt('ACK'), encrypted)
+
+    def test_webpay_decrypt_invalid_signature(self):
+        """
+        Executor raises the same InvalidMessageException of the inline path
+        """
+        encryption = Encryption(FORGED_SENDER_KEY, self.commerce.get_commerce_key().publickey())
+        encrypted = encryption.encrypt(b'TBK_RESPUESTA=0')
+
+        six.assertRaisesRegex(self, InvalidMessageException, "Invalid message signature",
+                              self.commerce.webpay_decrypt, encrypted)
+        six.assertRaisesRegex(self, InvalidMessageException, "Invalid message signature",
+                              self.executor.webpay_decrypt, encrypted)
+
+    def test_webpay_decrypt_incorrect_length(self):
+        """
+        Executor raises the same DecryptionError of the inline path
+        """
+        encrypted = base64.b64encode(b'ERROR=1' * 10)
+
+        six.assertRaisesRegex(self, DecryptionError, "Incorrect message length.",
+                              self.commerce.webpay_decrypt, encrypted)
+        six.assertRaisesRegex(self, DecryptionError, "Incorrect message length.",
+                              self.executor.webpay_decrypt, encrypted)
+
+    def test_commerce_dispatch(self):
+        commerce = Commerce(testing=True)
+        executor = mock.Mock()
+        commerce.set_crypto_executor(executor)
+
+        self.assertEqual(executor.webpay_decrypt.return_value, commerce.webpay_decrypt('encrypted'))
+        self.assertEqual(executor.webpay_encrypt.return_value, commerce.webpay_encrypt('decrypted'))
+        executor.webpay_decrypt.assert_called_once_with('encrypted')
+        executor.webpay_encrypt.assert_called_once_with('decrypted')
+
+    def test_commerce_dispatch_previous_key(self):
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY, grace_period=60)
+        commerce = Commerce(testing=True, key_source=source)
+        executor = mock.Mock()
+        executor.webpay_decrypt.side_effect = [DecryptionError("Incorrect message length."), 'decrypted']
+        commerce.set_crypto_executor(executor)
+        source.set_pem(NEW_KEY.exportKey().decode('ascii'))
+
+        self.assertEqual('decrypted', commerce.webpay_decrypt('encrypted'))
+        executor.set_keys.assert_called_once_with(source.pem, Commerce.TEST_COMMERCE_KEY)
+        executor.webpay_decrypt.assert_called_with('encrypted', previous=True)
+
+    @mock.patch('tbk.webpay.confirmation.logger')
+    @mock.patch('tbk.webpay.confirmation.ConfirmationPayload')
+    def test_confirmation_from_executor_previous_key(self, ConfirmationPayload, logger):
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY, grace_period=60)
+        executor = mock.Mock()
+        executor.commerce = Commerce(testing=True, key_source=source)
+        executor.webpay_decrypt.side_effect = [DecryptionError("Incorrect message length."),
+                                               ('TBK_RESPUESTA=0', 'signature')]
+        source.set_pem(NEW_KEY.exportKey().decode('ascii'))
+
+        Confirmation.from_executor(executor, '123.123.123.123', {'TBK_PARAM': 'encrypted'})
+
+        executor.webpay_decrypt.assert_called_with('encrypted', previous=True)
+        ConfirmationPayload.from_params.assert_called_once_with('TBK_RESPUESTA=0', 'signature')
+
+    def test_key_rotation(self):
+        """
+        Rotation reaches the workers, which also decrypt with the previous key
+        """
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY, grace_period=60)
+        commerce = Commerce(testing=True, key_source=source)
+        old_key = source.key
+
+        with CryptoExecutor(commerce, processes=1) as executor:
+            commerce.set_crypto_executor(executor)
+            source.set_pem(NEW_KEY.exportKey().decode('ascii'))
+
+            encrypted = Encryption(FORGED_SENDER_KEY, NEW_KEY.publickey()).encrypt(b'TBK_RESPUESTA=0')
+            previous = Encryption(FORGED_SENDER_KEY, old_key.publickey()).encrypt(b'TBK_RESPUESTA=0')
+
+            # Only the forged signature fails, so the session key was decrypted.
+            six.assertRaisesRegex(self, InvalidMessageException, "Invalid message signature",
+                                  executor.webpay_decrypt, encrypted)
+            six.assertRaisesRegex(self, DecryptionError, "Incorrect message length.",
+                                  executor.webpay_decrypt, previous)
+            six.assertRaisesRegex(self, InvalidMessageException, "Invalid message signature",
+                                  commerce.webpay_decrypt, previous)
+
+    @mock.patch('tbk.webpay.confirmation.logger')
+    @mock.patch('tbk.webpay.confirmation.ConfirmationPayload')
+    def test_confirmation_from_executor(self, ConfirmationPayload, logger):
+        executor = mock.Mock()
+        executor.commerce = Commerce(testing=True)
+        executor.webpay_decrypt.return_value = ('TBK_RESPUESTA=0', 'signature')
+        data = {'TBK_PARAM': 'encrypted'}
+
+        confirmation = Confirmation.from_executor(executor, '123.123.123.123', data)
+
+        self.assertEqual(executor.commerce, confirmation.commerce)
+        executor.webpay_decrypt.assert_called_once_with('encrypted')
+        ConfirmationPayload.from_params.assert_called_once_with('TBK_RESPUESTA=0', 'signature')
@@ -0,0 +1,158 @@
+import gc
+import os
+import time
+import signal
+import weakref
+import threading
+from unittest import TestCase, skipUnless
+
+import mock
+
+from tbk.webpay import fork
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.executor import CryptoExecutor
+
+
+class ForkTest(TestCase):
+
+    def setUp(self):
+        # Finalize pools of earlier tests before os.getpid is patched, multiprocessing
+        # checks it when they are collected.
+        gc.collect()
+        patches = [
+            mock.patch.object(fork, '_callbacks', []),
+            mock.patch.object(fork, '_objects', weakref.WeakSet()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        fork._pid = os.getpid()
+
+    @mock.patch('tbk.webpay.fork.os.getpid', return_value=-1)
+    def test_after_fork(self, getpid):
+        callback = fork.register(mock.Mock())
+        obj = fork.track(mock.Mock())
+
+        self.assertTrue(fork.after_fork())
+        self.assertFalse(fork.after_fork())
+
+        callback.assert_called_once_with()
+        obj.after_fork.assert_called_once_with()
+
+    def test_after_fork_same_process(self):
+        callback = fork.register(mock.Mock())
+
+        self.assertFalse(fork.after_fork())
+
+        self.assertFalse(callback.called)
+
+    @mock.patch('tbk.webpay.fork.os.getpid', return_value=-1)
+    def test_track_is_weak(self, getpid):
+        calls = []
+
+        class Tracked(object):
+            def after_fork(self):
+                calls.append(self)
+
+        fork.track(Tracked())
+        fork.after_fork()
+
+        self.assertEqual([], calls)
+
+
+class CommerceWarmupTest(TestCase):
+
+    def setUp(self):
+        self.commerce = Commerce(testing=True)
+
+    def tearDown(self):
+        self.commerce.disable_response_pool()
+        fork._pid = os.getpid()
+
+    def pool_running(self):
+        return any(thread.name == 'tbk-response-pool' for thread in threading.enumerate())
+
+    @mock.patch('tbk.webpay.commerce.get_default_session')
+    def test_warmup(self, get_default_session):
+        self.assertIs(self.commerce, self.commerce.warmup())
+
+        with mock.patch('tbk.webpay.commerce.RSA.importKey') as importKey:
+            with mock.patch('tbk.webpay.commerce.Encryption') as Encryption:
+                self.commerce.get_encryption()
+                self.commerce.get_decryption()
+        self.assertFalse(importKey.called)
+        self.assertFalse(Encryption.called)
+        get_default_session.assert_called_once_with()
+
+    @mock.patch('tbk.webpay.commerce.get_default_session')
+    def test_warmup_own_session(self, get_default_session):
+        self.commerce.http_session = mock.Mock()
+
+        self.commerce.warmup()
+
+        self.assertFalse(get_default_session.called)
+
+    def test_after_fork_drops_responses(self):
+        pool = self.commerce.enable_response_pool(size=2)
+        pool.stop()
+        pool.fill()
+
+        self.commerce.after_fork()
+
+        self.assertEqual(0, pool.depth('ACK'))
+        self.assertIsNone(pool._thread)
+
+    @skipUnless(hasattr(os, 'register_at_fork'), "needs os.register_at_fork")
+    def test_fork(self):
+        pool = self.commerce.enable_response_pool(size=2)
+        deadline = time.time() + 5
+        while (pool.depth('ACK') < 2 or pool.depth('ERR') < 2) and time.time() < deadline:
+            time.sleep(0.01)
+        inherited = [response for _, response in pool.responses['ACK']]
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                started = self.pool_running()
+                reused = self.commerce.acknowledge in inherited
+                state = (started, reused, self.pool_running())
+                os.write(write_fd, ' '.join(str(value) for value in state).encode('ascii'))
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        result = os.read(read_fd, 64)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        # Not started by the fork, fresh responses and started by the first use.
+        self.assertEqual(b'False False True', result)
+        self.assertEqual(inherited, [response for _, response in pool.responses['ACK']])
+
+    @skipUnless(hasattr(os, 'register_at_fork'), "needs os.register_at_fork")
+    def test_fork_crypto_executor(self):
+        executor = CryptoExecutor(self.commerce, processes=1)
+        self.addCleanup(executor.close)
+        self.commerce.set_crypto_executor(executor)
+        self.commerce.webpay_encrypt('ACK')
+        inherited = executor.pool
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                signal.alarm(10)
+                self.commerce.webpay_encrypt('ACK')
+                os.write(write_fd, b'inherited' if executor.pool is inherited else b'own')
+                executor.close()
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        result = os.read(read_fd, 64)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(b'own', result)
+        self.assertIs(inherited, executor.pool)
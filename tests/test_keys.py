@@ -0,0 +1,178 @@
+import os
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+
+import mock
+from Crypto.PublicKey import RSA
+
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.encryption import Encryption, DecryptionError
+from tbk.webpay.keys import StaticKeySource, FileKeySource
+
+NEW_KEY = RSA.generate(2048)
+NEW_PEM = NEW_KEY.exportKey().decode('ascii')
+WEBPAY_PRIVATE_KEY = RSA.generate(2048)
+
+
+class StaticKeySourceTest(TestCase):
+
+    def test_key(self):
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY)
+
+        self.assertEqual(Commerce.TEST_COMMERCE_KEY, source.pem)
+        self.assertEqual(RSA.importKey(Commerce.TEST_COMMERCE_KEY), source.key)
+        self.assertIsNone(source.previous_key)
+        self.assertEqual(1, source.version)
+
+    @mock.patch('tbk.webpay.keys.clock')
+    def test_rotation_grace_period(self, clock):
+        clock.monotonic.return_value = 100.0
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY, grace_period=60)
+        old_key = source.key
+
+        source.set_pem(NEW_PEM)
+
+        self.assertEqual(NEW_KEY, source.key)
+        self.assertIs(old_key, source.previous_key)
+        self.assertEqual(2, source.version)
+        clock.monotonic.return_value = 161.0
+        self.assertIsNone(source.previous_key)
+
+    def test_invalid_pem_keeps_key(self):
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY)
+        key = source.key
+
+        self.assertRaises(ValueError, source.set_pem, 'not a key')
+
+        self.assertIs(key, source.key)
+        self.assertEqual(1, source.version)
+
+    def test_listener(self):
+        source = StaticKeySource(Commerce.TEST_COMMERCE_KEY)
+        listener = mock.Mock()
+        source.add_listener(listener)
+
+        source.set_pem(NEW_PEM)
+
+        listener.assert_called_once_with(source)
+
+
+class FileKeySourceTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.key_path = os.path.join(self.path, 'commerce.pem')
+        self.write(self.key_path, Commerce.TEST_COMMERCE_KEY)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, file_path, pem, mtime=None):
+        with open(file_path, 'w') as key_file:
+            key_file.write(pem)
+        if mtime is not None:
+            os.utime(file_path, (mtime, mtime))
+
+    def test_file(self):
+        source = FileKeySource(self.key_path)
+
+        self.assertEqual(Commerce.TEST_COMMERCE_KEY, source.pem)
+        self.assertFalse(source.check())
+
+        self.write(self.key_path, NEW_PEM)
+
+        self.assertTrue(source.check())
+        self.assertEqual(NEW_KEY, source.key)
+
+    def test_invalid_file_keeps_key(self):
+        source = FileKeySource(self.key_path)
+
+        self.write(self.key_path, 'not a key')
+
+        self.assertFalse(source.check())
+        self.assertIsInstance(source.error, ValueError)
+        self.assertEqual(Commerce.TEST_COMMERCE_KEY, source.pem)
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, FileKeySource, os.path.join(self.path, 'missing.pem'))
+
+    def test_directory(self):
+        self.write(self.key_path, Commerce.TEST_COMMERCE_KEY, mtime=1000)
+        source = FileKeySource(self.path)
+        self.assertEqual(Commerce.TEST_COMMERCE_KEY, source.pem)
+
+        self.write(os.path.join(self.path, 'commerce.2.pem'), NEW_PEM, mtime=2000)
+
+        self.assertTrue(source.check())
+        self.assertEqual(NEW_PEM, source.pem)
+
+    def test_empty_directory(self):
+        os.remove(self.key_path)
+
+        self.assertRaises(ValueError, FileKeySource, self.path)
+
+    def test_watch(self):
+        source = FileKeySource(self.key_path, interval=0.01)
+        source.start()
+        self.addCleanup(source.stop)
+
+        self.write(self.key_path, NEW_PEM)
+
+        deadline = time.time() + 5
+        while source.version < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(NEW_PEM, source.pem)
+
+
+@mock.patch('tbk.webpay.commerce.Commerce.get_webpay_key', return_value=WEBPAY_PRIVATE_KEY.publickey())
+class CommerceKeySourceTest(TestCase):
+
+    def setUp(self):
+        self.source = StaticKeySource(Commerce.TEST_COMMERCE_KEY, grace_period=60)
+        self.commerce = Commerce(id='597026007976', key_source=self.source)
+
+    def encrypt(self, key, message=b'TBK_RESPUESTA=0'):
+        return Encryption(WEBPAY_PRIVATE_KEY, key.publickey()).encrypt(message)
+
+    def test_key(self, get_webpay_key):
+        self.assertEqual(Commerce.TEST_COMMERCE_KEY, self.commerce.key)
+        self.assertIs(self.source.key, self.commerce.get_commerce_key())
+
+    def test_rotation(self, get_webpay_key):
+        decryption = self.commerce.get_decryption()
+        self.commerce.response_pool = mock.Mock()
+
+        self.source.set_pem(NEW_PEM)
+
+        self.assertEqual(NEW_PEM, self.commerce.key)
+        self.assertIsNot(decryption, self.commerce.get_decryption())
+        self.assertIs(self.source.key, self.commerce.get_decryption().recipient_key)
+        self.commerce.response_pool.clear.assert_called_once_with()
+
+    def test_rotation_prebuilds_engines(self, get_webpay_key):
+        self.source.set_pem(NEW_PEM)
+
+        with mock.patch('tbk.webpay.commerce.Decryption') as Decryption:
+            self.commerce.get_decryption()
+
+        self.assertFalse(Decryption.called)
+
+    def test_decrypt_previous_key(self, get_webpay_key):
+        old_key = self.source.key
+        self.source.set_pem(NEW_PEM)
+
+        message, _ = self.commerce.webpay_decrypt(self.encrypt(old_key))
+
+        self.assertEqual(b'TBK_RESPUESTA=0', message)
+        self.assertEqual(b'TBK_RESPUESTA=0', self.commerce.webpay_decrypt(self.encrypt(NEW_KEY))[0])
+
+    @mock.patch('tbk.webpay.keys.clock')
+    def test_decrypt_previous_key_expired(self, clock, get_webpay_key):
+        clock.monotonic.return_value = 100.0
+        old_key = self.source.key
+        self.source.set_pem(NEW_PEM)
+        clock.monotonic.return_value = 161.0
+
+        self.assertRaises(DecryptionError, self.commerce.webpay_decrypt, self.encrypt(old_key))
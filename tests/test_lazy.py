@@ -0,0 +1,57 @@
+import sys
+import subprocess
+from unittest import TestCase
+
+from tbk.webpay.lazy import LazyModule, lazy_import
+
+HEAVY_MODULES = ('requests', 'pytz', 'Crypto')
+
+LOADED_SCRIPT = '''
+import sys
+import %s
+print(' '.join(sorted(set(name.split('.')[0] for name in sys.modules) & set(%r))))
+'''
+
+
+class LazyModuleTest(TestCase):
+
+    def test_loads_on_access(self):
+        sys.modules.pop('colorsys', None)
+        module = LazyModule('colorsys')
+
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertFalse(module.loaded)
+        self.assertEqual((0.0, 0.0, 0.0), module.rgb_to_hsv(0, 0, 0))
+        self.assertTrue(module.loaded)
+        self.assertIs(sys.modules['colorsys'].rgb_to_hsv, module.rgb_to_hsv)
+
+    def test_missing_module(self):
+        module = LazyModule('tbk.webpay.missing')
+
+        self.assertRaises(ImportError, getattr, module, 'anything')
+
+    def test_attribute_shadows_module(self):
+        module = LazyModule('colorsys')
+        module.rgb_to_hsv = 'patched'
+
+        self.assertEqual('patched', module.rgb_to_hsv)
+
+    def test_lazy_import_loaded_module(self):
+        self.assertIs(sys, lazy_import('sys'))
+
+
+class StartupTest(TestCase):
+
+    def loaded(self, module):
+        output = subprocess.check_output(
+            [sys.executable, '-c', LOADED_SCRIPT % (module, HEAVY_MODULES)], universal_newlines=True)
+        return output.split()
+
+    def test_confirmation(self):
+        self.assertEqual([], self.loaded('tbk.webpay.confirmation'))
+
+    def test_payment(self):
+        self.assertEqual([], self.loaded('tbk.webpay.payment'))
+
+    def test_logging(self):
+        self.assertEqual([], self.loaded('tbk.webpay.logging.official'))
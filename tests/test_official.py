@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.clock import clock
+from tbk.webpay.confirmation import ConfirmationPayload
+from tbk.webpay.logging.atomic import AppendFile
+from tbk.webpay.logging.official import WebpayOfficialHandler
+
+# 2015-01-23 15:09:59 at America/Santiago
+TIMESTAMP = 1422036599
+
+PAYMENT_EVENT = {
+    'date': '23012015',
+    'time': '150959',
+    'pid': 12345,
+    'commerce_id': '597026007976',
+    'transaction_id': 123456789,
+    'request_ip': '123.123.123.123',
+    'token': 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228',
+    'webpay_server': 'https://certificacion.webpay.cl',
+}
+
+CONFIRMATION_DATA = {
+    'TBK_CODIGO_AUTORIZACION': '001882',
+    'TBK_FECHA_CONTABLE': '0123',
+    'TBK_FECHA_TRANSACCION': '0123',
+    'TBK_FINAL_NUMERO_TARJETA': '9509',
+    'TBK_HORA_TRANSACCION': '150959',
+    'TBK_ID_SESION': '430c2c85',
+    'TBK_ID_TRANSACCION': '2164532727',
+    'TBK_MONTO': '10000',
+    'TBK_NUMERO_CUOTAS': '0',
+    'TBK_ORDEN_COMPRA': '3244',
+    'TBK_RESPUESTA': '0',
+    'TBK_TIPO_PAGO': 'VD',
+    'TBK_TIPO_TRANSACCION': 'TR_NORMAL',
+    'TBK_VCI': 'TSY',
+    'TBK_MAC': 'signature',
+}
+
+
+class WebpayOfficialHandlerTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.time = mock.Mock(return_value=TIMESTAMP)
+        clock.set_backend(time_func=self.time)
+        self.handler = WebpayOfficialHandler(self.path)
+
+    def tearDown(self):
+        self.handler.close()
+        clock.set_backend()
+        shutil.rmtree(self.path)
+
+    def read(self, file_name):
+        with open(os.path.join(self.path, file_name)) as log_file:
+            return log_file.read()
+
+    def test_event_payment(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        lines = self.read('TBK_EVN20150123.log').splitlines()
+        self.assertEqual(14, len(lines))
+        self.assertTrue(lines[11].endswith(';Token=%s' % PAYMENT_EVENT['token']))
+
+    def test_log_confirmation(self):
+        self.handler.log_confirmation(payload=ConfirmationPayload(CONFIRMATION_DATA), commerce_id='597026007976')
+
+        journal = self.read('tbk_bitacora_TR_NORMAL_0123.log')
+        self.assertTrue(journal.startswith('ACK; TBK_ORDEN_COMPRA=3244; TBK_CODIGO_COMERCIO=597026007976;'))
+        self.assertTrue(journal.endswith('TBK_MAC=signature\n'))
+
+    def test_log_file_kept_open(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+        events_log_file = self.handler.events_log_file
+
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.assertIs(events_log_file, self.handler.events_log_file)
+        self.assertFalse(events_log_file.closed)
+        self.assertEqual(28, len(self.read('TBK_EVN20150123.log').splitlines()))
+
+    def test_log_file_rotation(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+        events_log_file = self.handler.events_log_file
+
+        self.time.return_value = TIMESTAMP + 24 * 60 * 60
+        self.handler.event_payment(**dict(PAYMENT_EVENT, date='24012015'))
+
+        self.assertTrue(events_log_file.closed)
+        self.assertEqual(14, len(self.read('TBK_EVN20150123.log').splitlines()))
+        self.assertEqual(14, len(self.read('TBK_EVN20150124.log').splitlines()))
+
+    def test_event_file_is_event_date(self):
+        self.time.return_value = TIMESTAMP + 24 * 60 * 60
+
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.assertEqual(['TBK_EVN20150123.log'], os.listdir(self.path))
+
+    def test_close(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+        events_log_file = self.handler.events_log_file
+
+        self.handler.close()
+
+        self.assertTrue(events_log_file.closed)
+        self.assertEqual({}, self.handler.files)
+
+    def test_write_records(self):
+        records = [
+            self.handler.format('event_payment', **PAYMENT_EVENT),
+            self.handler.format('log_confirmation', payload=ConfirmationPayload(CONFIRMATION_DATA),
+                                commerce_id='597026007976'),
+            self.handler.format('event_payment', **PAYMENT_EVENT),
+        ]
+
+        self.handler.write_records(records)
+
+        self.assertEqual(('TBK_EVN%s.log', 'TBK_EVN20150123.log'), records[0][:2])
+        self.assertEqual(28, len(self.read('TBK_EVN20150123.log').splitlines()))
+        self.assertEqual(1, len(self.read('tbk_bitacora_TR_NORMAL_0123.log').splitlines()))
+
+    def test_group_commit(self):
+        self.handler = WebpayOfficialHandler(self.path, group_commit=True)
+
+        sequence = self.handler.log_confirmation(
+            payload=ConfirmationPayload(CONFIRMATION_DATA), commerce_id='597026007976')
+
+        self.assertEqual(1, sequence)
+        self.assertTrue(self.handler.wait_durable(sequence, timeout=5))
+        self.assertEqual(1, len(self.read('tbk_bitacora_TR_NORMAL_0123.log').splitlines()))
+        self.assertEqual(1, self.handler.group_commit.fsyncs)
+
+    def test_wait_durable_without_group_commit(self):
+        self.assertIsNone(self.handler.log_confirmation(
+            payload=ConfirmationPayload(CONFIRMATION_DATA), commerce_id='597026007976'))
+        self.assertTrue(self.handler.wait_durable())
+
+    def test_write_mode_atomic(self):
+        self.handler = WebpayOfficialHandler(self.path, write_mode='atomic')
+
+        self.handler.event_payment(**PAYMENT_EVENT)
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.assertIsInstance(self.handler.events_log_file, AppendFile)
+        self.assertFalse(self.handler.events_log_file.lock)
+        self.assertEqual(28, len(self.read('TBK_EVN20150123.log').splitlines()))
+
+    def test_write_mode_locked(self):
+        self.handler = WebpayOfficialHandler(self.path, write_mode='locked')
+
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.assertTrue(self.handler.events_log_file.lock)
+        self.assertEqual(14, len(self.read('TBK_EVN20150123.log').splitlines()))
+
+    def test_write_mode_sharded(self):
+        self.handler = WebpayOfficialHandler(self.path, write_mode='sharded')
+
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.assertEqual(['TBK_EVN20150123.log.%d' % os.getpid()], os.listdir(self.path))
+
+    def test_write_mode_invalid(self):
+        self.assertRaises(ValueError, WebpayOfficialHandler, self.path, write_mode='random')
+
+    @mock.patch('tbk.webpay.logging.atomic.os.getpid', return_value=4242)
+    def test_after_fork_sharded(self, getpid):
+        self.handler = WebpayOfficialHandler(self.path, write_mode='sharded')
+        self.handler.event_payment(**PAYMENT_EVENT)
+        getpid.return_value = 4343
+
+        self.handler.after_fork()
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.assertEqual(
+            ['TBK_EVN20150123.log.4242', 'TBK_EVN20150123.log.4343'], sorted(os.listdir(self.path)))
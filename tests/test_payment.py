@@ -1,14 +1,19 @@
 import os
 import sys
+import time
+import threading
 from decimal import Decimal, ROUND_DOWN
 from unittest import TestCase
 
 import six
 import mock
+import requests
 
 from tbk.webpay import TBK_VERSION_KCC
-from tbk.webpay.payment import Payment, PaymentError
+from tbk.webpay.payment import Payment, PaymentError, RawParamsBuilder, fetch_tokens
 from tbk.webpay.encryption import DecryptionError
+from tbk.webpay.policy import FetchPolicy
+from tbk.webpay.session import RedirectCache
 
 RESPONSE_WITH_ERROR = '''
 <HTML>
@@ -175,10 +180,10 @@ class PaymentTest(TestCase):
         self.assertFalse(fetch_token.called)
         self.assertFalse(logger.payment.called)
 
-    @mock.patch('tbk.webpay.payment.requests')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
     @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
     @mock.patch('tbk.webpay.payment.Payment.params')
-    def test_fetch_token(self, params, get_validation_url, requests):
+    def test_fetch_token(self, params, get_validation_url, get_http_session):
         """
         payment.fetch_token must post data to get_validation_url and get token from response
         """
@@ -189,7 +194,7 @@ class PaymentTest(TestCase):
         }
         commerce = self.payment_kwargs['commerce']
         payment = Payment(**self.payment_kwargs)
-        response = requests.post.return_value
+        response = get_http_session.return_value.post.return_value
         response.status_code = 200
         response.is_redirect = False
         decrypted = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
@@ -198,7 +203,7 @@ class PaymentTest(TestCase):
 
         token = payment.fetch_token()
 
-        requests.post.assert_called_once_with(
+        get_http_session.return_value.post.assert_called_once_with(
             get_validation_url.return_value,
             data={
                 'TBK_VERSION_KCC': TBK_VERSION_KCC,
@@ -209,16 +214,17 @@ class PaymentTest(TestCase):
             headers={
                 'User-Agent': user_agent
             },
-            allow_redirects=False
+            allow_redirects=False,
+            timeout=(3.05, 10.0)
         )
         commerce.webpay_decrypt.assert_called_once_with(response.content)
 
         self.assertEqual(token, 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228')
 
-    @mock.patch('tbk.webpay.payment.requests')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
     @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
     @mock.patch('tbk.webpay.payment.Payment.params')
-    def test_fetch_token_with_redirect(self, params, get_validation_url, requests):
+    def test_fetch_token_with_redirect(self, params, get_validation_url, get_http_session):
         """
         payment.fetch_token must post data to get_validation_url and get token from response after redirect.
         """
@@ -230,7 +236,7 @@ class PaymentTest(TestCase):
         response2 = mock.Mock()
         response2.is_redirect = False
         response2.status_code = 200
-        requests.post.side_effect = [response1, response2]
+        get_http_session.return_value.post.side_effect = [response1, response2]
         decrypted = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
         signature = "signature" * 20
         commerce.webpay_decrypt.return_value = decrypted, signature
@@ -241,15 +247,15 @@ class PaymentTest(TestCase):
 
         self.assertEqual(token, 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228')
 
-    @mock.patch('tbk.webpay.payment.requests')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
     @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
     @mock.patch('tbk.webpay.payment.Payment.params')
-    def test_fetch_token_not_ok(self, params, get_validation_url, requests):
+    def test_fetch_token_not_ok(self, params, get_validation_url, get_http_session):
         """
         payment.fetch_token must post data to get_validation_url and fail when status_code is not 200
         """
         payment = Payment(**self.payment_kwargs)
-        response = requests.post.return_value
+        response = get_http_session.return_value.post.return_value
         response.status_code = 500
         response.is_redirect = False
 
@@ -258,15 +264,15 @@ class PaymentTest(TestCase):
             payment.fetch_token
         )
 
-    @mock.patch('tbk.webpay.payment.requests')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
     @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
     @mock.patch('tbk.webpay.payment.Payment.params')
-    def test_fetch_token_with_error(self, params, get_validation_url, requests):
+    def test_fetch_token_with_error(self, params, get_validation_url, get_http_session):
         """
         payment.fetch_token must post data to get_validation_url and fail with ERROR code
         """
         payment = Payment(**self.payment_kwargs)
-        response = requests.post.return_value
+        response = get_http_session.return_value.post.return_value
         response.is_redirect = False
         response.status_code = 200
         commerce = self.payment_kwargs['commerce']
@@ -279,15 +285,15 @@ class PaymentTest(TestCase):
             payment.fetch_token
         )
 
-    @mock.patch('tbk.webpay.payment.requests')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
     @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
     @mock.patch('tbk.webpay.payment.Payment.params')
-    def test_fetch_token_with_unapproved_key(self, params, get_validation_url, requests):
+    def test_fetch_token_with_unapproved_key(self, params, get_validation_url, get_http_session):
         """
         payment.fetch_token must post data to get_validation_url and fail when cannot decrypt with ERROR code
         """
         payment = Payment(**self.payment_kwargs)
-        response = requests.post.return_value
+        response = get_http_session.return_value.post.return_value
         response.is_redirect = False
         response.status_code = 200
         response.content = RESPONSE_WITH_ERROR
@@ -300,15 +306,15 @@ class PaymentTest(TestCase):
         )
 
     @mock.patch('tbk.webpay.payment.get_token_from_body')
-    @mock.patch('tbk.webpay.payment.requests')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
     @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
     @mock.patch('tbk.webpay.payment.Payment.params')
-    def test_fetch_token_with_suspicios_message(self, params, get_validation_url, requests, get_token_from_body):
+    def test_fetch_token_with_suspicios_message(self, params, get_validation_url, get_http_session, get_token_from_body):
         """
         payment.fetch_token must post data to get_validation_url and fail when cannot decrypt with ERROR code
         """
         payment = Payment(**self.payment_kwargs)
-        response = requests.post.return_value
+        response = get_http_session.return_value.post.return_value
         response.is_redirect = False
         response.status_code = 200
         response.content = "I'm suspicious..."
@@ -321,6 +327,171 @@ class PaymentTest(TestCase):
             payment.fetch_token
         )
 
+    @mock.patch('tbk.webpay.payment.time.sleep')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_retry(self, params, get_http_session, sleep):
+        """
+        payment.fetch_token retries connection errors and records every attempt
+        """
+        commerce = self.payment_kwargs['commerce']
+        self.payment_kwargs['fetch_policy'] = FetchPolicy(retries=2, backoff=0.5)
+        payment = Payment(**self.payment_kwargs)
+        response = mock.Mock(status_code=200, is_redirect=False)
+        get_http_session.return_value.post.side_effect = [requests.exceptions.ConnectionError, response]
+        decrypted = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
+        commerce.webpay_decrypt.return_value = decrypted, "signature"
+
+        token = payment.fetch_token()
+
+        self.assertEqual(token, 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228')
+        self.assertEqual(1, sleep.call_count)
+        self.assertTrue(0 <= sleep.call_args[0][0] <= 0.5)
+        self.assertEqual(2, len(payment.attempts))
+        self.assertIsInstance(payment.attempts[0].error, requests.exceptions.ConnectionError)
+        self.assertEqual(200, payment.attempts[1].status_code)
+
+    @mock.patch('tbk.webpay.payment.time.sleep')
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_retries_exhausted(self, params, get_http_session, sleep):
+        """
+        payment.fetch_token fails with PaymentError when retries are exhausted
+        """
+        self.payment_kwargs['fetch_policy'] = FetchPolicy(retries=1)
+        payment = Payment(**self.payment_kwargs)
+        get_http_session.return_value.post.side_effect = requests.exceptions.Timeout("read timeout")
+
+        six.assertRaisesRegex(self, PaymentError, "Payment token generation failed: read timeout",
+                              payment.fetch_token)
+        self.assertEqual(2, len(payment.attempts))
+
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_too_many_redirects(self, params, get_http_session):
+        """
+        payment.fetch_token follows at most max_redirects hops
+        """
+        self.payment_kwargs['fetch_policy'] = FetchPolicy(max_redirects=2)
+        payment = Payment(**self.payment_kwargs)
+        get_http_session.return_value.post.return_value = mock.Mock(status_code=302, is_redirect=True)
+
+        six.assertRaisesRegex(self, PaymentError, "too many redirects", payment.fetch_token)
+        self.assertEqual(3, get_http_session.return_value.post.call_count)
+
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_budget_exhausted(self, params, get_http_session):
+        """
+        payment.fetch_token doesn't make requests after the latency budget
+        """
+        self.payment_kwargs['fetch_policy'] = FetchPolicy(budget=0)
+        payment = Payment(**self.payment_kwargs)
+
+        six.assertRaisesRegex(self, PaymentError, "latency budget exhausted", payment.fetch_token)
+        self.assertFalse(get_http_session.return_value.post.called)
+
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_hedged(self, params, get_http_session):
+        """
+        payment.fetch_token sends a hedged request when the first is slower than hedge_delay
+        """
+        commerce = self.payment_kwargs['commerce']
+        self.payment_kwargs['fetch_policy'] = FetchPolicy(hedge_percentile=95, hedge_delay=0.01)
+        payment = Payment(**self.payment_kwargs)
+        slow = threading.Event()
+        fast_response = mock.Mock(status_code=200, is_redirect=False)
+
+        def post(url, **kwargs):
+            if not slow.is_set():
+                slow.set()
+                time.sleep(0.5)
+                return mock.Mock(status_code=500, is_redirect=False)
+            return fast_response
+        get_http_session.return_value.post.side_effect = post
+        decrypted = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
+        commerce.webpay_decrypt.return_value = decrypted, "signature"
+
+        token = payment.fetch_token()
+
+        self.assertEqual(token, 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228')
+        self.assertTrue(payment.attempts[0].hedged)
+
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_redirect_cached(self, params, get_http_session):
+        """
+        payment.fetch_token goes straight to the final URL of a previous redirect chain
+        """
+        commerce = self.payment_kwargs['commerce']
+        cache = RedirectCache()
+        post = get_http_session.return_value.post
+        redirect = mock.Mock(status_code=302, is_redirect=True, headers={'location': 'https://final/'})
+        response = mock.Mock(status_code=200, is_redirect=False)
+        post.side_effect = [redirect, response, response]
+        decrypted = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
+        commerce.webpay_decrypt.return_value = decrypted, "signature"
+
+        for _ in range(2):
+            payment = Payment(**self.payment_kwargs)
+            payment.redirect_cache = cache
+            payment.fetch_token()
+
+        self.assertEqual('https://final/', cache.get((commerce.id, commerce.testing)))
+        self.assertEqual(['https://final/'], [attempt.url for attempt in payment.attempts])
+        self.assertEqual(3, post.call_count)
+
+    @mock.patch('tbk.webpay.payment.Payment.get_http_session')
+    @mock.patch('tbk.webpay.payment.Payment.get_validation_url')
+    @mock.patch('tbk.webpay.payment.Payment.params')
+    def test_fetch_token_redirect_cached_not_ok(self, params, get_validation_url, get_http_session):
+        """
+        payment.fetch_token drops the cached URL and follows the whole chain when it fails
+        """
+        commerce = self.payment_kwargs['commerce']
+        cache = RedirectCache()
+        cache.set((commerce.id, commerce.testing), 'https://stale/')
+        post = get_http_session.return_value.post
+        post.side_effect = [requests.exceptions.ConnectionError, mock.Mock(status_code=200, is_redirect=False)]
+        decrypted = 'ERROR=0\nTOKEN=e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228\n'
+        commerce.webpay_decrypt.return_value = decrypted, "signature"
+        payment = Payment(**self.payment_kwargs)
+        payment.redirect_cache = cache
+
+        payment.fetch_token()
+
+        self.assertEqual(['https://stale/', get_validation_url.return_value],
+                         [attempt.url for attempt in payment.attempts])
+        self.assertIsNone(cache.get((commerce.id, commerce.testing)))
+
+    def test_get_http_session(self):
+        """
+        payment.get_http_session returns the session given to Payment
+        """
+        self.payment_kwargs['http_session'] = mock.Mock()
+        payment = Payment(**self.payment_kwargs)
+
+        self.assertEqual(self.payment_kwargs['http_session'], payment.get_http_session())
+
+    def test_get_http_session_commerce(self):
+        """
+        payment.get_http_session returns the commerce session when none is given
+        """
+        payment = Payment(**self.payment_kwargs)
+
+        self.assertEqual(self.payment_kwargs['commerce'].http_session, payment.get_http_session())
+
+    @mock.patch('tbk.webpay.payment.get_default_session')
+    def test_get_http_session_default(self, get_default_session):
+        """
+        payment.get_http_session returns the process wide session when commerce has none
+        """
+        self.payment_kwargs['commerce'].http_session = None
+        payment = Payment(**self.payment_kwargs)
+
+        self.assertEqual(get_default_session.return_value, payment.get_http_session())
+
     def test_get_validation_url_production(self):
         """
         payment.get_validation_url on prod. must returns
@@ -399,13 +570,10 @@ class PaymentTest(TestCase):
             payment.params
         verify.assert_called_once_with()
 
-    @mock.patch('tbk.webpay.payment.hashlib')
-    def test_get_raw_params(self, hashlib):
+    def test_get_raw_params(self):
         """
         payment.get_raw_params returns params as seen on raw_params.txt
         """
-        h = hashlib.new.return_value
-        h.hexdigest.return_value = "8455b5720ff48c0efae649a42b6d1aa2"
         commerce = self.payment_kwargs['commerce']
         commerce.id = "1234567890"
         commerce.webpay_key_id = '101'
@@ -417,11 +585,33 @@ class PaymentTest(TestCase):
 
             result = payment.get_raw_params()
 
-            h.hexdigest.assert_called_once_with()
-            h.update.assert_any_call(payment.get_raw_params('&', False))
-            h.update.assert_any_call(str(payment.commerce.id))
-            h.update.assert_any_call("webpay")
-            self.assertEqual(get_raw_params, result)
+            self.assertEqual(get_raw_params.encode('utf-8'), result)
+
+    def test_build_many(self):
+        """
+        RawParamsBuilder.build_many returns raw params of every payment
+        """
+        commerce = self.payment_kwargs['commerce']
+        commerce.id = "1234567890"
+        commerce.webpay_key_id = '101'
+        payments = [Payment(**self.payment_kwargs) for _ in range(3)]
+        for payment in payments:
+            payment._transaction_id = 123456789
+        with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'raw_params.txt'), 'r') as raw_params_file:
+            raw_params = raw_params_file.read().encode('utf-8')
+
+        self.assertEqual([raw_params] * 3, RawParamsBuilder(commerce).build_many(payments))
+
+    def test_confirmation_uri(self):
+        """
+        payment.confirmation_uri is parsed from confirmation_url when it's set
+        """
+        payment = Payment(**self.payment_kwargs)
+        self.assertEqual(8080, payment.confirmation_uri.port)
+
+        payment.confirmation_url = "http://127.0.0.2/confirmation"
+
+        self.assertEqual("127.0.0.2", payment.confirmation_uri.hostname)
 
     def test_get_raw_params_sharp_no_pseudomac(self):
         """
@@ -436,7 +626,7 @@ class PaymentTest(TestCase):
         with open(get_raw_params_file_path, 'r') as get_raw_params_file:
             get_raw_params = get_raw_params_file.read()
             result = payment.get_raw_params(include_pseudomac=False)
-            self.assertEqual(get_raw_params, result)
+            self.assertEqual(get_raw_params.encode('utf-8'), result)
 
     def test_get_raw_params_ampersand_no_pseudomac(self):
         """
@@ -452,7 +642,7 @@ class PaymentTest(TestCase):
         with open(get_raw_params_file_path, 'r') as get_raw_params_file:
             get_raw_params = get_raw_params_file.read()
             result = payment.get_raw_params(splitter="&", include_pseudomac=False)
-            self.assertEqual(get_raw_params, result)
+            self.assertEqual(get_raw_params.encode('utf-8'), result)
 
     def test_get_raw_params_ampersand_no_pseudomac_no_session_id(self):
         """
@@ -469,19 +659,19 @@ class PaymentTest(TestCase):
         with open(get_raw_params_file_path, 'r') as get_raw_params_file:
             get_raw_params = get_raw_params_file.read()
             result = payment.get_raw_params(include_pseudomac=False)
-            self.assertEqual(get_raw_params, result)
+            self.assertEqual(get_raw_params.encode('utf-8'), result)
 
-    @mock.patch('tbk.webpay.payment.random')
-    def test_transaction_id(self, random):
+    @mock.patch('tbk.webpay.payment.entropy')
+    def test_transaction_id(self, entropy):
         """
         payment.get_transaction_id returns a random int between 0 and 10000000000
         """
-        random.randint.return_value = 123456789
+        entropy.randint.return_value = 123456789
         payment = Payment(**self.payment_kwargs)
 
-        self.assertEqual(random.randint.return_value,
+        self.assertEqual(entropy.randint.return_value,
                          payment.transaction_id)
-        random.randint.assert_called_once_with(0, 10000000000 - 1)
+        entropy.randint.assert_called_once_with(0, 10000000000 - 1)
 
     def test_transaction_id_already_created(self):
         """
@@ -563,3 +753,114 @@ class PaymentTest(TestCase):
             PaymentError, "Confirmation URL host MUST be an IP address",
             payment.verify
         )
+
+
+@mock.patch('tbk.webpay.payment.logger')
+@mock.patch('tbk.webpay.payment.Payment.fetch_token')
+class FetchTokensTest(TestCase):
+
+    def create_payments(self, quantity):
+        return [
+            Payment(request_ip='123.123.123.123', commerce=mock.Mock(), success_url='http://localhost/',
+                    confirmation_url='http://127.0.0.1:8080/', amount=1000, order_id=str(i))
+            for i in range(quantity)
+        ]
+
+    def test_fetch_tokens(self, fetch_token, logger):
+        """
+        fetch_tokens yields every payment with its token and logs them
+        """
+        payments = self.create_payments(5)
+        fetch_token.side_effect = lambda: 'token'
+
+        results = dict(fetch_tokens(payments, concurrency=2))
+
+        self.assertEqual(dict((payment, 'token') for payment in payments), results)
+        self.assertEqual(5, logger.payment.call_count)
+
+    def test_fetch_tokens_error(self, fetch_token, logger):
+        """
+        fetch_tokens yields PaymentError of failed payments
+        """
+        payments = self.create_payments(2)
+        error = PaymentError("Payment token generation failed")
+        fetch_token.side_effect = [error, error]
+
+        results = dict(fetch_tokens(payments))
+
+        self.assertEqual({payments[0]: error, payments[1]: error}, results)
+        self.assertFalse(logger.payment.called)
+
+    def test_fetch_tokens_unexpected_error(self, fetch_token, logger):
+        """
+        fetch_tokens raises exceptions other than PaymentError
+        """
+        fetch_token.side_effect = ValueError("unexpected")
+
+        with self.assertRaises(ValueError):
+            list(fetch_tokens(self.create_payments(1)))
+
+    def test_fetch_tokens_payments_error(self, fetch_token, logger):
+        """
+        fetch_tokens raises exceptions of the payments iterable instead of hanging
+        """
+        fetch_token.side_effect = lambda: 'token'
+
+        def payments():
+            for payment in self.create_payments(2):
+                yield payment
+            raise RuntimeError("no more payments")
+
+        with self.assertRaises(RuntimeError):
+            list(fetch_tokens(payments(), concurrency=3))
+
+    def test_fetch_tokens_close(self, fetch_token, logger):
+        """
+        fetch_tokens stops taking payments once the generator is closed
+        """
+        closed = threading.Event()
+        taken = []
+
+        def payments():
+            for payment in self.create_payments(10):
+                taken.append(payment)
+                yield payment
+
+        def token():
+            if len(taken) > 1:
+                closed.wait(5)
+            return 'token'
+        fetch_token.side_effect = token
+
+        results = fetch_tokens(payments(), concurrency=1)
+        next(results)
+        results.close()
+        closed.set()
+        for worker in threading.enumerate():
+            if worker.name == 'tbk-fetch-tokens':
+                worker.join(5)
+
+        self.assertEqual(2, len(taken))
+
+    def test_fetch_tokens_concurrency(self, fetch_token, logger):
+        """
+        fetch_tokens never runs more than concurrency requests at a time
+        """
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def token():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return 'token'
+        fetch_token.side_effect = token
+
+        results = list(fetch_tokens(self.create_payments(12), concurrency=3))
+
+        self.assertEqual(12, len(results))
+        self.assertTrue(1 < peak[0] <= 3)
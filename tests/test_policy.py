@@ -0,0 +1,61 @@
+import time
+from unittest import TestCase
+
+import six
+
+from tbk.webpay.policy import FetchPolicy, hedge
+
+
+class FetchPolicyTest(TestCase):
+
+    def test_get_timeout(self):
+        policy = FetchPolicy(connect_timeout=3, read_timeout=10)
+
+        self.assertEqual((3, 10), policy.get_timeout(20))
+        self.assertEqual((3, 5), policy.get_timeout(5))
+        self.assertEqual((1, 1), policy.get_timeout(1))
+
+    def test_get_backoff(self):
+        policy = FetchPolicy(backoff=0.1)
+
+        for retry in range(4):
+            self.assertTrue(0 <= policy.get_backoff(retry) <= 0.1 * 2 ** retry)
+
+    def test_get_hedge_delay_disabled(self):
+        policy = FetchPolicy()
+
+        self.assertIsNone(policy.get_hedge_delay())
+
+    def test_get_hedge_delay_few_samples(self):
+        policy = FetchPolicy(hedge_percentile=90, hedge_delay=2.0, hedge_min_samples=10)
+        policy.observe(0.1)
+
+        self.assertEqual(2.0, policy.get_hedge_delay())
+
+    def test_get_hedge_delay_percentile(self):
+        policy = FetchPolicy(hedge_percentile=90, hedge_min_samples=10)
+        for i in range(100):
+            policy.observe(i / 100.0)
+
+        self.assertEqual(0.9, policy.get_hedge_delay())
+
+
+class HedgeTest(TestCase):
+
+    def test_fast_call(self):
+        calls = []
+
+        def call(hedged):
+            calls.append(hedged)
+            return 'result'
+
+        self.assertEqual('result', hedge(call, 1))
+        self.assertEqual([False], calls)
+
+    def test_both_fail(self):
+        def call(hedged):
+            if not hedged:
+                time.sleep(0.05)
+            raise ValueError("hedged=%s" % hedged)
+
+        six.assertRaisesRegex(self, ValueError, "hedged=", hedge, call, 0.01)
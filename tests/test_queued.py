@@ -0,0 +1,192 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.logging import BaseHandler
+from tbk.webpay.logging.queued import QueuedHandler
+
+
+class RecordingHandler(BaseHandler):
+
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def event_payment(self, **kwargs):
+        pass
+
+    def event_confirmation(self, **kwargs):
+        pass
+
+    def log_confirmation(self, payload, commerce_id):
+        pass
+
+    def write_records(self, records):
+        self.release.wait()
+        self.batches.append(list(records))
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def records(self):
+        return [record for batch in self.batches for record in batch]
+
+
+class QueuedHandlerTest(TestCase):
+
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.handler.release.set()
+        shutil.rmtree(self.path)
+
+    def test_format_in_caller(self):
+        queued = QueuedHandler(self.handler)
+
+        queued.event_payment(token='TOKEN')
+        queued.log_confirmation(payload='payload', commerce_id='597026007976')
+        queued.close()
+
+        self.assertEqual([
+            ('event_payment', {'token': 'TOKEN'}),
+            ('log_confirmation', {'payload': 'payload', 'commerce_id': '597026007976'}),
+        ], self.handler.records)
+        self.assertEqual(2, queued.written)
+
+    def test_format_called_in_caller_thread(self):
+        self.handler.format = mock.Mock(return_value='record')
+        queued = QueuedHandler(self.handler)
+
+        queued.event_confirmation(order_id='3244')
+        queued.close()
+
+        self.handler.format.assert_called_once_with('event_confirmation', order_id='3244')
+        self.assertEqual(['record'], self.handler.records)
+
+    def test_handler_without_records(self):
+        """
+        handlers without format and write_records get their event methods called
+        """
+        handler = mock.Mock(spec=['event_payment', 'event_confirmation', 'log_confirmation'])
+        queued = QueuedHandler(handler)
+
+        queued.event_payment(token='TOKEN')
+        queued.log_confirmation(payload='payload', commerce_id='597026007976')
+        queued.close()
+
+        handler.event_payment.assert_called_once_with(token='TOKEN')
+        handler.log_confirmation.assert_called_once_with(payload='payload', commerce_id='597026007976')
+        self.assertEqual(2, queued.written)
+
+    def test_close_flushes_and_closes(self):
+        self.handler.release.clear()
+        queued = QueuedHandler(self.handler)
+        for i in range(10):
+            queued.event_payment(i=i)
+
+        self.handler.release.set()
+        queued.close()
+
+        self.assertEqual(10, len(self.handler.records))
+        self.assertTrue(self.handler.closed)
+
+    def test_write_after_close(self):
+        queued = QueuedHandler(self.handler)
+        queued.close()
+
+        queued.event_payment(token='TOKEN')
+
+        self.assertEqual([[('event_payment', {'token': 'TOKEN'})]], self.handler.batches)
+
+    def test_batches(self):
+        self.handler.release.clear()
+        queued = QueuedHandler(self.handler, batch_size=4)
+        queued.event_payment(i=0)
+        for i in range(1, 10):
+            queued.event_payment(i=i)
+
+        self.handler.release.set()
+        queued.flush()
+
+        self.assertEqual(10, len(self.handler.records))
+        self.assertTrue(all(len(batch) <= 4 for batch in self.handler.batches))
+        self.assertLess(len(self.handler.batches), 10)
+        queued.close()
+
+    def test_overflow_drop(self):
+        self.handler.release.clear()
+        queued = QueuedHandler(self.handler, maxsize=2, overflow='drop')
+        for i in range(10):
+            queued.event_payment(i=i)
+
+        self.handler.release.set()
+        queued.close()
+
+        self.assertGreater(queued.dropped, 0)
+        self.assertEqual(10, len(self.handler.records) + queued.dropped)
+
+    def test_overflow_spill(self):
+        spill_path = os.path.join(self.path, 'spill')
+        self.handler.release.clear()
+        queued = QueuedHandler(self.handler, maxsize=2, overflow='spill', spill_path=spill_path)
+        for i in range(10):
+            queued.event_payment(i=i)
+
+        self.handler.release.set()
+        queued.close()
+
+        self.assertGreater(queued.spilled, 0)
+        self.assertEqual(list(range(10)), sorted(record[1]['i'] for record in self.handler.records))
+        self.assertEqual(0, os.path.getsize(spill_path))
+
+    def test_overflow_block(self):
+        self.handler.release.clear()
+        queued = QueuedHandler(self.handler, maxsize=1)
+        queued.event_payment(i=0)
+        queued.event_payment(i=1)
+        thread = threading.Thread(target=queued.event_payment, kwargs={'i': 2})
+        thread.start()
+
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+
+        self.handler.release.set()
+        thread.join()
+        queued.close()
+        self.assertEqual([0, 1, 2], [record[1]['i'] for record in self.handler.records])
+
+    def test_write_error(self):
+        self.handler.write_records = mock.Mock(side_effect=IOError)
+        queued = QueuedHandler(self.handler)
+
+        queued.event_payment(i=0)
+        queued.flush()
+
+        self.assertEqual(1, queued.errors)
+        queued.close()
+
+    def test_invalid_overflow(self):
+        self.assertRaises(ValueError, QueuedHandler, self.handler, overflow='explode')
+        self.assertRaises(ValueError, QueuedHandler, self.handler, overflow='spill')
+
+    def test_after_fork(self):
+        queued = QueuedHandler(self.handler)
+        self.handler.after_fork = mock.Mock()
+        thread = queued._thread
+
+        queued.after_fork()
+        queued.event_payment(i=1)
+        queued.close()
+
+        self.assertIsNot(thread, queued._thread)
+        self.assertEqual([('event_payment', {'i': 1})], self.handler.records)
+        self.handler.after_fork.assert_called_once_with()
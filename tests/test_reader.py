@@ -0,0 +1,200 @@
+import os
+import shutil
+import datetime
+import tempfile
+from unittest import TestCase
+
+from tbk.webpay.clock import clock
+from tbk.webpay.confirmation import ConfirmationPayload
+from tbk.webpay.logging.official import WebpayOfficialHandler
+from tbk.webpay.logging.reader import LogReader, Record, scan, parse_journal_line
+
+# 2015-01-23 15:09:59 at America/Santiago
+TIMESTAMP = 1422036599
+
+PAYMENT_EVENT = {
+    'date': '23012015',
+    'time': '150959',
+    'pid': 12345,
+    'commerce_id': '597026007976',
+    'transaction_id': 2164532727,
+    'request_ip': '123.123.123.123',
+    'token': 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228',
+    'webpay_server': 'https://certificacion.webpay.cl',
+}
+
+CONFIRMATION_EVENT = {
+    'date': '23012015',
+    'time': '151010',
+    'pid': 12346,
+    'commerce_id': '597026007976',
+    'transaction_id': 2164532727,
+    'request_ip': '200.10.14.162',
+    'order_id': '3244',
+}
+
+CONFIRMATION_DATA = {
+    'TBK_CODIGO_AUTORIZACION': '001882',
+    'TBK_FECHA_CONTABLE': '0123',
+    'TBK_FECHA_TRANSACCION': '0123',
+    'TBK_FINAL_NUMERO_TARJETA': '9509',
+    'TBK_HORA_TRANSACCION': '150959',
+    'TBK_ID_SESION': '430c2c85',
+    'TBK_ID_TRANSACCION': '2164532727',
+    'TBK_MONTO': '10000',
+    'TBK_NUMERO_CUOTAS': '0',
+    'TBK_ORDEN_COMPRA': '3244',
+    'TBK_RESPUESTA': '0',
+    'TBK_TIPO_PAGO': 'VD',
+    'TBK_TIPO_TRANSACCION': 'TR_NORMAL',
+    'TBK_VCI': 'TSY',
+    'TBK_MAC': 'signature',
+}
+
+
+class LogsTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        clock.set_backend(time_func=lambda: TIMESTAMP)
+        self.handler = WebpayOfficialHandler(self.path)
+        self.handler.event_payment(**PAYMENT_EVENT)
+        self.handler.event_confirmation(**CONFIRMATION_EVENT)
+        self.handler.log_confirmation(payload=ConfirmationPayload(CONFIRMATION_DATA), commerce_id='597026007976')
+        self.events_path = os.path.join(self.path, 'TBK_EVN20150123.log')
+        self.journal_path = os.path.join(self.path, 'tbk_bitacora_TR_NORMAL_0123.log')
+
+    def tearDown(self):
+        self.handler.close()
+        clock.set_backend()
+        shutil.rmtree(self.path)
+
+
+class ScanTest(LogsTestCase):
+
+    def test_scan_events(self):
+        entries = list(scan(self.events_path))
+
+        self.assertEqual(['payment', 'confirmation'], [entry[0] for entry in entries])
+        payment, confirmation = entries[0][3], entries[1][3]
+        self.assertEqual({
+            'pid': '12345',
+            'date': '23012015',
+            'time': '150959',
+            'request_ip': '123.123.123.123',
+            'transaction_id': '2164532727',
+            'commerce_id': '597026007976',
+            'webpay_server': 'https://certificacion.webpay.cl',
+            'token': PAYMENT_EVENT['token'],
+        }, payment)
+        self.assertEqual({
+            'pid': '12346',
+            'date': '23012015',
+            'time': '151010',
+            'request_ip': '200.10.14.162',
+            'order_id': '3244',
+            'transaction_id': '2164532727',
+            'commerce_id': '597026007976',
+        }, confirmation)
+        self.assertEqual(0, entries[0][1])
+        self.assertEqual(entries[0][2], entries[1][1])
+        self.assertEqual(os.path.getsize(self.events_path), entries[1][1] + entries[1][2])
+
+    def test_scan_journal(self):
+        entries = list(scan(self.journal_path))
+
+        self.assertEqual(1, len(entries))
+        kind, offset, length, data = entries[0]
+        self.assertEqual('journal', kind)
+        self.assertEqual('ACK', data.pop('status'))
+        self.assertEqual(dict(CONFIRMATION_DATA, commerce_id='597026007976'), dict(
+            data, commerce_id=data.pop('TBK_CODIGO_COMERCIO')))
+
+    def test_scan_skips_partial_block(self):
+        with open(self.events_path, 'ab') as events:
+            events.write(b'          ;       12345;   ;Filtro    ;Inicio                                  ;'
+                         b'23012015      ;150959;123.123.123.123;OK ;                    ;Inicio de filtrado\n')
+
+        self.assertEqual(2, len(list(scan(self.events_path))))
+
+    def test_scan_from_offset(self):
+        first = next(scan(self.events_path))
+
+        entries = list(scan(self.events_path, first[1] + first[2]))
+
+        self.assertEqual(['confirmation'], [entry[0] for entry in entries])
+
+    def test_parse_journal_line(self):
+        self.assertEqual({'status': 'ACK', 'TBK_MONTO': '100'}, parse_journal_line('ACK; TBK_MONTO=100\n'))
+        self.assertIsNone(parse_journal_line('garbage; line\n'))
+        self.assertIsNone(parse_journal_line('\n'))
+
+
+class LogReaderTest(LogsTestCase):
+
+    def setUp(self):
+        super(LogReaderTest, self).setUp()
+        self.reader = LogReader(self.path)
+
+    def tearDown(self):
+        self.reader.close()
+        super(LogReaderTest, self).tearDown()
+
+    def test_find(self):
+        self.assertEqual(3, self.reader.update())
+
+        records = self.reader.find(transaction_id=2164532727)
+
+        self.assertEqual([
+            ('TBK_EVN20150123.log', 'payment'),
+            ('TBK_EVN20150123.log', 'confirmation'),
+            ('tbk_bitacora_TR_NORMAL_0123.log', 'journal'),
+        ], [(record.file_name, record.kind) for record in records])
+        self.assertIsInstance(records[0], Record)
+        self.assertEqual(PAYMENT_EVENT['token'], records[0].data['token'])
+
+    def test_find_order_id(self):
+        self.reader.update()
+
+        self.assertEqual(['confirmation', 'journal'], [record.kind for record in self.reader.find(order_id='3244')])
+        self.assertEqual([], self.reader.find(order_id='404'))
+
+    def test_find_date(self):
+        self.reader.update()
+
+        self.assertEqual(3, len(self.reader.find(date=datetime.date(2015, 1, 23))))
+        self.assertEqual(0, len(self.reader.find(date=datetime.date(2015, 1, 24))))
+        self.assertEqual(['journal'], [
+            record.kind for record in self.reader.find(date=datetime.date(2015, 1, 23), kind='journal')])
+
+    def test_update_incremental(self):
+        self.reader.update()
+        self.assertEqual(0, self.reader.update())
+
+        self.handler.event_payment(**dict(PAYMENT_EVENT, transaction_id=1))
+
+        self.assertEqual(1, self.reader.update())
+        self.assertEqual(1, len(self.reader.find(transaction_id=1)))
+        self.assertEqual(4, len(self.reader.find()))
+
+    def test_update_truncated(self):
+        self.reader.update()
+        self.handler.close()
+        open(self.events_path, 'w').close()
+        self.handler.event_payment(**dict(PAYMENT_EVENT, transaction_id=1))
+
+        self.assertEqual(1, self.reader.update())
+        self.assertEqual(['journal'], [record.kind for record in self.reader.find(transaction_id=2164532727)])
+
+    def test_index_persisted(self):
+        self.reader.update()
+        self.reader.close()
+
+        self.reader = LogReader(self.path)
+
+        self.assertEqual(0, self.reader.update())
+        self.assertEqual(3, len(self.reader.find(transaction_id=2164532727)))
+
+    def test_records(self):
+        self.assertEqual(['payment', 'confirmation'], [
+            record.kind for record in self.reader.records('TBK_EVN20150123.log')])
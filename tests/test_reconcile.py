@@ -0,0 +1,123 @@
+import os
+import shutil
+import decimal
+import tempfile
+from unittest import TestCase
+
+from tbk.webpay.logging.official import log_confirmation_format
+from tbk.webpay.logging.reconcile import Reconciliation, JournalEntry, reconcile, split_ranges, scan_range
+
+JOURNAL_DATA = {
+    'commerce_id': '597026007976',
+    'TBK_CODIGO_AUTORIZACION': '001882',
+    'TBK_FECHA_CONTABLE': '0123',
+    'TBK_FECHA_TRANSACCION': '0123',
+    'TBK_FINAL_NUMERO_TARJETA': '9509',
+    'TBK_HORA_TRANSACCION': '150959',
+    'TBK_ID_SESION': '430c2c85',
+    'TBK_ID_TRANSACCION': '2164532727',
+    'TBK_MONTO': '1000000',
+    'TBK_NUMERO_CUOTAS': '0',
+    'TBK_ORDEN_COMPRA': '3244',
+    'TBK_RESPUESTA': '0',
+    'TBK_TIPO_PAGO': 'VD',
+    'TBK_TIPO_TRANSACCION': 'TR_NORMAL',
+    'TBK_VCI': 'TSY',
+    'TBK_MAC': 'signature',
+}
+
+
+def journal_line(order_id, amount, response='0'):
+    return log_confirmation_format(**dict(
+        JOURNAL_DATA, TBK_ORDEN_COMPRA=order_id, TBK_MONTO=str(amount * 100), TBK_RESPUESTA=response))
+
+
+class ReconciliationTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_journal(self, file_name, lines):
+        file_path = os.path.join(self.path, file_name)
+        with open(file_path, 'w') as journal:
+            journal.write(''.join(lines))
+        return file_path
+
+    def test_split_ranges(self):
+        file_path = self.write_journal('tbk_bitacora_TR_NORMAL_0123.log', [
+            journal_line(str(order_id), 1000) for order_id in range(10)])
+        size = os.path.getsize(file_path)
+
+        ranges = split_ranges(file_path, chunk_size=size // 3)
+
+        self.assertGreater(len(ranges), 1)
+        self.assertEqual(0, ranges[0][1])
+        self.assertEqual(size, ranges[-1][2])
+        for (_, _, end), (_, start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+        self.assertEqual(10, sum(len(scan_range(file_range)) for file_range in ranges))
+
+    def test_split_ranges_empty(self):
+        self.assertEqual([], split_ranges(self.write_journal('tbk_bitacora_TR_NORMAL_0123.log', [])))
+
+    def test_scan_range(self):
+        file_path = self.write_journal('tbk_bitacora_TR_NORMAL_0123.log', [
+            journal_line('1', 1000), 'garbage\n', journal_line('2', 2500, '-1')])
+
+        orders = scan_range((file_path, 0, os.path.getsize(file_path)))
+
+        self.assertEqual(
+            [JournalEntry('1', '2164532727', decimal.Decimal(1000), '0', 'tbk_bitacora_TR_NORMAL_0123.log', 0)],
+            orders['1'])
+        self.assertEqual('-1', orders['2'][0].response)
+
+    def test_run(self):
+        self.write_journal('tbk_bitacora_TR_NORMAL_0122.log', [
+            journal_line('1', 1000),
+            journal_line('2', 2000),
+            journal_line('3', 3000, '-1'),
+            journal_line('4', 4000, '-1'),
+        ])
+        self.write_journal('tbk_bitacora_TR_NORMAL_0123.log', [
+            journal_line('2', 2000),
+            journal_line('4', 4000),
+            journal_line('5', 9999),
+            journal_line('7', 7000),
+        ])
+        expected = iter([('1', 1000), (2, 2000), ('3', 3000), ('4', 4000), ('5', 5000), ('6', '6000.00')])
+
+        report = Reconciliation(self.path, processes=1).run(expected)
+
+        self.assertEqual(2, report.matched)
+        self.assertEqual([('6', '6000.00')], report.missing)
+        self.assertEqual(['2'], [order_id for order_id, _ in report.duplicates])
+        self.assertEqual(2, len(report.duplicates[0][1]))
+        self.assertEqual([('5', 5000)], [(order_id, amount) for order_id, amount, _ in report.amount_mismatches])
+        self.assertEqual(decimal.Decimal(9999), report.amount_mismatches[0][2].amount)
+        self.assertEqual(['3'], [order_id for order_id, _ in report.rejected])
+        self.assertEqual(['7'], [order_id for order_id, _ in report.unexpected])
+        self.assertFalse(report.is_clean)
+        self.assertEqual({
+            'matched': 2, 'missing': 1, 'duplicates': 1, 'amount_mismatches': 1, 'rejected': 1, 'unexpected': 1,
+        }, report.summary())
+
+    def test_parallel(self):
+        file_path = self.write_journal('tbk_bitacora_TR_NORMAL_0123.log', [
+            journal_line(str(order_id), 1000 + order_id) for order_id in range(200)])
+        reconciliation = Reconciliation([file_path], processes=2, chunk_size=os.path.getsize(file_path) // 8)
+
+        report = reconciliation.run((str(order_id), 1000 + order_id) for order_id in range(200))
+
+        self.assertGreater(len(reconciliation.ranges()), 2)
+        self.assertEqual(200, report.matched)
+        self.assertTrue(report.is_clean)
+
+    def test_reconcile(self):
+        file_path = self.write_journal('journal.log', [journal_line('1', 1000)])
+
+        report = reconcile([('1', decimal.Decimal('1000.00'))], [file_path], processes=1)
+
+        self.assertEqual(1, report.matched)
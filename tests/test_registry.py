@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.commerce import Commerce
+from tbk.webpay.registry import CommerceRegistry
+
+COMMERCE_KEY = Commerce.TEST_COMMERCE_KEY
+
+
+class CommerceRegistryTest(TestCase):
+
+    def test_get(self):
+        registry = CommerceRegistry({'597026007976': COMMERCE_KEY})
+
+        commerce = registry.get('597026007976')
+
+        self.assertIsInstance(commerce, Commerce)
+        self.assertEqual('597026007976', commerce.id)
+        self.assertEqual(COMMERCE_KEY, commerce.key)
+        self.assertFalse(commerce.testing)
+        self.assertIs(commerce, registry[597026007976])
+        self.assertEqual(1, registry.hits)
+        self.assertEqual(1, registry.misses)
+
+    def test_get_unknown(self):
+        registry = CommerceRegistry()
+
+        self.assertRaises(KeyError, registry.get, '597026007976')
+        self.assertNotIn('597026007976', registry)
+
+    def test_testing(self):
+        registry = CommerceRegistry({'597026007976': COMMERCE_KEY}, testing=True)
+
+        self.assertTrue(registry.get('597026007976').testing)
+
+    def test_keeps_parsed_keys(self):
+        registry = CommerceRegistry({'597026007976': COMMERCE_KEY})
+        commerce_key = registry.get('597026007976').get_commerce_key()
+
+        self.assertIs(commerce_key, registry.get('597026007976').get_commerce_key())
+
+    def test_lru(self):
+        registry = CommerceRegistry(dict((str(i), COMMERCE_KEY) for i in range(3)), size=2)
+        first = registry.get('0')
+        registry.get('1')
+        registry.get('0')
+
+        registry.get('2')
+
+        self.assertIs(first, registry.get('0'))
+        self.assertEqual(['2', '0'], list(registry.commerces))
+        self.assertEqual(1, registry.evictions)
+        self.assertEqual({'registered': 3, 'cached': 2, 'hits': 2, 'misses': 3, 'evictions': 1}, registry.stats())
+
+    def test_register_replaces(self):
+        registry = CommerceRegistry({'597026007976': COMMERCE_KEY.replace('A', 'B')})
+        old = registry.get('597026007976')
+
+        registry.register('597026007976', COMMERCE_KEY)
+
+        self.assertIsNot(old, registry.get('597026007976'))
+        self.assertEqual(COMMERCE_KEY, registry.get('597026007976').key)
+
+    def test_clear(self):
+        registry = CommerceRegistry({'597026007976': COMMERCE_KEY})
+        commerce = registry.get('597026007976')
+
+        registry.clear()
+
+        self.assertIsNot(commerce, registry.get('597026007976'))
+        self.assertEqual(1, len(registry))
+
+    def test_factory(self):
+        factory = mock.Mock()
+        registry = CommerceRegistry({'597026007976': COMMERCE_KEY}, factory=factory)
+
+        self.assertEqual(factory.return_value, registry.get('597026007976'))
+        factory.assert_called_once_with(id='597026007976', key=COMMERCE_KEY, testing=False)
+
+    def test_from_directory(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with open(os.path.join(path, '597026007976.pem'), 'w') as key_file:
+            key_file.write(COMMERCE_KEY)
+        open(os.path.join(path, 'README'), 'w').close()
+
+        registry = CommerceRegistry.from_directory(path, size=10)
+
+        self.assertEqual(1, len(registry))
+        self.assertEqual(10, registry.size)
+        self.assertEqual(COMMERCE_KEY, registry.get('597026007976').key)
+
+    def test_concurrent_get(self):
+        registry = CommerceRegistry(dict((str(i), COMMERCE_KEY) for i in range(10)), size=5)
+        errors = []
+
+        def lookup():
+            try:
+                for i in range(200):
+                    commerce = registry.get(str(i % 10))
+                    assert commerce.id == str(i % 10)
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(5, len(registry.commerces))
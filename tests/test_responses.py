@@ -0,0 +1,91 @@
+import time
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.responses import ResponsePool
+
+
+class ResponsePoolTest(TestCase):
+
+    def setUp(self):
+        self.commerce = mock.Mock()
+        self.commerce.webpay_encrypt.side_effect = lambda message: "encrypted %s" % message
+
+    def test_fill(self):
+        pool = ResponsePool(self.commerce, size=3)
+
+        pool.fill()
+
+        self.assertEqual(3, pool.depth('ACK'))
+        self.assertEqual(3, pool.depth('ERR'))
+        self.assertEqual(6, self.commerce.webpay_encrypt.call_count)
+        self.assertEqual(6, pool.generated)
+
+    def test_pop(self):
+        pool = ResponsePool(self.commerce, size=2)
+        pool.fill()
+        self.commerce.webpay_encrypt.reset_mock()
+
+        self.assertEqual("encrypted ACK", pool.pop('ACK'))
+        self.assertEqual(1, pool.depth('ACK'))
+        self.assertEqual(1, pool.hits)
+        self.assertFalse(self.commerce.webpay_encrypt.called)
+
+    def test_pop_empty(self):
+        """
+        pop encrypts synchronously when the pool is empty
+        """
+        pool = ResponsePool(self.commerce, size=2)
+
+        self.assertEqual("encrypted ERR", pool.pop('ERR'))
+        self.commerce.webpay_encrypt.assert_called_once_with('ERR')
+        self.assertEqual(1, pool.misses)
+
+    def test_pop_unknown_message(self):
+        pool = ResponsePool(self.commerce, size=2, messages=('ACK',))
+
+        self.assertEqual("encrypted ERR", pool.pop('ERR'))
+
+    def test_clear(self):
+        pool = ResponsePool(self.commerce, size=2)
+        pool.fill()
+
+        pool.clear()
+
+        self.assertEqual(0, pool.depth('ACK'))
+        self.assertEqual(0, pool.depth('ERR'))
+
+    def test_pop_discards_stale(self):
+        """
+        responses encrypted before a key rotation are discarded, even when pooled after clear
+        """
+        self.commerce.key_version = 1
+        pool = ResponsePool(self.commerce, size=2)
+        pool.fill()
+        self.commerce.key_version = 2
+        self.commerce.webpay_encrypt.side_effect = lambda message: "rotated %s" % message
+
+        self.assertEqual("rotated ACK", pool.pop('ACK'))
+        self.assertEqual(0, pool.depth('ACK'))
+        self.assertEqual(2, pool.stale)
+        self.assertEqual(1, pool.misses)
+        pool.fill()
+        self.assertEqual("rotated ACK", pool.pop('ACK'))
+        self.assertEqual(1, pool.hits)
+
+    def test_background_refill(self):
+        pool = ResponsePool(self.commerce, size=2)
+        pool.start()
+        try:
+            pool.pop('ACK')
+            deadline = time.time() + 5
+            while pool.stats()['depth'] != {'ACK': 2, 'ERR': 2} and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            pool.stop()
+
+        stats = pool.stats()
+        self.assertEqual(2, stats['size'])
+        self.assertEqual({'ACK': 2, 'ERR': 2}, stats['depth'])
+        self.assertTrue(stats['generated'] >= 4)
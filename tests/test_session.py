@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+import mock
+
+import requests
+
+from tbk.webpay import session
+
+
+class SessionTest(TestCase):
+
+    def tearDown(self):
+        session.set_default_session(None)
+
+    def test_create_session(self):
+        http_session = session.create_session(pool_size=4)
+
+        adapter = http_session.get_adapter('https://webpay.transbank.cl')
+        self.assertIsInstance(http_session, requests.Session)
+        self.assertEqual(4, adapter._pool_maxsize)
+        self.assertEqual(4, adapter._pool_connections)
+
+    def test_get_default_session(self):
+        default_session = session.get_default_session()
+
+        self.assertIsInstance(default_session, requests.Session)
+        self.assertIs(default_session, session.get_default_session())
+
+    def test_set_default_session(self):
+        http_session = session.create_session()
+
+        session.set_default_session(http_session)
+
+        self.assertIs(http_session, session.get_default_session())
+
+
+class RedirectCacheTest(TestCase):
+
+    def test_get_missing(self):
+        self.assertIsNone(session.RedirectCache().get('key'))
+
+    def test_set(self):
+        cache = session.RedirectCache()
+
+        cache.set('key', 'https://final/')
+
+        self.assertEqual('https://final/', cache.get('key'))
+
+    @mock.patch('tbk.webpay.session.timeit.default_timer')
+    def test_get_expired(self, default_timer):
+        cache = session.RedirectCache(ttl=10)
+        default_timer.return_value = 100
+        cache.set('key', 'https://final/')
+
+        default_timer.return_value = 111
+
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual({}, cache.entries)
+
+    def test_drop(self):
+        cache = session.RedirectCache()
+        cache.set('key', 'https://final/')
+
+        cache.drop('key')
+
+        self.assertIsNone(cache.get('key'))
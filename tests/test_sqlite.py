@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import datetime
+import tempfile
+import subprocess
+from unittest import TestCase
+
+import mock
+
+from tbk.webpay.clock import clock
+from tbk.webpay.confirmation import ConfirmationPayload
+from tbk.webpay.logging.sqlite import SQLiteHandler
+
+# 2015-01-23 15:09:59 at America/Santiago
+TIMESTAMP = 1422036599
+
+PAYMENT_EVENT = {
+    'date': '23012015',
+    'time': '150959',
+    'pid': 12345,
+    'commerce_id': '597026007976',
+    'transaction_id': 2164532727,
+    'request_ip': '123.123.123.123',
+    'token': 'e975ffc4f0605ddf3afc299eee6aeffb59efba24769548acf58e34a89ae4e228',
+    'webpay_server': 'https://certificacion.webpay.cl',
+}
+
+CONFIRMATION_EVENT = {
+    'date': '23012015',
+    'time': '151010',
+    'pid': 12346,
+    'commerce_id': '597026007976',
+    'transaction_id': 2164532727,
+    'request_ip': '200.10.14.162',
+    'order_id': '3244',
+}
+
+CONFIRMATION_DATA = {
+    'TBK_CODIGO_AUTORIZACION': '001882',
+    'TBK_FECHA_CONTABLE': '0123',
+    'TBK_FECHA_TRANSACCION': '0123',
+    'TBK_FINAL_NUMERO_TARJETA': '9509',
+    'TBK_HORA_TRANSACCION': '150959',
+    'TBK_ID_SESION': '430c2c85',
+    'TBK_ID_TRANSACCION': '2164532727',
+    'TBK_MONTO': '1000000',
+    'TBK_NUMERO_CUOTAS': '0',
+    'TBK_ORDEN_COMPRA': '3244',
+    'TBK_RESPUESTA': '0',
+    'TBK_TIPO_PAGO': 'VD',
+    'TBK_TIPO_TRANSACCION': 'TR_NORMAL',
+    'TBK_VCI': 'TSY',
+    'TBK_MAC': 'signature',
+}
+
+
+class SQLiteHandlerTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.database = os.path.join(self.path, 'webpay.sqlite3')
+        clock.set_backend(time_func=lambda: TIMESTAMP)
+        self.handler = SQLiteHandler(self.database, batch_size=3, interval=60)
+
+    def tearDown(self):
+        self.handler.close()
+        clock.set_backend()
+        shutil.rmtree(self.path)
+
+    def log_transaction(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+        self.handler.event_confirmation(**CONFIRMATION_EVENT)
+        self.handler.log_confirmation(payload=ConfirmationPayload(CONFIRMATION_DATA), commerce_id='597026007976')
+        self.wait_inserted(3)
+
+    def wait_inserted(self, inserted):
+        deadline = time.time() + 5
+        while self.handler.inserted + self.handler.errors < inserted and time.time() < deadline:
+            time.sleep(0.001)
+
+    def test_wal(self):
+        self.assertEqual('wal', self.handler.connection.execute('PRAGMA journal_mode').fetchone()[0])
+
+    def test_batch_size(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+        self.handler.event_confirmation(**CONFIRMATION_EVENT)
+
+        self.assertEqual(0, self.handler.inserted)
+        self.assertEqual([], self.handler.find_events())
+
+        self.handler.log_confirmation(payload=ConfirmationPayload(CONFIRMATION_DATA), commerce_id='597026007976')
+        self.wait_inserted(3)
+
+        self.assertEqual(3, self.handler.inserted)
+        self.assertEqual(1, self.handler.transactions)
+
+    def test_batch_inserted_in_background(self):
+        connection = self.handler.connection
+        self.handler.connection = mock.MagicMock()
+        self.handler.connection.__exit__.return_value = False
+        self.handler.connection.executemany.side_effect = sqlite3.OperationalError('database is locked')
+
+        self.log_transaction()
+
+        self.assertEqual(3, self.handler.errors)
+        self.assertEqual(0, self.handler.inserted)
+        self.handler.connection = connection
+
+    def test_interval(self):
+        self.handler.close()
+        self.handler = SQLiteHandler(self.database, batch_size=100, interval=0.01)
+        self.handler.event_payment(**PAYMENT_EVENT)
+
+        self.handler._stopped.wait(0.5)
+
+        self.assertEqual(1, self.handler.inserted)
+
+    def test_find_events(self):
+        self.log_transaction()
+
+        events = self.handler.find_events(transaction_id=2164532727)
+
+        self.assertEqual(['payment', 'confirmation'], [event['kind'] for event in events])
+        self.assertEqual('20150123', events[0]['date'])
+        self.assertEqual(PAYMENT_EVENT['token'], events[0]['token'])
+        self.assertEqual('3244', events[1]['order_id'])
+        self.assertEqual(1, len(self.handler.find_events(order_id='3244')))
+        self.assertEqual(2, len(self.handler.find_events(date=datetime.date(2015, 1, 23))))
+        self.assertEqual([], self.handler.find_events(date=datetime.date(2015, 1, 24)))
+
+    def test_find_journal(self):
+        self.log_transaction()
+
+        journal = self.handler.find_journal(order_id='3244')
+
+        self.assertEqual(1, len(journal))
+        self.assertEqual('20150123', journal[0]['date'])
+        self.assertEqual('597026007976', journal[0]['commerce_id'])
+        self.assertEqual('1000000', journal[0]['amount'])
+        self.assertEqual('0', journal[0]['response'])
+        self.assertEqual(journal, self.handler.find_journal(transaction_id='2164532727'))
+
+    def test_close_flushes(self):
+        self.handler.event_payment(**PAYMENT_EVENT)
+        self.handler.close()
+
+        self.handler = SQLiteHandler(self.database)
+
+        self.assertEqual(1, len(self.handler.find_events()))
+
+    def test_exit_flushes(self):
+        """
+        events still pending when the interpreter exits are inserted by the atexit hook
+        """
+        self.handler.close()
+        subprocess.check_call([sys.executable, '-c', (
+            "import sys\n"
+            "from tbk.webpay.logging.sqlite import SQLiteHandler\n"
+            "SQLiteHandler(sys.argv[1], interval=60).event_payment(date='23012015', time='150959', pid=1,\n"
+            "    commerce_id='597026007976', transaction_id=1, request_ip='123.123.123.123')\n"
+        ), self.database], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+        self.handler = SQLiteHandler(self.database)
+
+        self.assertEqual(1, len(self.handler.find_events()))
+
+    def test_after_fork(self):
+        connection = self.handler.connection
+
+        self.handler.after_fork()
+        self.assertIsNone(self.handler.connection)
+        self.log_transaction()
+
+        self.assertIsNot(connection, self.handler.connection)
+        self.assertEqual(1, len(self.handler.find_journal(order_id='3244')))